@@ -0,0 +1,146 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from embedding_cache import normalize_query
+
+# ----------------------------
+# CHAT ANSWER CACHE
+# ----------------------------
+# Exact tier: sha1 of (normalized question, ordered retrieved chunk ids,
+# model, temperature, max_tokens, scope). Identical question + identical
+# context means the Grok call can be skipped.
+#
+# Near-duplicate tier (opt-in, ANSWER_CACHE_NEAR_DUP=1): if a new
+# question's embedding has cosine similarity >= ANSWER_CACHE_SIM with a
+# cached question generated under the same model/temperature/max_tokens/
+# scope, AND retrieval for it found (nearly) the same chunks - Jaccard
+# overlap of the chunk ids >= ANSWER_CACHE_MIN_OVERLAP - that answer is
+# reused. Query embeddings alone cluster too tightly: questions about a
+# different drug, dose or stage can pass the cosine bar.
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_SIM = float(os.getenv("ANSWER_CACHE_SIM", "0.95"))
+ANSWER_CACHE_MIN_OVERLAP = float(os.getenv("ANSWER_CACHE_MIN_OVERLAP", "0.8"))
+ANSWER_CACHE_NEAR_DUP = os.getenv("ANSWER_CACHE_NEAR_DUP", "0") == "1"
+
+
+def _params_key(model, temperature, max_tokens, scope=None):
+    return f"{model}|{temperature}|{max_tokens}|{scope or ''}"
+
+
+def chunk_overlap(a, b):
+    """Jaccard overlap of two chunk id collections"""
+    a, b = set(a), set(b)
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def answer_key(question, chunk_ids, model, temperature, max_tokens, scope=None):
+    raw = "\x00".join([
+        normalize_query(question),
+        ",".join(str(c) for c in chunk_ids),
+        _params_key(model, temperature, max_tokens, scope),
+    ])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class AnswerCache:
+
+    def __init__(self, max_size=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL,
+                 sim_threshold=ANSWER_CACHE_SIM, near_dup=ANSWER_CACHE_NEAR_DUP,
+                 min_overlap=ANSWER_CACHE_MIN_OVERLAP):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.sim_threshold = sim_threshold
+        self.min_overlap = min_overlap
+        self.near_dup = near_dup
+        self._entries = OrderedDict()  # key -> entry dict
+        self._lock = threading.Lock()
+        self._matrix = None            # (keys, stacked unit vectors) for near-dup lookups
+        self.stats = {"hits": 0, "near_hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+    def get(self, key, vector=None, model=None, temperature=None, max_tokens=None, scope=None,
+            chunk_ids=None):
+        """Exact lookup, then near-duplicate lookup if a query vector and chunk ids are given"""
+        now = time.time()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry["value"]
+
+            if self.near_dup and vector is not None and chunk_ids is not None and self._entries:
+                params = _params_key(model, temperature, max_tokens, scope)
+                near = self._nearest(self._unit(vector), params, chunk_ids, now)
+                if near is not None:
+                    self._entries.move_to_end(near)
+                    self.stats["near_hits"] += 1
+                    return self._entries[near]["value"]
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, key, value, vector=None, model=None, temperature=None, max_tokens=None, scope=None,
+            chunk_ids=None):
+        with self._lock:
+            self._entries[key] = {
+                "value": value,
+                "stored_at": time.time(),
+                "params": _params_key(model, temperature, max_tokens, scope),
+                "vector": self._unit(vector) if vector is not None else None,
+                "chunk_ids": frozenset(chunk_ids) if chunk_ids is not None else None,
+            }
+            self._entries.move_to_end(key)
+            self.stats["stores"] += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+            self._matrix = None
+
+    def _live(self, key, now):
+        entry = self._entries.get(key)
+        if entry is not None and now - entry["stored_at"] > self.ttl:
+            del self._entries[key]
+            self._matrix = None
+            return None
+        return entry
+
+    @staticmethod
+    def _unit(vector):
+        v = np.asarray(vector, dtype=np.float32)
+        n = np.linalg.norm(v)
+        return v / n if n else v
+
+    def _nearest(self, q, params, chunk_ids, now):
+        if self._matrix is None:
+            keys = [k for k, e in self._entries.items() if e["vector"] is not None]
+            if not keys:
+                return None
+            self._matrix = (keys, np.stack([self._entries[k]["vector"] for k in keys]))
+
+        keys, matrix = self._matrix
+        sims = matrix @ q
+        for i in np.argsort(-sims):
+            if sims[i] < self.sim_threshold:
+                return None
+            entry = self._live(keys[i], now)
+            if entry is not None and entry["params"] == params and entry["chunk_ids"] is not None \
+                    and chunk_overlap(entry["chunk_ids"], chunk_ids) >= self.min_overlap:
+                return keys[i]
+            if entry is None:
+                return None  # matrix went stale; rebuilt on next lookup
+        return None
+
+    def info(self):
+        lookups = self.stats["hits"] + self.stats["near_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "sim_threshold": self.sim_threshold if self.near_dup else None,
+            "min_overlap": self.min_overlap if self.near_dup else None,
+            "hit_rate": round((lookups - self.stats["misses"]) / lookups, 3) if lookups else 0.0,
+        }
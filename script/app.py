@@ -2,6 +2,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from routes import chat_routes, lesson_routes, exam_routes, book_routes, book_routes  # book_routes add பண்ணுங்க
 from dotenv import load_dotenv
+import llm_client
+import pregenerate
+from artifact_store import get_store
 
 load_dotenv()
 
@@ -24,6 +27,21 @@ app.include_router(lesson_routes.router, prefix="/api/lesson", tags=["Lesson Pla
 app.include_router(exam_routes.router, prefix="/api/exam", tags=["Exams"])
 app.include_router(book_routes.router, prefix="/api/books", tags=["Books"])  # புதிய router add பண்ணுங்க
 
+_pregen_task = None
+
+@app.on_event("startup")
+async def startup():
+    # PREGENERATE=1: fill the lesson / question store for every chapter in the background
+    global _pregen_task
+    _pregen_task = pregenerate.start_background()
+
+@app.on_event("shutdown")
+async def shutdown():
+    if _pregen_task is not None:
+        _pregen_task.cancel()
+    # release pooled LLM connections
+    await llm_client.close_client()
+
 @app.get("/")
 async def root():
     return {
@@ -37,6 +55,15 @@ async def root():
         }
     }
 
+@app.get("/artifacts")
+async def artifacts():
+    """Lesson / question store contents and pre-generation progress"""
+    store = get_store()
+    return {
+        "store": store.info() if store is not None else None,
+        "pregeneration": pregenerate.progress
+    }
+
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
@@ -0,0 +1,165 @@
+import os
+import json
+import time
+import random
+import sqlite3
+import hashlib
+import threading
+from embedding_cache import normalize_query
+from local_vectors import source_signature
+
+# =========================================================
+# LESSON / EXAM ARTIFACT STORE
+# =========================================================
+# Generated lesson plans and exam questions, persisted in one SQLite file
+# (data/index/artifacts.sqlite) so the same topic is generated once:
+#
+#   lessons    key -> lesson plan text
+#   questions  pool key -> one row per distinct MCQ (the question pool)
+#
+# Keys are sha1 of (kind, normalized topic, book / chapter scope, model,
+# corpus version). The corpus version is the chunk files' signature, so
+# re-ingesting a book starts new pools instead of serving questions about
+# text that is gone; prune() deletes the rows of older versions.
+#
+# An exam is a random sample of its pool, renumbered and given the
+# request's marks; only the questions the pool is short of go to the LLM.
+#
+#   ARTIFACT_STORE=0        disable (always generate)
+#   ARTIFACT_STORE_PATH     SQLite file
+#   EXAM_POOL_SIZE          questions pre-generated per chapter
+#   EXAM_POOL_MAX           pools stop growing past this many questions
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "1") == "1"
+ARTIFACT_STORE_PATH = os.getenv(
+    "ARTIFACT_STORE_PATH", os.path.join(BASE_DIR, "data", "index", "artifacts.sqlite")
+)
+EXAM_POOL_SIZE = int(os.getenv("EXAM_POOL_SIZE", "30"))
+EXAM_POOL_MAX = int(os.getenv("EXAM_POOL_MAX", "200"))
+STORE_VERSION = 1   # bump when a prompt or the stored question format changes
+CORPUS_CHECK_INTERVAL = 2.0   # seconds between chunk file stat checks
+
+_corpus = {"version": None, "checked_at": 0.0}
+
+
+def corpus_version():
+    """Short hash of the chunk files' (name, size, mtime), re-checked every few seconds"""
+    now = time.monotonic()
+    if _corpus["version"] is None or now - _corpus["checked_at"] > CORPUS_CHECK_INTERVAL:
+        raw = json.dumps([STORE_VERSION, source_signature()])
+        _corpus["version"] = hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+        _corpus["checked_at"] = now
+    return _corpus["version"]
+
+
+def artifact_key(kind, topic, model, book=None, chapter_id=None):
+    raw = "\x00".join([kind, normalize_query(topic), book or "", chapter_id or "",
+                       model, corpus_version()])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class ArtifactStore:
+
+    def __init__(self, path=ARTIFACT_STORE_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(
+            "CREATE TABLE IF NOT EXISTS lessons ("
+            " key TEXT PRIMARY KEY, topic TEXT, corpus TEXT, stored_at REAL, content TEXT);"
+            "CREATE TABLE IF NOT EXISTS questions ("
+            " pool TEXT, qkey TEXT, topic TEXT, corpus TEXT, stored_at REAL, data TEXT,"
+            " PRIMARY KEY (pool, qkey));"
+        )
+        self._db.commit()
+        self.stats = {"lesson_hits": 0, "lesson_misses": 0, "exam_hits": 0,
+                      "exam_partial": 0, "exam_misses": 0, "stored_questions": 0}
+
+    # ---------------- lessons ----------------
+    def get_lesson(self, key):
+        with self._lock:
+            row = self._db.execute("SELECT content FROM lessons WHERE key = ?", (key,)).fetchone()
+            self.stats["lesson_hits" if row else "lesson_misses"] += 1
+        return row[0] if row else None
+
+    def put_lesson(self, key, topic, content):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO lessons VALUES (?, ?, ?, ?, ?)",
+                             (key, topic, corpus_version(), time.time(), content))
+            self._db.commit()
+
+    def has_lesson(self, key):
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM lessons WHERE key = ?", (key,)).fetchone() is not None
+
+    # ---------------- question pools ----------------
+    def pool(self, key):
+        """Every question dict in the pool, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT data FROM questions WHERE pool = ? ORDER BY rowid", (key,)
+            ).fetchall()
+        return [json.loads(r[0]) for r in rows]
+
+    def sample(self, key, n):
+        """Up to n random questions of the pool -> (questions, pool size)"""
+        n = max(0, n)
+        pool = self.pool(key)
+        picked = random.sample(pool, n) if len(pool) > n else pool
+        with self._lock:
+            self.stats["exam_hits" if len(picked) >= n else
+                       "exam_partial" if picked else "exam_misses"] += 1
+        return picked, len(pool)
+
+    def add_questions(self, key, topic, entries):
+        """Add (question key, question dict) pairs to the pool, known keys ignored -> rows added"""
+        now, corpus = time.time(), corpus_version()
+        with self._lock:
+            room = EXAM_POOL_MAX - self._db.execute(
+                "SELECT COUNT(*) FROM questions WHERE pool = ?", (key,)).fetchone()[0]
+            rows = [(key, qkey, topic, corpus, now, json.dumps(data, ensure_ascii=False))
+                    for qkey, data in entries][:max(0, room)]
+            before = self._db.total_changes
+            self._db.executemany("INSERT OR IGNORE INTO questions VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self._db.commit()
+            added = self._db.total_changes - before
+            self.stats["stored_questions"] += added
+        return added
+
+    # ---------------- housekeeping ----------------
+    def prune(self):
+        """Delete artifacts generated from an older corpus version -> rows deleted"""
+        corpus = corpus_version()
+        with self._lock:
+            before = self._db.total_changes
+            self._db.execute("DELETE FROM lessons WHERE corpus != ?", (corpus,))
+            self._db.execute("DELETE FROM questions WHERE corpus != ?", (corpus,))
+            self._db.commit()
+            return self._db.total_changes - before
+
+    def info(self):
+        with self._lock:
+            lessons = self._db.execute("SELECT COUNT(*) FROM lessons").fetchone()[0]
+            pools, questions = self._db.execute(
+                "SELECT COUNT(DISTINCT pool), COUNT(*) FROM questions").fetchone()
+        return {**self.stats, "lessons": lessons, "question_pools": pools,
+                "questions": questions, "corpus_version": corpus_version(), "path": self.path}
+
+# =========================================================
+# SHARED INSTANCE
+# =========================================================
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Process-wide store, or None when ARTIFACT_STORE=0"""
+    global _store
+    if not ARTIFACT_STORE:
+        return None
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ArtifactStore()
+    return _store
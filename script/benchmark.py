@@ -0,0 +1,742 @@
+import os
+import re
+import json
+import time
+import asyncio
+import argparse
+import numpy as np
+
+# =========================================================
+# BENCHMARKS
+# =========================================================
+# python benchmark.py <name> [options]
+#
+#   embed    query embedding: blocking in-loop vs executor + micro-batching + cache
+#   chunk    sentence cleaning + chunking throughput on data/structured
+#   bm25     in-process BM25 lexical search latency
+#   retrieve vector-only / serial hybrid / concurrent fused retrieval: latency + recall
+#   vectors  Qdrant vs in-process exact / hnsw vector search: latency + ANN recall
+#   sync     fresh collection filled from the embedding store: encodes (must be 0), points, time
+#   structure  page -> chapter / section structuring throughput + peak memory
+#   exam     one-call vs batched exam generation: questions, LLM calls per question, time
+#            (GROK_URL, e.g. stub_grok.py)
+#   artifacts  lesson / exam: generated per request vs served from the artifact store
+#
+# Every benchmark prints a before/after table with throughput numbers.
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNKS_DIR = os.path.join(BASE_DIR, "data", "chunks")
+STRUCTURED_DIR = os.path.join(BASE_DIR, "data", "structured")
+
+
+def load_chunks():
+    chunks = []
+    for file in sorted(os.listdir(CHUNKS_DIR)):
+        if file.endswith("_chunks.json"):
+            with open(os.path.join(CHUNKS_DIR, file), encoding="utf-8") as f:
+                chunks.extend(dict(c, book=file[: -len("_chunks.json")]) for c in json.load(f))
+    return chunks
+
+
+def load_sections():
+    """Sentence lists of every section in data/structured"""
+    sections = []
+    for file in sorted(os.listdir(STRUCTURED_DIR)):
+        if file.endswith("_structured.json"):
+            with open(os.path.join(STRUCTURED_DIR, file), encoding="utf-8") as f:
+                for chapter in json.load(f).get("chapters", []):
+                    sections.extend(s.get("content", []) for s in chapter.get("sections", []))
+    return sections
+
+
+def sample_queries(n):
+    """Distinct query-sized strings taken from the bundled chunks"""
+    chunks = load_chunks()
+    step = max(1, len(chunks) // n)
+    return [c["text"][:120] for c in chunks[::step]][:n]
+
+
+def report(title, rows):
+    print(f"\n📊 {title}")
+    width = max(len(r[0]) for r in rows)
+    for name, value in rows:
+        print(f"  {name.ljust(width)}  {value}")
+
+
+# ---------------------------------------------------------
+# embed
+# ---------------------------------------------------------
+def bench_embed(args):
+    import embedding_service as es
+
+    queries = sample_queries(args.queries)
+    es.embed_texts(["warm up"])
+
+    async def blocking():
+        # what hybrid_search used to do: embed inline inside the handler
+        async def one(q):
+            return es.embed_texts([q])[0]
+        return await asyncio.gather(*(one(q) for q in queries))
+
+    async def batched():
+        sem = asyncio.Semaphore(args.concurrency)
+
+        async def one(q):
+            async with sem:
+                return await es.aembed_query(q)
+        return await asyncio.gather(*(one(q) for q in queries))
+
+    rows = []
+    runs = (("blocking in-loop", blocking),
+            ("executor + micro-batch", batched),
+            ("repeat (query cache)", batched))
+    for name, fn in runs:
+        t = time.perf_counter()
+        asyncio.run(fn())
+        dt = time.perf_counter() - t
+        rows.append((name, f"{len(queries) / dt:8.1f} queries/s  ({dt:.2f}s)"))
+    rows.append(("query cache", str(es.query_cache.info())))
+
+    report(f"Query embedding, {len(queries)} queries, concurrency {args.concurrency}, "
+           f"{es.EMBED_WORKERS} workers", rows)
+
+
+# ---------------------------------------------------------
+# chunk
+# ---------------------------------------------------------
+# Reference copies of the original chunker code, kept here so the
+# optimized versions can be checked for identical output.
+def legacy_clean_text(text):
+    import re
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\S+@\S+", "", text)
+    text = re.sub(r"http\S+", "", text)
+    text = re.sub(r"www\.\S+", "", text)
+    lower = text.lower()
+    for b in ("all rights reserved", "no part of this publication", "printed and bound",
+              "library of congress", "isbn", "copyright", "registered office", "fax:",
+              "tel.:", "published by", "editor", "prelims"):
+        if b in lower:
+            return ""
+    text = re.sub(r"[^A-Za-z0-9.,;:%()\- ]+", "", text)
+    return text.strip()
+
+
+def legacy_split_chunks(sentences, max_tokens, overlap_tokens, token_len):
+    chunks, current, current_tokens = [], [], 0
+    for sent in sentences:
+        sent = legacy_clean_text(sent)
+        if len(sent) < 80:
+            continue
+        t = token_len(sent)
+        if current_tokens + t > max_tokens:
+            chunks.append(" ".join(current))
+            overlap, overlap_total = [], 0
+            for s in reversed(current):
+                overlap_total += token_len(s)
+                overlap.insert(0, s)
+                if overlap_total >= overlap_tokens:
+                    break
+            current = overlap[:]
+            current_tokens = token_len(" ".join(current))
+        current.append(sent)
+        current_tokens += t
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def timed(fn, repeat):
+    best, out = None, None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        out = fn()
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    return out, best
+
+
+def bench_chunk(args):
+    import chunker_builder as cb
+
+    # the output check also covers other window / overlap sizes
+    cb.MAX_TOKENS = args.max_tokens or cb.MAX_TOKENS
+    cb.OVERLAP_TOKENS = args.overlap or cb.OVERLAP_TOKENS
+    sections = load_sections()
+    n = sum(len(s) for s in sections)
+
+    before, t_before = timed(lambda: [[legacy_clean_text(x) for x in s] for s in sections], args.repeat)
+    after, t_after = timed(lambda: [cb.clean_texts(s) for s in sections], args.repeat)
+    if before != after:
+        raise SystemExit("❌ clean_texts output differs from the original clean_text")
+
+    def chunk_old():
+        return [legacy_split_chunks(s, cb.MAX_TOKENS, cb.OVERLAP_TOKENS, cb.token_len) for s in sections]
+
+    def chunk_new():
+        return [cb.split_chunks(s) for s in sections]
+
+    chunks_before, c_before = timed(chunk_old, args.repeat)
+    chunks_after, c_after = timed(chunk_new, args.repeat)
+    if chunks_before != chunks_after:
+        raise SystemExit("❌ split_chunks output differs from the original")
+
+    report(f"Chunking, {len(sections)} sections, {n} sentences, max {cb.MAX_TOKENS} / overlap "
+           f"{cb.OVERLAP_TOKENS} tokens (best of {args.repeat}, identical output)", [
+        ("clean  original", f"{n / t_before:10.0f} sentences/s  ({t_before:.2f}s)"),
+        ("clean  batched", f"{n / t_after:10.0f} sentences/s  ({t_after:.2f}s)"),
+        ("chunk  original", f"{n / c_before:10.0f} sentences/s  ({c_before:.2f}s)"),
+        ("chunk  current", f"{n / c_after:10.0f} sentences/s  ({c_after:.2f}s)"),
+    ])
+
+
+# ---------------------------------------------------------
+# structure
+# ---------------------------------------------------------
+# Reference copy of the per-line structure builder (regexes compiled on
+# every call, pattern checks repeated, quadratic line joining).
+def legacy_heading_level(line, body):
+    text = line["text"]
+    if len(text) < 3 or len(text) > 120 or not any(c.isalpha() for c in text):
+        return None
+    if text.endswith(".") and len(text) > 60:
+        return None
+    ratio = line["size"] / body if body else 1.0
+    if ratio >= 1.5 or (ratio >= 1.0 and re.match(r"(chapter|CHAPTER)\s+\d+", text)):
+        return "chapter"
+    if ratio >= 1.15 or (line["bold"] and ratio >= 1.05):
+        return "section"
+    return None
+
+
+def legacy_text_level(line):
+    if re.match(r"(chapter|CHAPTER)\s+\d+", line):
+        return "chapter"
+    line = line.strip()
+    if len(line) < 5 or len(line) > 120:
+        return None
+    if re.match(r"(chapter|CHAPTER)\s+\d+", line) or re.match(r"\d+(\.\d+)*\s+[A-Za-z]", line) \
+            or line.isupper():
+        return "section"
+    return None
+
+
+def legacy_split_sentences(lines):
+    text = ""
+    for line in lines:
+        if len(text) > 1 and text[-1] == "-" and text[-2].isalpha() and line[:1].islower():
+            text = text[:-1] + line
+        else:
+            text = f"{text} {line}" if text else line
+    text = re.sub(r"\s+", " ", text)
+    return [s.strip() for s in re.split(r"(?<=[.!?])\s+(?=[A-Z])", text) if len(s.strip()) > 30]
+
+
+def legacy_build_structure(pages):
+    chapters, chapter, section, last_level = [], None, None, None
+    sizes, previous, headings, page_no = {}, set(), set(), None
+
+    def close():
+        if section is not None:
+            sentences = legacy_split_sentences(section["content"])
+            if sentences:
+                if "chapter_id" not in chapter:
+                    chapter["chapter_id"] = f"AUTO_CH_{len(chapters) + 1:02}"
+                    chapter["sections"] = []
+                    chapters.append(chapter)
+                chapter["sections"].append(dict(section, content=sentences))
+
+    for page in pages:
+        page_no = page["page_no"]
+        if chapter is None:
+            chapter = {"chapter_title": "Auto Chapter 1", "page_start": page_no}
+        lines = page.get("lines")
+        if lines is not None:
+            for l in lines:
+                sizes[l["size"]] = sizes.get(l["size"], 0) + len(l["text"])
+            body = max(sizes, key=sizes.get) if sizes else None
+        else:
+            lines = [{"text": l.strip()} for l in page["text"].split("\n")]
+        previous, headings = headings, set()
+        for line in lines:
+            text = line["text"]
+            if "size" in line:
+                level = legacy_heading_level(line, body)
+            elif len(text) < 15:
+                continue
+            else:
+                level = legacy_text_level(text)
+            if level:
+                headings.add(text)
+                if text in previous:
+                    continue
+            if level == "chapter":
+                if last_level == "chapter" and section is None:
+                    chapter["chapter_title"] += " " + text
+                    continue
+                close()
+                if "chapter_id" in chapter:
+                    chapter["page_end"] = page_no
+                chapter = {"chapter_title": text, "page_start": page_no}
+                section = None
+            elif level == "section":
+                if last_level == "section" and not section["content"]:
+                    section["heading"] += " " + text
+                    continue
+                close()
+                section = {"heading": text, "content": [], "page_start": page_no}
+            else:
+                if section is None:
+                    section = {"heading": "General", "content": [], "page_start": page_no}
+                section["content"].append(text)
+            last_level = level
+    if chapter is not None:
+        close()
+        if "chapter_id" in chapter:
+            chapter["page_end"] = page_no
+    return chapters
+
+
+def bench_structure(args):
+    import tracemalloc
+    import tempfile
+    import extract_pages as ep
+    import structure_builder as sb
+
+    # layout pages straight from the PDFs, text-only pages from data/pages
+    books = {}
+    for file in sorted(os.listdir(ep.PDF_DIR)):
+        if file.lower().endswith(".pdf"):
+            books[f"{file[:-4]} (layout)"] = list(ep.iter_pages(os.path.join(ep.PDF_DIR, file)))
+    for book, path in sb.page_files(sb.IN_DIR).items():
+        books[f"{book} (text)"] = sb.load_pages(path)
+
+    rows, total_before, total_after, total_pages = [], 0.0, 0.0, 0
+    for name, pages in books.items():
+        before, t_before = timed(lambda: legacy_build_structure(pages), args.repeat)
+        after, t_after = timed(lambda: sb.build_structure(pages), args.repeat)
+        if [{k: c[k] for k in ("chapter_id", "chapter_title", "page_start", "page_end", "sections")}
+                for c in before] != after:
+            raise SystemExit(f"❌ {name}: structure differs from the per-line builder")
+        total_before, total_after, total_pages = total_before + t_before, total_after + t_after, \
+            total_pages + len(pages)
+        rows.append((name, f"{len(pages):4} pages  {t_before * 1000:7.1f} ms -> {t_after * 1000:6.1f} ms"
+                           f"  ({t_before / t_after:.1f}x)"))
+    rows.append(("all books", f"{total_pages / total_before:6.0f} -> {total_pages / total_after:6.0f} pages/s"))
+
+    # a long book from a jsonl page file: list + json.dump vs page stream + streamed writer
+    layout = [p for name, p in books.items() if name.endswith("(layout)")]
+    source = [page for pages in layout for page in pages] or [page for pages in books.values() for page in pages]
+    with tempfile.TemporaryDirectory() as tmp:
+        pages_path = os.path.join(tmp, "long_pages.jsonl")
+        ep.write_jsonl(({**source[i % len(source)], "page_no": i + 1} for i in range(args.pages)), pages_path)
+        out_path = os.path.join(tmp, "long_structured.json")
+
+        def whole():
+            chapters = legacy_build_structure(sb.load_pages(pages_path))
+            with open(out_path, "w", encoding="utf-8") as f:
+                json.dump({"book_id": "long", "chapters": chapters}, f, indent=2, ensure_ascii=False)
+
+        def streamed():
+            sb.write_structure("long", sb.iter_structure(sb.iter_page_file(pages_path)), out_path)
+
+        for name, fn in (("load all + build + dump", whole), ("page stream + streamed write", streamed)):
+            tracemalloc.start()
+            t = time.perf_counter()
+            fn()
+            dt = time.perf_counter() - t
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            rows.append((f"{args.pages}-page book, {name}",
+                         f"{args.pages / dt:6.0f} pages/s  peak {peak / 2 ** 20:6.1f} MB"))
+
+    report(f"Structuring (best of {args.repeat}, identical output)", rows)
+
+
+# ---------------------------------------------------------
+# bm25
+# ---------------------------------------------------------
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+def bench_bm25(args):
+    import bm25_index
+
+    t = time.perf_counter()
+    index = bm25_index.BM25Index.build()
+    build = time.perf_counter() - t
+    index.save()
+    t = time.perf_counter()
+    index = bm25_index.BM25Index.load()
+    load = time.perf_counter() - t
+
+    queries = sample_queries(args.queries)
+    latencies = []
+    for q in queries:
+        t = time.perf_counter()
+        index.search(q, args.top_k)
+        latencies.append((time.perf_counter() - t) * 1000)
+
+    report(f"BM25, {len(index)} chunks, {len(index.terms)} terms, {len(queries)} queries", [
+        ("build", f"{build:.2f}s"),
+        ("load", f"{load * 1000:.1f} ms"),
+        ("search p50", f"{percentile(latencies, 50):.3f} ms"),
+        ("search p99", f"{percentile(latencies, 99):.3f} ms"),
+    ])
+
+
+# ---------------------------------------------------------
+# retrieve
+# ---------------------------------------------------------
+def retrieval_client(args, chunks):
+    """QDRANT_URL collection, or an in-memory one over the first --memory chunks"""
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import VectorParams, Distance, PointStruct
+    import embedding_service as es
+    import retrieval
+
+    if not args.memory:
+        from dotenv import load_dotenv
+        load_dotenv()
+        return QdrantClient(url=os.getenv("QDRANT_URL", "http://localhost:6333")), chunks
+
+    chunks = chunks[:args.memory]
+    client = QdrantClient(":memory:")
+    client.create_collection(retrieval.COLLECTION_NAME,
+                             vectors_config=VectorParams(size=384, distance=Distance.COSINE))
+    vectors = es.embed_texts([c["text"] for c in chunks])
+    client.upsert(retrieval.COLLECTION_NAME, points=[
+        PointStruct(id=i, vector=v, payload={"content": c["text"], "book": c["book"],
+                                             "chapter_id": c.get("chapter_id")})
+        for i, (c, v) in enumerate(zip(chunks, vectors))
+    ])
+    return client, chunks
+
+
+def bench_retrieve(args):
+    import retrieval
+    import bm25_index
+    import embedding_service as es
+    from embedding_cache import EmbeddingCache
+    from embedding_store import chunk_hash
+
+    client, chunks = retrieval_client(args, load_chunks())
+    bm25_index.get_index()
+    book = args.book
+    if book:
+        chunks = [c for c in chunks if c["book"] == book]
+
+    # self-retrieval: a passage from the middle of a chunk must find that chunk
+    step = max(1, len(chunks) // args.queries)
+    cases = [(c["text"][200:320], chunk_hash(c["text"])) for c in chunks[::step]
+             if len(c["text"]) > 320][:args.queries]
+
+    async def vector_only(query):
+        timings = {}
+        _, hits = await retrieval.vector_search(client, query, args.top_k, timings, book)
+        return hits
+
+    async def serial(query):
+        # the old path: embed, search Qdrant, then keyword search, one after another
+        timings = {}
+        _, hits = await retrieval.vector_search(client, query, args.top_k, timings, book)
+        await retrieval.keyword_search(query, args.top_k, timings, book)
+        return hits
+
+    async def fused(query):
+        return (await retrieval.hybrid_search(client, query, args.top_k, book))["hits"]
+
+    async def run(fn):
+        es.query_cache = EmbeddingCache()   # every mode pays for its query embeddings
+        await fn("warm up")
+        found, latencies = 0, []
+        for query, target in cases:
+            t = time.perf_counter()
+            hits = await fn(query)
+            latencies.append((time.perf_counter() - t) * 1000)
+            found += any(h["id"] == target for h in hits)
+        return found / len(cases), latencies
+
+    rows = []
+    for name, fn in (("vector only", vector_only),
+                     ("serial vector + keyword", serial),
+                     ("concurrent fused (" + retrieval.FUSION + ")", fused)):
+        recall, latencies = asyncio.run(run(fn))
+        rows.append((name, f"recall@{args.top_k} {recall:6.1%}   p50 {percentile(latencies, 50):7.2f} ms"
+                           f"   p99 {percentile(latencies, 99):7.2f} ms"))
+
+    report(f"Retrieval, {len(cases)} self-retrieval queries" + (f", scoped to {book}" if book else ""), rows)
+
+
+# ---------------------------------------------------------
+# sync
+# ---------------------------------------------------------
+def bench_sync(args):
+    """A fresh collection must be filled from the embedding store, not the model.
+
+    The real index manifest (which lists every point) is used on purpose:
+    it must not make the empty collection look up to date. Exits 1 if
+    anything was encoded or the collection ends up incomplete.
+    """
+    import shutil
+    import tempfile
+    import vector_embed as ve
+    from qdrant_client import QdrantClient
+
+    # scratch collection + manifest copy: the real collection / manifest are not touched
+    ve.COLLECTION_NAME = "bench_sync"
+    manifest = os.path.join(ve.INDEX_DIR, "medical_chunks_manifest.json")
+    ve.INDEX_MANIFEST = os.path.join(tempfile.mkdtemp(), "manifest.json")
+    if os.path.exists(manifest):
+        shutil.copy(manifest, ve.INDEX_MANIFEST)
+    if args.qdrant_url:
+        client = QdrantClient(url=args.qdrant_url, timeout=ve.TIMEOUT)
+        if client.collection_exists(ve.COLLECTION_NAME):
+            client.delete_collection(ve.COLLECTION_NAME)
+    else:
+        client = QdrantClient(":memory:")
+        ve.UPSERT_THREADS = 1       # the in-memory client is not thread-safe
+
+    chunks = ve.load_chunks()
+    wanted = len({ve.point_id(c["text"]) for c in chunks})
+    store = ve.open_store()
+    rows, ok = [], True
+    try:
+        for run in ("fresh collection", "second run"):
+            t = time.perf_counter()
+            existing = ve.existing_points(client, ve.ensure_collection(client))
+            stats = ve.sync_collection(client, chunks, existing, store=store)
+            points = client.count(collection_name=ve.COLLECTION_NAME, exact=True).count
+            ok = ok and stats["encoded"] == 0 and points == wanted
+            rows.append((run, f"{stats['encoded']:5} encoded  {stats['from_store']:5} from store  "
+                              f"{points:5}/{wanted} points  {time.perf_counter() - t:6.2f}s"))
+    finally:
+        if args.qdrant_url:
+            client.delete_collection(ve.COLLECTION_NAME)
+
+    report(f"Collection sync from the embedding store ({args.qdrant_url or 'in-memory client'})", rows)
+    if not ok:
+        print("❌ fresh collection was not filled from the store alone "
+              "(store incomplete? run vector_embed.py once)")
+        raise SystemExit(1)
+
+
+# ---------------------------------------------------------
+# vectors
+# ---------------------------------------------------------
+def synthetic_vectors(n, dim, seed=0):
+    """Unit vectors around a few hundred centroids (embedding-like, not uniform noise)"""
+    rng = np.random.default_rng(seed)
+    centroids = rng.standard_normal((max(1, n // 50), dim)).astype(np.float32)
+    vectors = centroids[rng.integers(0, len(centroids), n)] \
+        + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def bench_vectors(args):
+    import local_vectors as lv
+    from qdrant_client import QdrantClient
+    from qdrant_client.models import VectorParams, Distance, PointStruct
+
+    vectors = synthetic_vectors(args.n + args.queries, args.dim)
+    vectors, queries = vectors[:args.n], vectors[args.n:]
+    payloads = [{"book": f"book{i % 10}"} for i in range(args.n)]
+
+    index = lv.LocalVectorIndex.from_arrays(vectors, list(range(args.n)), payloads)
+    exact = [[p.id for p in index.search(query_vector=q, limit=args.top_k)] for q in queries]
+
+    def measure(search):
+        found, latencies = 0, []
+        for q, truth in zip(queries, exact):
+            t = time.perf_counter()
+            ids = [p.id for p in search(q)]
+            latencies.append((time.perf_counter() - t) * 1000)
+            found += len(set(ids) & set(truth))
+        return (f"recall@{args.top_k} {found / (len(queries) * args.top_k):6.1%}"
+                f"   p50 {percentile(latencies, 50):7.3f} ms   p99 {percentile(latencies, 99):7.3f} ms")
+
+    rows = []
+    if args.qdrant_url or args.n <= 20000:
+        # the in-memory client is a python brute-force scan; a server is the real comparison
+        client = QdrantClient(url=args.qdrant_url) if args.qdrant_url else QdrantClient(":memory:")
+        name = "bench_vectors"
+        if client.collection_exists(name):
+            client.delete_collection(name)
+        client.create_collection(name, vectors_config=VectorParams(size=args.dim, distance=Distance.COSINE))
+        for start in range(0, args.n, 1000):
+            client.upsert(name, points=[PointStruct(id=i, vector=vectors[i].tolist(), payload=payloads[i])
+                                        for i in range(start, min(start + 1000, args.n))])
+        rows.append((f"qdrant ({args.qdrant_url or 'in-memory client'})",
+                     measure(lambda q: client.search(name, query_vector=q.tolist(), limit=args.top_k))))
+        if args.qdrant_url:
+            client.delete_collection(name)
+
+    rows.append(("local exact (numpy dot)",
+                 measure(lambda q: index.search(query_vector=q, limit=args.top_k))))
+
+    try:
+        t = time.perf_counter()
+        index.build_ann()
+        build = time.perf_counter() - t
+        rows.append((f"local hnsw (build {build:.1f}s, ef {lv.HNSW_EF_SEARCH})",
+                     measure(lambda q: index.search(query_vector=q, limit=args.top_k))))
+    except ImportError:
+        rows.append(("local hnsw", "skipped: pip install hnswlib"))
+
+    report(f"Vector search, {args.n} x {args.dim} float32, {len(queries)} queries", rows)
+
+
+# ---------------------------------------------------------
+# exam
+# ---------------------------------------------------------
+def legacy_parse_questions(ai):
+    """The original strict parser: split on "Q<n>.", exact "X)" / "Correct Answer:" only"""
+    stems = []
+    for block in re.split(r"Q\d+\.", ai)[1:]:
+        opts = re.findall(r"[A-D]\)\s*(.+)", block)
+        if len(opts) == 4 and re.search(r"Correct Answer:\s*([A-D])", block):
+            stems.append(block.split("A)")[0].strip())
+    return stems
+
+
+def bench_exam(args):
+    from routes import exam_routes as er
+    from llm_client import ask_grok, close_client
+
+    req = er.ExamRequest(exam_name="bench", topic=args.topic, num_questions=args.questions, book=args.book)
+
+    async def one_call():
+        # the old path: one ungrounded prompt for every question, strict parser,
+        # the whole exam asked for again while it is short
+        stems, calls = set(), 0
+        while len(stems) < req.num_questions and calls < 1 + er.EXAM_TOPUP_ROUNDS:
+            calls += 1
+            ai = await ask_grok(er.exam_prompt(req), max_tokens=3000, route="exam")
+            stems.update(legacy_parse_questions(ai or ""))
+        return min(len(stems), req.num_questions), calls, calls * req.num_questions
+
+    async def batched(output, batch_size):
+        er.EXAM_BATCH_SIZE = batch_size
+        contexts = await er.exam_context(req, len(er.exam_batches(req.num_questions)) or 1)
+        stats = er.exam_stats()
+        questions = [q async for q in er.exam_questions(req, contexts, stats, output)]
+        return len(questions), stats["calls"], stats["requested"]
+
+    async def run():
+        rows, size = [], er.EXAM_BATCH_SIZE
+        for name, fn in (("one call, strict parser, full re-ask", one_call),
+                         ("one call, tolerant parser, top-up", lambda: batched("text", req.num_questions)),
+                         (f"batches of {size}, tolerant parser, top-up", lambda: batched("text", size)),
+                         (f"batches of {size}, json output, top-up", lambda: batched("json", size))):
+            t = time.perf_counter()
+            delivered, calls, requested = await fn()
+            rows.append((name, f"{delivered:3}/{req.num_questions} delivered  {calls:2} calls  "
+                               f"{calls / max(1, delivered):.3f} calls/q  "
+                               f"{requested / max(1, delivered):4.2f} asked/q  {time.perf_counter() - t:6.2f}s"))
+        await close_client()
+        return rows
+
+    report(f"Exam generation, {args.questions} questions on '{args.topic}'", asyncio.run(run()))
+
+
+# ---------------------------------------------------------
+# ARTIFACT STORE
+# ---------------------------------------------------------
+def bench_artifacts(args):
+    import tempfile
+    import artifact_store
+    from routes import lesson_routes as lr
+    from routes import exam_routes as er
+    from llm_client import close_client
+
+    # fresh store in a temp dir: the first request is a miss, the rest are hits
+    artifact_store._store = artifact_store.ArtifactStore(
+        os.path.join(tempfile.mkdtemp(), "artifacts.sqlite"))
+    lesson = lr.LessonRequest(lesson_plan_name="bench", topic=args.topic)
+    exam = er.ExamRequest(exam_name="bench", topic=args.topic, num_questions=args.questions, book=args.book)
+
+    async def run():
+        rows = []
+        for name, fn in (("lesson plan", lambda: lr.generate_lesson(lesson)),
+                         (f"exam, {args.questions} questions", lambda: er.generate_exam(exam))):
+            times = []
+            for _ in range(1 + args.repeat):
+                t = time.perf_counter()
+                await fn()
+                times.append((time.perf_counter() - t) * 1000)
+            hits = times[1:]
+            rows.append((f"{name}: generated (miss)", f"{times[0]:9.1f} ms"))
+            rows.append((f"{name}: from store (hit)", f"{percentile(hits, 50):9.2f} ms p50  "
+                                                      f"{percentile(hits, 95):7.2f} ms p95"))
+        await close_client()
+        return rows
+
+    report(f"Artifact store, topic '{args.topic}'", asyncio.run(run()))
+    print(artifact_store.get_store().info())
+
+
+# ---------------------------------------------------------
+# MAIN
+# ---------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MediBook performance benchmarks")
+    sub = parser.add_subparsers(dest="bench", required=True)
+
+    p = sub.add_parser("embed", help="query embedding throughput")
+    p.add_argument("--queries", type=int, default=256)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.set_defaults(func=bench_embed)
+
+    p = sub.add_parser("chunk", help="clean_text / split_chunks throughput")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--max-tokens", type=int, default=0, help="override MAX_TOKENS")
+    p.add_argument("--overlap", type=int, default=0, help="override OVERLAP_TOKENS")
+    p.set_defaults(func=bench_chunk)
+
+    p = sub.add_parser("structure", help="structure builder throughput and memory")
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--pages", type=int, default=1000, help="length of the synthetic long book")
+    p.set_defaults(func=bench_structure)
+
+    p = sub.add_parser("bm25", help="lexical search latency")
+    p.add_argument("--queries", type=int, default=500)
+    p.add_argument("--top-k", type=int, default=5)
+    p.set_defaults(func=bench_bm25)
+
+    p = sub.add_parser("retrieve", help="hybrid retrieval latency and recall")
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--top-k", type=int, default=5)
+    p.add_argument("--memory", type=int, default=0,
+                   help="index the first N chunks in an in-memory Qdrant instead of QDRANT_URL")
+    p.add_argument("--book", help="scope every query to one book (payload filter)")
+    p.set_defaults(func=bench_retrieve)
+
+    p = sub.add_parser("vectors", help="Qdrant vs in-process vector search")
+    p.add_argument("--n", type=int, default=20000, help="synthetic corpus size")
+    p.add_argument("--dim", type=int, default=384)
+    p.add_argument("--queries", type=int, default=200)
+    p.add_argument("--top-k", type=int, default=10)
+    p.add_argument("--qdrant-url", help="compare against a Qdrant server (temporary collection)")
+    p.set_defaults(func=bench_vectors)
+
+    p = sub.add_parser("sync", help="fresh collection filled from the embedding store")
+    p.add_argument("--qdrant-url", help="use a Qdrant server (temporary collection)")
+    p.set_defaults(func=bench_sync)
+
+    p = sub.add_parser("exam", help="one-call vs batched exam generation")
+    p.add_argument("--questions", type=int, default=50)
+    p.add_argument("--topic", default="bone tumor treatment")
+    p.add_argument("--book", help="scope the exam to one book")
+    p.set_defaults(func=bench_exam)
+
+    p = sub.add_parser("artifacts", help="lesson / exam generation vs artifact store hits")
+    p.add_argument("--questions", type=int, default=20)
+    p.add_argument("--topic", default="bone tumor treatment")
+    p.add_argument("--book", help="scope the exam to one book")
+    p.add_argument("--repeat", type=int, default=50)
+    p.set_defaults(func=bench_artifacts)
+
+    args = parser.parse_args()
+    args.func(args)
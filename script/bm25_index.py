@@ -0,0 +1,271 @@
+import os
+import re
+import sys
+import json
+import time
+import threading
+import numpy as np
+from embedding_store import chunk_hash
+
+# ----------------------------
+# BM25 LEXICAL INDEX
+# ----------------------------
+# Inverted index over data/chunks/*_chunks.json, persisted under
+# data/index/bm25/:
+#
+#   meta.json     term -> [offset, df], doc metadata, source signature
+#   docs.npy      uint32 doc ids, all postings lists back to back
+#   impact.npy    float32 BM25 weight of (term, doc), precomputed
+#
+# BM25 weights do not depend on the query, so a search is a handful of
+# numpy slices summed into one score vector. The index is loaded once per
+# process; the chunk files are re-checked every INDEX_CHECK_INTERVAL
+# seconds and a changed or new file rebuilds and swaps the index.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNKS_DIR = os.path.join(BASE_DIR, "data", "chunks")
+BM25_DIR = os.path.join(BASE_DIR, "data", "index", "bm25")
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+INDEX_VERSION = 1   # bump when tokenization or the file layout changes
+INDEX_CHECK_INTERVAL = 2.0   # seconds between chunk file staleness checks
+
+# ----------------------------
+# MEDICAL TOKENIZER
+# ----------------------------
+# Keeps clinical identifiers whole (her2, cd20, t(9;22) -> t 9 22,
+# non-hodgkin, 5-fluorouracil, 2.5) and also indexes the parts of
+# hyphenated / slashed terms, so "non-Hodgkin" matches "Hodgkin".
+_TOKEN = re.compile(r"[a-z0-9]+(?:\.[0-9]+)?(?:[-/][a-z0-9]+)*")
+
+STOP_WORDS = frozenset("""
+a an the and or but if of in on at to for from by with without as is are was were be been
+being this that these those it its into than then there their they them which who whom what
+when where why how can could may might must shall should will would do does did done has have
+had having not no nor so such also only other same both each few more most some any all very
+about above after again against below between during over under until while through up down
+out off further once here i we you he she his her our your my me us him
+""".split())
+
+
+def _stem(term):
+    """Plural folding only; medical roots are too irregular for real stemming"""
+    if len(term) > 4 and term.endswith("ies"):
+        return term[:-3] + "y"
+    if len(term) > 3 and term.endswith("s") and not term.endswith(("ss", "us", "is")) \
+            and term[-2].isalpha():
+        return term[:-1]
+    return term
+
+
+def tokenize(text):
+    terms = []
+    for tok in _TOKEN.findall(text.lower().replace("'", "")):
+        if tok in STOP_WORDS:
+            continue
+        terms.append(_stem(tok))
+        if "-" in tok or "/" in tok:
+            terms.extend(_stem(p) for p in re.split(r"[-/]", tok)
+                         if len(p) > 1 and p not in STOP_WORDS)
+    return terms
+
+# ----------------------------
+# INDEX
+# ----------------------------
+def chunk_files(chunks_dir=CHUNKS_DIR):
+    return [os.path.join(chunks_dir, f) for f in sorted(os.listdir(chunks_dir))
+            if f.endswith("_chunks.json")]
+
+
+def source_signature(files):
+    sig = [[os.path.basename(p), os.path.getsize(p), os.stat(p).st_mtime_ns] for p in files]
+    return {"version": INDEX_VERSION, "k1": BM25_K1, "b": BM25_B, "files": sig}
+
+
+class BM25Index:
+
+    def __init__(self, terms, docs, doc_ids, impact, signature=None):
+        self.terms = terms          # term -> (offset, df)
+        self.docs = docs            # [{"id", "book", "chapter_id", "section", "text"}]
+        self.doc_ids = doc_ids
+        self.impact = impact
+        self.signature = signature
+        self._subsets = {}          # (book, chapter_id) -> doc indexes
+
+    def __len__(self):
+        return len(self.docs)
+
+    @classmethod
+    def build(cls, chunks_dir=CHUNKS_DIR):
+        files = chunk_files(chunks_dir)
+        postings = {}               # term -> {doc: tf}
+        docs, seen, lengths = [], set(), []
+
+        for path in files:
+            book = os.path.basename(path)[: -len("_chunks.json")]
+            with open(path, "r", encoding="utf-8") as f:
+                chunks = json.load(f)
+            for chunk in chunks:
+                text = chunk.get("text", "")
+                key = chunk_hash(text)
+                if not text or key in seen:
+                    continue
+                seen.add(key)
+                doc = len(docs)
+                docs.append({
+                    "id": key,
+                    "book": book,
+                    "chapter_id": chunk.get("chapter_id"),
+                    "section": chunk.get("section"),
+                    "text": text
+                })
+                terms = tokenize(text)
+                lengths.append(len(terms))
+                for term in terms:
+                    tfs = postings.setdefault(term, {})
+                    tfs[doc] = tfs.get(doc, 0) + 1
+
+        n = len(docs)
+        doc_len = np.asarray(lengths, dtype=np.float32)
+        avgdl = float(doc_len.mean()) if n else 1.0
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / max(avgdl, 1e-9))
+
+        terms = {}
+        id_parts, impact_parts, offset = [], [], 0
+        for term in sorted(postings):
+            tfs = postings[term]
+            ids = np.fromiter(tfs.keys(), dtype=np.uint32, count=len(tfs))
+            tf = np.fromiter(tfs.values(), dtype=np.float32, count=len(tfs))
+            idf = np.log(1 + (n - len(tfs) + 0.5) / (len(tfs) + 0.5))
+            id_parts.append(ids)
+            impact_parts.append((idf * tf * (BM25_K1 + 1) / (tf + norm[ids])).astype(np.float32))
+            terms[term] = (offset, len(tfs))
+            offset += len(tfs)
+
+        doc_ids = np.concatenate(id_parts) if id_parts else np.empty(0, dtype=np.uint32)
+        impact = np.concatenate(impact_parts) if impact_parts else np.empty(0, dtype=np.float32)
+        return cls(terms, docs, doc_ids, impact, source_signature(files))
+
+    def save(self, out_dir=BM25_DIR):
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(os.path.join(out_dir, "docs.npy"), self.doc_ids)
+        np.save(os.path.join(out_dir, "impact.npy"), self.impact)
+        tmp = os.path.join(out_dir, "meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"signature": self.signature, "terms": self.terms, "docs": self.docs},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, os.path.join(out_dir, "meta.json"))  # written last: marks a complete index
+
+    @classmethod
+    def load(cls, in_dir=BM25_DIR):
+        with open(os.path.join(in_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        doc_ids = np.load(os.path.join(in_dir, "docs.npy"), mmap_mode="r")
+        impact = np.load(os.path.join(in_dir, "impact.npy"), mmap_mode="r")
+        return cls(meta["terms"], meta["docs"], doc_ids, impact, meta["signature"])
+
+    def scores(self, query):
+        """BM25 score of every doc for query (float32 vector, one entry per doc)"""
+        scores = np.zeros(len(self.docs), dtype=np.float32)
+        for term in tokenize(query):
+            entry = self.terms.get(term)
+            if entry is None:
+                continue
+            start, df = entry
+            scores[self.doc_ids[start:start + df]] += self.impact[start:start + df]
+        return scores
+
+    def subset(self, book=None, chapter_id=None):
+        """Indexes of the docs in one book and/or chapter (cached per scope)"""
+        key = (book, chapter_id)
+        docs = self._subsets.get(key)
+        if docs is None:
+            if len(self._subsets) > 1024:
+                self._subsets.clear()
+            docs = self._subsets[key] = np.fromiter(
+                (i for i, d in enumerate(self.docs)
+                 if (book is None or d["book"] == book)
+                 and (chapter_id is None or d["chapter_id"] == chapter_id)),
+                dtype=np.int64
+            )
+        return docs
+
+    def search(self, query, top_k=5, book=None, chapter_id=None):
+        """-> [{"id", "score", "book", "chapter_id", "section", "text"}] best first"""
+        scores = self.scores(query)
+        if book or chapter_id:
+            candidates = self.subset(book, chapter_id)
+            scores = scores[candidates]
+        else:
+            candidates = None
+        if not len(scores):
+            return []
+
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [dict(self.docs[i if candidates is None else candidates[i]], score=float(scores[i]))
+                for i in top if scores[i] > 0]
+
+# ----------------------------
+# SHARED INSTANCE
+# ----------------------------
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+
+
+def _load_or_build(signature):
+    if os.path.exists(os.path.join(BM25_DIR, "meta.json")):
+        index = BM25Index.load()
+        if index.signature == signature:
+            return index
+    t = time.perf_counter()
+    index = BM25Index.build()
+    index.save()
+    print(f"✅ BM25 index built: {len(index)} chunks, {len(index.terms)} terms "
+          f"({time.perf_counter() - t:.2f}s)")
+    return index
+
+
+def get_index():
+    """Process-wide index: loaded from disk, rebuilt and swapped when the chunks change.
+
+    While one thread checks or rebuilds, the others keep searching the
+    index they already have.
+    """
+    global _index, _checked_at
+    if _index is not None and time.monotonic() - _checked_at < INDEX_CHECK_INTERVAL:
+        return _index
+    if not _lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        signature = source_signature(chunk_files())
+        if _index is None or _index.signature != signature:
+            _index = _load_or_build(signature)
+        _checked_at = time.monotonic()
+    finally:
+        _lock.release()
+    return _index
+
+
+def search(query, top_k=5, book=None, chapter_id=None):
+    return get_index().search(query, top_k, book, chapter_id)
+
+
+if __name__ == "__main__":
+    # python bm25_index.py            -> (re)build
+    # python bm25_index.py <query>    -> search
+    if len(sys.argv) > 1:
+        t = time.perf_counter()
+        index = get_index()
+        print(f"index ready in {time.perf_counter() - t:.3f}s")
+        t = time.perf_counter()
+        hits = index.search(" ".join(sys.argv[1:]), 5)
+        print(f"search: {(time.perf_counter() - t) * 1000:.3f} ms")
+        for hit in hits:
+            print(f"  {hit['score']:.3f} | {hit['book']} | {hit['text'][:80]}...")
+    else:
+        index = BM25Index.build()
+        index.save()
+        print(f"✅ BM25 index: {len(index)} chunks, {len(index.terms)} terms → {BM25_DIR}")
@@ -0,0 +1,103 @@
+import os
+import json
+import math
+
+# -------------------------
+# BOOK MANIFEST
+# -------------------------
+# Small per-book sidecar written next to each *_chunks.json.
+# Holds everything the catalog needs (ids, sections, counts) so the
+# API never has to parse the full chunk text just to list books.
+
+CHUNKS_SUFFIX = "_chunks.json"
+MANIFEST_SUFFIX = "_manifest.json"
+MANIFEST_VERSION = 1
+
+
+def estimate_tokens(text):
+    return max(1, math.ceil(len(text) / 4))
+
+
+def manifest_path_for(chunks_path):
+    base = chunks_path[: -len(CHUNKS_SUFFIX)] if chunks_path.endswith(CHUNKS_SUFFIX) \
+        else os.path.splitext(chunks_path)[0]
+    return base + MANIFEST_SUFFIX
+
+
+class ManifestBuilder:
+    """Incremental manifest: add() chunks one at a time, result() at the end"""
+
+    def __init__(self, book_name, token_len=estimate_tokens):
+        self.book_name = book_name
+        self.token_len = token_len
+        self.book_ids = {}
+        self.chapter_ids = {}
+        self.sections = {}
+        self.token_total = 0
+
+    def add(self, chunk):
+        if not isinstance(chunk, dict):
+            return
+
+        tokens = self.token_len(chunk.get("text", ""))
+        self.token_total += tokens
+
+        if "book_id" in chunk:
+            self.book_ids[chunk["book_id"]] = None
+
+        ch_id = chunk.get("chapter_id", "default")
+        self.chapter_ids[ch_id] = None
+
+        key = (ch_id, chunk.get("section", "General"))
+        entry = self.sections.get(key)
+        if entry is None:
+            entry = self.sections[key] = {
+                "chapter_id": key[0],
+                "section": key[1],
+                "chunk_count": 0,
+                "token_total": 0
+            }
+        entry["chunk_count"] += 1
+        entry["token_total"] += tokens
+
+    def result(self):
+        return {
+            "version": MANIFEST_VERSION,
+            "book_name": self.book_name,
+            "chunks_file": f"{self.book_name}{CHUNKS_SUFFIX}",
+            "chunk_count": sum(s["chunk_count"] for s in self.sections.values()),
+            "token_total": self.token_total,
+            "book_ids": list(self.book_ids),
+            "chapter_ids": list(self.chapter_ids),
+            "sections": list(self.sections.values())
+        }
+
+
+def build_manifest(book_name, chunks, token_len=estimate_tokens):
+    """Chunk dicts -> compact manifest dict (order of first appearance kept)"""
+    builder = ManifestBuilder(book_name, token_len)
+    for chunk in chunks:
+        builder.add(chunk)
+    return builder.result()
+
+
+def write_manifest(chunks_path, manifest):
+    out = manifest_path_for(chunks_path)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, separators=(",", ":"))
+    return out
+
+
+def load_manifest(manifest_path):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def manifest_from_chunks_file(chunks_path, token_len=estimate_tokens):
+    """Fallback for chunk files produced before manifests existed"""
+    book_name = os.path.basename(chunks_path)[: -len(CHUNKS_SUFFIX)]
+    with open(chunks_path, "r", encoding="utf-8") as f:
+        chunks = json.load(f)
+    if not isinstance(chunks, list):
+        raise ValueError(f"Unknown chunk file structure: {type(chunks)}")
+    return build_manifest(book_name, chunks, token_len)
@@ -3,7 +3,9 @@ import json
 import uuid
 import math
 import re
+import sys
 from nanoid import generate   # ✅ NEW (only addition)
+from catalog_manifest import build_manifest, write_manifest, manifest_from_chunks_file, CHUNKS_SUFFIX
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 IN_DIR = os.path.join(BASE_DIR, "data/structured")
@@ -15,132 +17,336 @@ OVERLAP_TOKENS = 100
 BOOK_PARTS = 21          # ✅ one book → 21 nano ids
 CHUNKS_PER_PART = 50     # adjust if needed
 
+# Optional: size chunks with the embedding model's own tokenizer instead of
+# len/4, e.g. CHUNK_TOKENIZER=BAAI/bge-small-en-v1.5. Chunks then fit the
+# model window together with vector_embed's prefix and [CLS]/[SEP], so
+# nothing is silently truncated at encode time.
+CHUNK_TOKENIZER = os.getenv("CHUNK_TOKENIZER", "")
+MODEL_WINDOW = 512
+EMBED_PREFIX = "Represent this sentence for retrieval: "   # = vector_embed.PREFIX
+SENTENCE_CACHE_SIZE = 200_000
+
 # -------------------------
 # TOKEN ESTIMATE
 # -------------------------
 def token_len(text):
     return max(1, math.ceil(len(text) / 4))
 
+# -------------------------
+# MODEL TOKEN COUNTS
+# -------------------------
+_tokenizer = None
+_sentence_tokens = {}    # cleaned sentence -> model token count
+
+def get_tokenizer():
+    global _tokenizer
+    if _tokenizer is None:
+        from tokenizers import Tokenizer
+        _tokenizer = Tokenizer.from_pretrained(CHUNK_TOKENIZER)
+        _tokenizer.no_truncation()
+        _tokenizer.no_padding()
+    return _tokenizer
+
+def model_max_tokens():
+    """Chunk budget: model window minus special tokens and the embed prefix"""
+    tok = get_tokenizer()
+    specials = len(tok.encode("", add_special_tokens=True).ids)
+    prefix = len(tok.encode(EMBED_PREFIX, add_special_tokens=False).ids)
+    return min(MAX_TOKENS, MODEL_WINDOW - specials - prefix)
+
+def sentence_token_counts(sentences):
+    """Model token counts; uncached sentences are tokenized in one batch"""
+    missing = [s for s in dict.fromkeys(sentences) if s not in _sentence_tokens]
+    if missing:
+        if len(_sentence_tokens) + len(missing) > SENTENCE_CACHE_SIZE:
+            _sentence_tokens.clear()
+        encodings = get_tokenizer().encode_batch(missing, add_special_tokens=False)
+        for s, enc in zip(missing, encodings):
+            _sentence_tokens[s] = len(enc.ids)
+    return [_sentence_tokens[s] for s in sentences]
+
+def split_long_sentence(sent, budget):
+    """Sentence over budget -> [(piece, tokens)], cut at word starts where possible"""
+    offsets = get_tokenizer().encode(sent, add_special_tokens=False).offsets
+    bounds = [0]
+    word_start = 0
+    for i in range(1, len(offsets)):
+        if sent[offsets[i][0] - 1] == " ":
+            word_start = i
+        if i - bounds[-1] >= budget:
+            bounds.append(word_start if word_start > bounds[-1] else i)
+    bounds.append(len(offsets))
+    return [(sent[offsets[a][0]:offsets[b - 1][1]], b - a) for a, b in zip(bounds, bounds[1:])]
+
 # -------------------------
 # TEXT CLEANER
 # -------------------------
+BLACKLIST = [
+    "all rights reserved",
+    "no part of this publication",
+    "printed and bound",
+    "library of congress",
+    "isbn",
+    "copyright",
+    "registered office",
+    "fax:",
+    "tel.:",
+    "published by",
+    "editor",
+    "prelims"
+]
+
+_SPACES = re.compile(r"\s+")
+_EMAIL = re.compile(r"\S+@\S+")
+_HTTP = re.compile(r"http\S+")
+_WWW = re.compile(r"www\.\S+")
+_DISALLOWED = re.compile(r"[^A-Za-z0-9.,;:%()\- ]+")
+
 def clean_text(text):
-    text = re.sub(r"\s+", " ", text)
-    text = re.sub(r"\S+@\S+", "", text)
-    text = re.sub(r"http\S+", "", text)
-    text = re.sub(r"www\.\S+", "", text)
-
-    blacklist = [
-        "all rights reserved",
-        "no part of this publication",
-        "printed and bound",
-        "library of congress",
-        "isbn",
-        "copyright",
-        "registered office",
-        "fax:",
-        "tel.:",
-        "published by",
-        "editor",
-        "prelims"
-    ]
+    text = _SPACES.sub(" ", text)
+    text = _EMAIL.sub("", text)
+    text = _HTTP.sub("", text)
+    text = _WWW.sub("", text)
 
     lower = text.lower()
-    for b in blacklist:
+    for b in BLACKLIST:
         if b in lower:
             return ""
 
-    text = re.sub(r"[^A-Za-z0-9.,;:%()\- ]+", "", text)
+    text = _DISALLOWED.sub("", text)
     return text.strip()
 
+# -------------------------
+# BATCH CLEANER
+# -------------------------
+# Same result as clean_text on every sentence, but each step runs once over
+# the whole batch joined with NUL (no pattern crosses it), so the regex and
+# str.find work happens in C instead of one Python call chain per sentence.
+_SEP = "\x00"
+_HTTP_BATCH = re.compile(r"http[^\s\x00]+")
+_WWW_BATCH = re.compile(r"www\.[^\s\x00]+")
+_DISALLOWED_BATCH = re.compile(r"[^A-Za-z0-9.,;:%()\- \x00]+")
+
+def _token_end(text, pos):
+    ends = [e for e in (text.find(" ", pos), text.find(_SEP, pos)) if e != -1]
+    return min(ends) if ends else len(text)
+
+def _drop_emails(text):
+    """\\S+@\\S+ removal for collapsed text: drops whole tokens with an inner '@'.
+
+    Only tokens that contain '@' are looked at; the regex would try every
+    position of every token.
+    """
+    at = text.find("@")
+    if at == -1:
+        return text
+
+    parts, pos = [], 0
+    while at != -1:
+        start = max(text.rfind(" ", pos, at), text.rfind(_SEP, pos, at), pos - 1) + 1
+        end = _token_end(text, at)
+        if start < at < end - 1:
+            parts.append(text[pos:start])
+            pos = end
+            at = text.find("@", end)
+        else:
+            at = text.find("@", at + 1)
+    parts.append(text[pos:])
+    return "".join(parts)
+
+def _blacklisted(lower):
+    """Indexes of the NUL-joined sentences that contain a blacklist phrase"""
+    hits = []
+    for b in BLACKLIST:
+        pos = lower.find(b)
+        while pos != -1:
+            hits.append(pos)
+            nxt = lower.find(_SEP, pos)
+            pos = lower.find(b, nxt) if nxt != -1 else -1
+
+    blocked, index, last = set(), 0, 0
+    for pos in sorted(hits):
+        index += lower.count(_SEP, last, pos)
+        last = pos
+        blocked.add(index)
+    return blocked
+
+def clean_texts(texts):
+    """clean_text over a list of sentences -> list of cleaned sentences"""
+    texts = list(texts)
+    if not texts:
+        return []
+    joined = _SEP.join(texts)
+    if joined.count(_SEP) != len(texts) - 1:
+        # sentences that already contain NUL go through clean_text alone
+        odd = {i for i, t in enumerate(texts) if _SEP in t}
+        rest = iter(clean_texts([t for i, t in enumerate(texts) if i not in odd]))
+        return [clean_text(t) if i in odd else next(rest) for i, t in enumerate(texts)]
+
+    # split/join == \s+ -> " " except at the ends, which strip() drops anyway
+    joined = " ".join(joined.split())
+    joined = _drop_emails(joined)
+    joined = _HTTP_BATCH.sub("", joined)
+    joined = _WWW_BATCH.sub("", joined)
+
+    blocked = _blacklisted(joined.lower())
+
+    cleaned = _DISALLOWED_BATCH.sub("", joined).split(_SEP)
+    return ["" if i in blocked else s.strip() for i, s in enumerate(cleaned)]
+
 # -------------------------
 # CHUNK SPLITTER
 # -------------------------
 def split_chunks(sentences):
+    """Raw sentences -> chunk texts of ~MAX_TOKENS with OVERLAP_TOKENS carried over"""
+    return [text for text, _ in sized_chunks(sentences)]
+
+def sized_chunks(sentences):
+    """Raw sentences -> [(chunk text, tokens)]
+
+    Tokens are len/4 estimates, or exact model counts with CHUNK_TOKENIZER
+    (WordPiece never merges across spaces, so a space-joined chunk has the
+    sum of its sentences' counts and is never re-tokenized).
+    """
+    kept = [s for s in clean_texts(sentences) if len(s) >= 80]
+    if not CHUNK_TOKENIZER:
+        return window_chunks(kept, [token_len(s) for s in kept], MAX_TOKENS, exact=False)
+
+    budget = model_max_tokens()
+    items, counts = [], []
+    for sent, t in zip(kept, sentence_token_counts(kept)):
+        pieces = split_long_sentence(sent, budget) if t > budget else [(sent, t)]
+        for piece, pt in pieces:
+            items.append(piece)
+            counts.append(pt)
+    return window_chunks(items, counts, budget, exact=True)
+
+def window_chunks(sentences, counts, max_tokens, exact):
+    """Sliding window over sentences with per-sentence token counts"""
     chunks = []
-    current = []
+    current = []            # (sentence, tokens)
     current_tokens = 0
 
-    for sent in sentences:
-        sent = clean_text(sent)
-        if len(sent) < 80:
-            continue
-
-        t = token_len(sent)
+    def close():
+        text = " ".join(s for s, _ in current)
+        chunks.append((text, sum(t for _, t in current) if exact else token_len(text)))
 
-        if current_tokens + t > MAX_TOKENS:
-            chunks.append(" ".join(current))
+    for sent, t in zip(sentences, counts):
+        if current_tokens + t > max_tokens:
+            close()
 
             overlap = []
             overlap_tokens = 0
-            for s in reversed(current):
-                overlap_tokens += token_len(s)
-                overlap.insert(0, s)
+            for s, st in reversed(current):
+                overlap_tokens += st
+                overlap.insert(0, (s, st))
                 if overlap_tokens >= OVERLAP_TOKENS:
                     break
 
-            current = overlap[:]
-            current_tokens = token_len(" ".join(current))
+            if exact:
+                # a hard model limit: shrink the overlap until sent fits too
+                while overlap and overlap_tokens + t > max_tokens:
+                    overlap_tokens -= overlap.pop(0)[1]
+                current_tokens = overlap_tokens
+            else:
+                current_tokens = token_len(" ".join(s for s, _ in overlap))
+            current = overlap
 
-        current.append(sent)
+        current.append((sent, t))
         current_tokens += t
 
     if current:
-        chunks.append(" ".join(current))
+        close()
 
     return chunks
 
 # -------------------------
-# MAIN
+# BOOK CHUNKER
 # -------------------------
-if __name__ == "__main__":
+STAGE_VERSION = 1  # bump when chunk output changes for the same input
+STAGE_CONFIG = {
+    "MAX_TOKENS": MAX_TOKENS,
+    "OVERLAP_TOKENS": OVERLAP_TOKENS,
+    "BOOK_PARTS": BOOK_PARTS,
+    "CHUNKS_PER_PART": CHUNKS_PER_PART,
+    **({"TOKENIZER": CHUNK_TOKENIZER} if CHUNK_TOKENIZER else {}),
+}
 
-    for file in os.listdir(IN_DIR):
-        if not file.endswith("_structured.json"):
+def iter_sections(chapters):
+    """Structured chapters -> (chapter_id, section) pairs"""
+    for chapter in chapters:
+        for section in chapter.get("sections", []):
+            yield chapter.get("chapter_id"), section
+
+def iter_chunks(sections):
+    """(chapter_id, section) pairs (any iterable) -> chunk dicts, one section at a time"""
+
+    # ✅ generate 21 nano book ids
+    book_part_ids = [
+        generate("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz", 21)
+        for _ in range(BOOK_PARTS)
+    ]
+
+    part_index = 0
+    part_chunk_count = 0
+
+    for chapter_id, section in sections:
+        content = section.get("content", [])
+        if len(content) < 5:
             continue
 
-        structured = json.load(open(os.path.join(IN_DIR, file), encoding="utf-8"))
+        section_name = section.get("heading", "General")
+        section_chunks = sized_chunks(content)
 
-        # ✅ generate 21 nano book ids
-        book_part_ids = [
-            generate("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz", 21)
-            for _ in range(BOOK_PARTS)
-        ]
+        for text, tokens in section_chunks:
+            if tokens < 120:
+                continue
 
-        part_index = 0
-        part_chunk_count = 0
-        chunks = []
+            yield {
+                "chunk_id": str(uuid.uuid4()),
+                "book_id": book_part_ids[part_index],  # ✅ ONLY CHANGE
+                "chapter_id": chapter_id,
+                "section": section_name,
+                "text": text
+            }
 
-        for chapter in structured.get("chapters", []):
-            chapter_id = chapter.get("chapter_id")
+            part_chunk_count += 1
+            if part_chunk_count >= CHUNKS_PER_PART and part_index < BOOK_PARTS - 1:
+                part_index += 1
+                part_chunk_count = 0
 
-            for section in chapter.get("sections", []):
-                content = section.get("content", [])
-                if len(content) < 5:
-                    continue
+def chunk_book(structured_path):
+    """<book>_structured.json -> <book>_chunks.json + manifest; returns chunks path"""
+    structured = json.load(open(structured_path, encoding="utf-8"))
+    chunks = list(iter_chunks(iter_sections(structured.get("chapters", []))))
 
-                section_name = section.get("heading", "General")
-                section_chunks = split_chunks(content)
+    book_name = os.path.basename(structured_path).replace('_structured.json', '')
+    out_path = os.path.join(OUT_DIR, f"{book_name}{CHUNKS_SUFFIX}")
+    json.dump(chunks, open(out_path, "w", encoding="utf-8"),
+              indent=2, ensure_ascii=False)
 
-                for text in section_chunks:
-                    if token_len(text) < 120:
-                        continue
+    # compact catalog sidecar (read by routes/book_routes.py)
+    write_manifest(out_path, build_manifest(book_name, chunks, token_len))
 
-                    chunks.append({
-                        "chunk_id": str(uuid.uuid4()),
-                        "book_id": book_part_ids[part_index],  # ✅ ONLY CHANGE
-                        "chapter_id": chapter_id,
-                        "section": section_name,
-                        "text": text
-                    })
+    print(f"✅ Clean chunks → nano book ids used ({len(chunks)})")
+    return out_path
 
-                    part_chunk_count += 1
-                    if part_chunk_count >= CHUNKS_PER_PART and part_index < BOOK_PARTS - 1:
-                        part_index += 1
-                        part_chunk_count = 0
+# -------------------------
+# MAIN
+# -------------------------
+if __name__ == "__main__":
+
+    # Backfill manifests for chunk files built before manifests existed
+    if "--manifests-only" in sys.argv:
+        for file in os.listdir(OUT_DIR):
+            if file.endswith(CHUNKS_SUFFIX):
+                chunks_path = os.path.join(OUT_DIR, file)
+                write_manifest(chunks_path, manifest_from_chunks_file(chunks_path, token_len))
+                print(f"✅ Manifest → {file}")
+        sys.exit(0)
 
-        out_path = os.path.join(OUT_DIR, f"{file.replace('_structured.json','')}_chunks.json")
-        json.dump(chunks, open(out_path, "w", encoding="utf-8"),
-                  indent=2, ensure_ascii=False)
+    for file in os.listdir(IN_DIR):
+        if not file.endswith("_structured.json"):
+            continue
 
-        print(f"✅ Clean chunks → nano book ids used ({len(chunks)})")
+        chunk_book(os.path.join(IN_DIR, file))
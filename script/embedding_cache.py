@@ -0,0 +1,104 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+
+# ----------------------------
+# QUERY EMBEDDING CACHE
+# ----------------------------
+# Two tiers keyed by (model name, normalized query):
+#   memory : LRU OrderedDict bounded by EMBED_CACHE_SIZE entries
+#   disk   : optional SQLite file (EMBED_CACHE_PATH) that survives restarts
+# Both tiers expire entries after EMBED_CACHE_TTL seconds.
+EMBED_CACHE_SIZE = int(os.getenv("EMBED_CACHE_SIZE", "10000"))
+EMBED_CACHE_TTL = float(os.getenv("EMBED_CACHE_TTL", str(7 * 24 * 3600)))
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH")  # unset -> memory only
+
+
+def normalize_query(text):
+    """Case/whitespace/trailing-punctuation insensitive form of a query"""
+    return " ".join(text.lower().split()).strip(" ?.!")
+
+
+def _key(model, text):
+    return hashlib.sha1(f"{model}\x00{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+
+    def __init__(self, max_size=EMBED_CACHE_SIZE, ttl=EMBED_CACHE_TTL, path=EMBED_CACHE_PATH):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._mem = OrderedDict()  # key -> (stored_at, vector)
+        self._lock = threading.Lock()
+        self._db = None
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0}
+
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " key TEXT PRIMARY KEY, model TEXT, stored_at REAL, vector BLOB)"
+            )
+            self._db.commit()
+
+    def get(self, model, text):
+        key = _key(model, text)
+        now = time.time()
+
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit is not None:
+                if now - hit[0] <= self.ttl:
+                    self._mem.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return hit[1]
+                del self._mem[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT stored_at, vector FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                if row and now - row[0] <= self.ttl:
+                    vector = array("f", row[1]).tolist()
+                    self._remember(key, row[0], vector)
+                    self.stats["disk_hits"] += 1
+                    return vector
+
+            self.stats["misses"] += 1
+            return None
+
+    def put(self, model, text, vector):
+        key = _key(model, text)
+        now = time.time()
+        vector = list(vector)
+
+        with self._lock:
+            self._remember(key, now, vector)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                    (key, model, now, array("f", vector).tobytes())
+                )
+                self._db.commit()
+
+    def _remember(self, key, stored_at, vector):
+        self._mem[key] = (stored_at, vector)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_size:
+            self._mem.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def info(self):
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "size": len(self._mem),
+            "max_size": self.max_size,
+            "disk": self._db is not None,
+            "hit_rate": round((lookups - self.stats["misses"]) / lookups, 3) if lookups else 0.0,
+        }
@@ -0,0 +1,109 @@
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from fastembed import TextEmbedding
+from embedding_cache import EmbeddingCache, normalize_query
+
+# ----------------------------
+# QUERY EMBEDDING SERVICE
+# ----------------------------
+# The fastembed ONNX forward pass is CPU-bound. Async callers go through
+# aembed_query(): queries that arrive within EMBED_MAX_WAIT_MS of each
+# other are collected into one embed() call, which runs on a bounded
+# thread pool (onnxruntime releases the GIL) instead of the event loop.
+# Both sync and async paths check the shared query cache first, so a
+# repeated question skips the ONNX forward pass entirely.
+EMBEDDING_MODEL = "BAAI/bge-small-en"
+
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", str(min(4, os.cpu_count() or 1))))
+EMBED_MAX_BATCH = int(os.getenv("EMBED_MAX_BATCH", "32"))
+EMBED_MAX_WAIT_MS = float(os.getenv("EMBED_MAX_WAIT_MS", "5"))
+
+_embedder = None
+_executor = ThreadPoolExecutor(max_workers=EMBED_WORKERS, thread_name_prefix="embed")
+
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
+        print("✅ Embedder loaded:", EMBEDDING_MODEL)
+    return _embedder
+
+
+def embed_texts(texts):
+    """Blocking batch embed -> list of float vectors (same order as texts)"""
+    return [list(map(float, v)) for v in get_embedder().embed(list(texts))]
+
+
+def embed_query(text):
+    """Blocking single-query embed, for CLI scripts"""
+    text = normalize_query(text)
+    vector = query_cache.get(EMBEDDING_MODEL, text)
+    if vector is None:
+        vector = embed_texts([text])[0]
+        query_cache.put(EMBEDDING_MODEL, text, vector)
+    return vector
+
+
+class QueryBatcher:
+    """Micro-batches concurrent query embeddings into single embed() calls"""
+
+    def __init__(self, max_batch=EMBED_MAX_BATCH, max_wait_ms=EMBED_MAX_WAIT_MS):
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = []
+        self._timer = None
+
+    async def embed(self, text):
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._pending.append((text, fut))
+
+        if len(self._pending) >= self.max_batch:
+            self._flush(loop)
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush, loop)
+
+        return await fut
+
+    def _flush(self, loop):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        # identical queries in one window are embedded once
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        job = loop.run_in_executor(_executor, embed_texts, unique)
+
+        def deliver(done):
+            try:
+                vectors = dict(zip(unique, done.result()))
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                return
+            for text, fut in batch:
+                if not fut.done():
+                    fut.set_result(vectors[text])
+
+        job.add_done_callback(deliver)
+
+
+_batcher = QueryBatcher()
+query_cache = EmbeddingCache()
+
+
+async def aembed_query(text):
+    """Non-blocking query embed for async request handlers"""
+    text = normalize_query(text)
+    vector = query_cache.get(EMBEDDING_MODEL, text)
+    if vector is None:
+        vector = await _batcher.embed(text)
+        query_cache.put(EMBEDDING_MODEL, text, vector)
+    return vector
@@ -0,0 +1,121 @@
+import os
+import re
+import json
+import hashlib
+import numpy as np
+
+# =========================================================
+# ON-DISK EMBEDDING STORE
+# =========================================================
+# Append-only matrix of chunk vectors, one store per embedding version:
+#
+#   data/index/embeddings/<version>/vectors.bin   raw float32/float16 rows
+#   data/index/embeddings/<version>/index.json    chunk hash -> row, dim, dtype
+#
+# vectors.bin is memory-mapped for reads, so a collection rebuild or a new
+# Qdrant instance can be filled from disk without running the model.
+
+def chunk_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _safe_name(version):
+    return re.sub(r"[^A-Za-z0-9._-]+", "_", version).strip("_")[:80] + "-" + \
+        hashlib.sha1(version.encode("utf-8")).hexdigest()[:8]
+
+
+class EmbeddingStore:
+
+    def __init__(self, root, version, dim, dtype="float32"):
+        self.dir = os.path.join(root, _safe_name(version))
+        self.version = version
+        self.dim = dim
+        self.dtype = np.dtype(dtype)
+        self.vectors_path = os.path.join(self.dir, "vectors.bin")
+        self.index_path = os.path.join(self.dir, "index.json")
+        self.rows = {}
+        self._matrix = None
+        os.makedirs(self.dir, exist_ok=True)
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["dim"] != dim or meta["dtype"] != self.dtype.name:
+                raise ValueError(f"Embedding store {self.dir} has dim={meta['dim']} "
+                                 f"dtype={meta['dtype']}, expected dim={dim} dtype={self.dtype.name}")
+            self.rows = meta["rows"]
+
+        # drop rows written after the last flush (crash between append and flush)
+        expected = len(self.rows) * self.dim * self.dtype.itemsize
+        if os.path.exists(self.vectors_path) and os.path.getsize(self.vectors_path) != expected:
+            with open(self.vectors_path, "r+b") as f:
+                f.truncate(expected)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def matrix(self):
+        """Read-only memory map of all stored rows"""
+        if self._matrix is None or self._matrix.shape[0] != len(self.rows):
+            if not self.rows:
+                return np.empty((0, self.dim), dtype=self.dtype)
+            self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r",
+                                     shape=(len(self.rows), self.dim))
+        return self._matrix
+
+    def lookup(self, keys):
+        """-> (positions in keys that were found, float32 vectors for them)"""
+        found = [(i, self.rows[k]) for i, k in enumerate(keys) if k in self.rows]
+        if not found:
+            return [], np.empty((0, self.dim), dtype=np.float32)
+        positions, rows = zip(*found)
+        return list(positions), np.asarray(self.matrix()[list(rows)], dtype=np.float32)
+
+    def add(self, keys, vectors):
+        """Append vectors for keys not already stored (first vector wins for a repeated key)"""
+        vectors = np.asarray(vectors)
+        new = {}
+        for k, v in zip(keys, vectors):
+            if k not in self.rows and k not in new:
+                new[k] = v
+        new = list(new.items())
+        if not new:
+            return 0
+        block = np.stack([v for _, v in new]).astype(self.dtype, copy=False)
+        with open(self.vectors_path, "ab") as f:
+            f.write(block.tobytes())
+        for k, _ in new:
+            self.rows[k] = len(self.rows)
+        return len(new)
+
+    def flush(self):
+        tmp = self.index_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": self.version,
+                "dim": self.dim,
+                "dtype": self.dtype.name,
+                "rows": self.rows
+            }, f)
+        os.replace(tmp, self.index_path)
+
+    def compact(self, keep_keys):
+        """Rewrite the store with only keep_keys (drops vectors of deleted chunks)"""
+        keep = [k for k in dict.fromkeys(keep_keys) if k in self.rows]
+        if len(keep) == len(self.rows):
+            return 0
+        data = np.asarray(self.matrix()[[self.rows[k] for k in keep]]) if keep \
+            else np.empty((0, self.dim), dtype=self.dtype)
+        removed = len(self.rows) - len(keep)
+
+        self._matrix = None
+        tmp = self.vectors_path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data.astype(self.dtype, copy=False).tobytes())
+        os.replace(tmp, self.vectors_path)
+        self.rows = {k: i for i, k in enumerate(keep)}
+        self.flush()
+        return removed
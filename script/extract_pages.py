@@ -2,35 +2,175 @@ import fitz
 import os
 import json
 import re
+import shutil
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 PDF_DIR = os.path.join(BASE_DIR, "data/pdfs")
 OUT_DIR = os.path.join(BASE_DIR, "data/pages")
 os.makedirs(OUT_DIR, exist_ok=True)
 
+STAGE_VERSION = 2  # bump when page output changes for the same PDF
+WORKERS = os.cpu_count() or 1
+SHARD_PAGES = 300   # books longer than this are split into page ranges
+
+BOLD_FLAG = 16     # PyMuPDF span flag bit
+BOLD_FONTS = ("bold", "black", "heavy", "semibold", "demi")
+
 def clean(text):
     return re.sub(r"\s+", " ", text).strip()
 
-def extract_pdf(pdf_path):
-    book_id = os.path.splitext(os.path.basename(pdf_path))[0]
-    doc = fitz.open(pdf_path)
-    pages = []
-
-    for i, page in enumerate(doc):
-        text = page.get_text()
-        if text:
-            pages.append({
-                "page_no": i + 1,
-                "text": clean(text)
+# -------------------------
+# PAGE READERS
+# -------------------------
+def is_bold(span):
+    # some PDFs only say it in the font name (Arial-BoldMT without the flag)
+    return bool(span["flags"] & BOLD_FLAG) or any(w in span["font"].lower() for w in BOLD_FONTS)
+
+def page_lines(page):
+    """Visual lines of a page in reading order: {"text", "size", "bold"}
+
+    size is the font size covering most of the line's characters, bold is
+    true only when every non-blank span is bold.
+    """
+    lines = []
+    # TEXTFLAGS_TEXT leaves image blocks out of the dict (most of its cost)
+    for block in page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)["blocks"]:
+        for line in block.get("lines", ()):
+            spans = [s for s in line["spans"] if s["text"].strip()]
+            if not spans:
+                continue
+            text = clean("".join(s["text"] for s in line["spans"]))
+            widths = {}
+            for s in spans:
+                size = round(s["size"], 1)
+                widths[size] = widths.get(size, 0) + len(s["text"])
+            lines.append({
+                "text": text,
+                "size": max(widths, key=widths.get),
+                "bold": all(is_bold(s) for s in spans)
             })
+    return lines
+
+def iter_pages(pdf_path, start=0, end=None):
+    """Yield {"page_no", "text", "lines"} for pages [start, end) one at a time
+
+    text is the page's lines joined with newlines; lines keep the font
+    size / weight the structure builder uses to find headings.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        end = doc.page_count if end is None else min(end, doc.page_count)
+        for i in range(start, end):
+            lines = page_lines(doc.load_page(i))
+            if lines:
+                yield {
+                    "page_no": i + 1,
+                    "text": "\n".join(l["text"] for l in lines),
+                    "lines": lines
+                }
+    finally:
+        doc.close()
+
+# -------------------------
+# WRITERS
+# -------------------------
+def write_jsonl(pages, out_path):
+    """Stream pages to newline-delimited JSON; memory stays one page"""
+    count = 0
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for page in pages:
+            f.write(json.dumps(page, ensure_ascii=False))
+            f.write("\n")
+            count += 1
+    os.replace(tmp, out_path)
+    return count
+
+def extract_range(pdf_path, start, end, out_path):
+    """Worker task: one page range of one PDF -> jsonl file"""
+    return write_jsonl(iter_pages(pdf_path, start, end), out_path)
 
-    out = os.path.join(OUT_DIR, f"{book_id}_pages.json")
-    json.dump(pages, open(out, "w", encoding="utf-8"),
-              indent=2, ensure_ascii=False)
+def extract_pdf(pdf_path, fmt="jsonl"):
+    """Single-process extraction of one book"""
+    book_id = os.path.splitext(os.path.basename(pdf_path))[0]
+
+    if fmt == "json":
+        pages = list(iter_pages(pdf_path))
+        out = os.path.join(OUT_DIR, f"{book_id}_pages.json")
+        json.dump(pages, open(out, "w", encoding="utf-8"),
+                  indent=2, ensure_ascii=False)
+    else:
+        out = os.path.join(OUT_DIR, f"{book_id}_pages.jsonl")
+        write_jsonl(iter_pages(pdf_path), out)
 
     print(f"✅ Pages extracted → {book_id}")
+    return out
+
+# -------------------------
+# PARALLEL EXTRACTION
+# -------------------------
+def plan_shards(pdf_path):
+    doc = fitz.open(pdf_path)
+    count = doc.page_count
+    doc.close()
+    return [(s, min(s + SHARD_PAGES, count)) for s in range(0, count, SHARD_PAGES)] or [(0, 0)]
+
+def extract_all(pdf_paths, workers=WORKERS):
+    """One process per PDF, large PDFs split into SHARD_PAGES page ranges.
+
+    Each shard streams to its own part file; parts are concatenated in
+    page order into <book>_pages.jsonl once the book is complete.
+    """
+    books = {}
+    tasks = []
+    for pdf_path in pdf_paths:
+        book_id = os.path.splitext(os.path.basename(pdf_path))[0]
+        shards = plan_shards(pdf_path)
+        parts = [os.path.join(OUT_DIR, f"{book_id}_pages.part{k:04}.jsonl") for k in range(len(shards))]
+        books[book_id] = {"parts": parts, "remaining": len(parts), "pages": 0}
+        for (start, end), part in zip(shards, parts):
+            tasks.append((book_id, pdf_path, start, end, part))
+
+    outputs = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(extract_range, pdf_path, start, end, part): book_id
+            for book_id, pdf_path, start, end, part in tasks
+        }
+        for fut in as_completed(futures):
+            book_id = futures[fut]
+            book = books[book_id]
+            book["pages"] += fut.result()
+            book["remaining"] -= 1
+            if book["remaining"]:
+                continue
+
+            out = os.path.join(OUT_DIR, f"{book_id}_pages.jsonl")
+            with open(out + ".tmp", "wb") as dst:
+                for part in book["parts"]:
+                    with open(part, "rb") as src:
+                        shutil.copyfileobj(src, dst)
+                    os.remove(part)
+            os.replace(out + ".tmp", out)
+            outputs.append(out)
+            print(f"✅ Pages extracted → {book_id} ({book['pages']} pages, {len(book['parts'])} shards)")
+
+    return outputs
 
 if __name__ == "__main__":
-    for pdf in os.listdir(PDF_DIR):
-        if pdf.lower().endswith(".pdf"):
-            extract_pdf(os.path.join(PDF_DIR, pdf))
+    parser = argparse.ArgumentParser(description="Extract PDF pages to data/pages")
+    parser.add_argument("--workers", type=int, default=WORKERS,
+                        help="parallel processes (1 = sequential)")
+    parser.add_argument("--format", choices=["jsonl", "json"], default="jsonl",
+                        help="jsonl streams pages; json writes the old indented array")
+    args = parser.parse_args()
+
+    pdfs = [os.path.join(PDF_DIR, p) for p in sorted(os.listdir(PDF_DIR)) if p.lower().endswith(".pdf")]
+
+    if args.format == "json" or args.workers <= 1:
+        for pdf in pdfs:
+            extract_pdf(pdf, args.format)
+    else:
+        extract_all(pdfs, args.workers)
@@ -0,0 +1,156 @@
+import os
+import json
+import asyncio
+import traceback
+import httpx
+from dotenv import load_dotenv
+
+# ----------------------------
+# SHARED ASYNC GROK CLIENT
+# ----------------------------
+# One pooled HTTP client for every route. Calls are awaited, so a slow
+# completion no longer blocks the uvicorn event loop, connections are
+# reused (no TCP/TLS handshake per request) and a semaphore caps how many
+# completions are in flight at once.
+load_dotenv()
+
+GROK_API_KEY = os.getenv("GROK_API_KEY")
+GROK_URL = os.getenv("GROK_URL", "https://api.x.ai/v1/chat/completions")
+GROK_MODEL = os.getenv("GROK_MODEL", "grok-3")
+
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+CONNECT_TIMEOUT = 10
+
+# read timeout (seconds) per route
+ROUTE_TIMEOUTS = {
+    "chat": 30,
+    "lesson": 60,
+    "exam": 120,
+    "default": 60,
+}
+
+_client = None
+_semaphore = None
+
+
+def get_client():
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONCURRENCY,
+                max_keepalive_connections=MAX_CONCURRENCY,
+            ),
+            timeout=httpx.Timeout(ROUTE_TIMEOUTS["default"], connect=CONNECT_TIMEOUT),
+        )
+    return _client
+
+
+def _get_semaphore():
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    return _semaphore
+
+
+async def close_client():
+    global _client
+    if _client is not None and not _client.is_closed:
+        await _client.aclose()
+    _client = None
+
+
+def _headers():
+    return {
+        "Authorization": f"Bearer {GROK_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+def _payload(prompt, max_tokens, temperature, response_format=None):
+    payload = {
+        "model": GROK_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": max_tokens
+    }
+    if temperature is not None:
+        payload["temperature"] = temperature
+    if response_format is not None:
+        payload["response_format"] = response_format   # e.g. {"type": "json_object"}
+    return payload
+
+
+async def ask_grok(prompt: str, max_tokens: int = 1000, temperature: float = None,
+                   route: str = "default", timeout: float = None, response_format: dict = None):
+    """Send one completion request; returns the answer text or None on failure"""
+    if not prompt.strip():
+        print("❌ Cannot send empty prompt to Grok")
+        return None
+
+    read_timeout = timeout or ROUTE_TIMEOUTS.get(route, ROUTE_TIMEOUTS["default"])
+    print(f"\n🤖 Calling Grok [{route}] prompt={len(prompt)} chars, max_tokens={max_tokens}")
+
+    try:
+        async with _get_semaphore():
+            r = await get_client().post(
+                GROK_URL,
+                headers=_headers(),
+                json=_payload(prompt, max_tokens, temperature, response_format),
+                timeout=httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT),
+            )
+        print("📡 Grok status:", r.status_code)
+
+        if r.status_code != 200:
+            print(f"❌ Grok API error: {r.text[:500]}")
+            return None
+
+        content = r.json()["choices"][0]["message"]["content"]
+
+        # Grok content may be list or string
+        if isinstance(content, list):
+            content = content[0].get("text", "")
+
+        return content
+
+    except Exception:
+        print("❌ Grok call exception:")
+        traceback.print_exc()
+        return None
+
+
+async def stream_grok(prompt: str, max_tokens: int = 1000, temperature: float = None,
+                      route: str = "default", timeout: float = None, response_format: dict = None):
+    """Streaming completion; async generator of text deltas as they arrive"""
+    if not prompt.strip():
+        print("❌ Cannot send empty prompt to Grok")
+        return
+
+    read_timeout = timeout or ROUTE_TIMEOUTS.get(route, ROUTE_TIMEOUTS["default"])
+    payload = _payload(prompt, max_tokens, temperature, response_format)
+    payload["stream"] = True
+    print(f"\n🤖 Streaming Grok [{route}] prompt={len(prompt)} chars, max_tokens={max_tokens}")
+
+    async with _get_semaphore():
+        async with get_client().stream(
+            "POST",
+            GROK_URL,
+            headers=_headers(),
+            json=payload,
+            timeout=httpx.Timeout(read_timeout, connect=CONNECT_TIMEOUT),
+        ) as r:
+            if r.status_code != 200:
+                body = await r.aread()
+                raise RuntimeError(f"Grok API error {r.status_code}: {body[:500]!r}")
+
+            async for line in r.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[5:].strip()
+                if data == "[DONE]":
+                    break
+                try:
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                except (ValueError, KeyError, IndexError):
+                    continue
+                if delta:
+                    yield delta
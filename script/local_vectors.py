@@ -0,0 +1,288 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import namedtuple
+import numpy as np
+
+# =========================================================
+# IN-PROCESS VECTOR BACKEND
+# =========================================================
+# Same chunks, same vectors as the Qdrant collection, searched inside the
+# process - no network hop, no server:
+#
+#   data/index/local/vectors.npy   float32 unit rows, one per chunk (memmap)
+#   data/index/local/docs.json     point id + payload per row, source signature
+#   data/index/local/hnsw.bin      optional approximate graph index (hnswlib)
+#
+# Vectors come from vector_embed's embedding store, so building the index
+# normally runs no model at all. LocalVectorIndex.search() has the call
+# shape of QdrantClient.search(), which lets retrieval.py use either one.
+#
+#   VECTOR_BACKEND=auto    Qdrant if reachable, else local (default)
+#   VECTOR_BACKEND=qdrant  always Qdrant
+#   VECTOR_BACKEND=local   never touch Qdrant
+#   VECTOR_ANN=hnsw        graph search for unfiltered queries once the
+#                          corpus has ANN_MIN_SIZE rows (needs hnswlib)
+#
+# A running process re-checks the chunk files every INDEX_CHECK_INTERVAL
+# seconds and swaps in a rebuilt index when they changed.
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNKS_DIR = os.path.join(BASE_DIR, "data", "chunks")
+LOCAL_DIR = os.path.join(BASE_DIR, "data", "index", "local")
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "auto")
+VECTOR_ANN = os.getenv("VECTOR_ANN", "")
+ANN_MIN_SIZE = int(os.getenv("ANN_MIN_SIZE", "20000"))
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "64"))
+INDEX_CHECK_INTERVAL = 2.0   # seconds between chunk file staleness checks
+
+ScoredPoint = namedtuple("ScoredPoint", "id score payload")
+
+
+def source_signature():
+    files = sorted(f for f in os.listdir(CHUNKS_DIR) if f.endswith("_chunks.json"))
+    return [[f, os.path.getsize(os.path.join(CHUNKS_DIR, f)),
+             os.stat(os.path.join(CHUNKS_DIR, f)).st_mtime_ns] for f in files]
+
+
+def _conditions(query_filter):
+    """Qdrant Filter(must=[FieldCondition(key, MatchValue)]) -> ((key, value), ...)"""
+    if query_filter is None:
+        return ()
+    return tuple((c.key, c.match.value) for c in (query_filter.must or []))
+
+
+class LocalVectorIndex:
+
+    def __init__(self, vectors, ids, payloads, version=None, signature=None):
+        self.vectors = vectors      # (n, dim) float32, unit rows
+        self.ids = ids
+        self.payloads = payloads
+        self.version = version
+        self.signature = signature
+        self.ann = None
+        self._subsets = {}          # filter conditions -> row indexes
+
+    def __len__(self):
+        return len(self.ids)
+
+    # ---------------- build / persist ----------------
+    @classmethod
+    def from_arrays(cls, vectors, ids, payloads, version=None, signature=None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return cls(vectors / np.where(norms == 0, 1, norms), list(ids), list(payloads),
+                   version, signature)
+
+    @classmethod
+    def build(cls, model=None):
+        """Chunks + embedding store -> index; encodes only chunks missing from the store"""
+        import vector_embed as ve
+        from embedding_store import chunk_hash
+
+        signature = source_signature()
+        chunks = list({ve.point_id(c["text"]): c for c in ve.load_chunks()}.values())
+        keys = [chunk_hash(c["text"]) for c in chunks]
+        store = ve.open_store()
+
+        vectors = np.zeros((len(chunks), ve.VECTOR_DIM), dtype=np.float32)
+        positions, stored = store.lookup(keys)
+        if positions:
+            vectors[positions] = stored
+
+        found = set(positions)
+        missing = [i for i in range(len(chunks)) if i not in found]
+        if missing:
+            print(f"[INFO] {len(missing)} chunks not in the embedding store, encoding")
+            model = model or ve.load_model()
+            texts = [chunks[i]["text"] for i in missing]
+            for start, encoded in ve.encode_batches(model, texts):
+                rows = missing[start:start + len(encoded)]
+                vectors[rows] = encoded
+                store.add([keys[i] for i in rows], encoded)
+            store.flush()
+
+        return cls.from_arrays(vectors, [ve.point_id(c["text"]) for c in chunks],
+                               [ve.payload_for(c) for c in chunks], ve.EMBED_VERSION, signature)
+
+    def save(self, out_dir=LOCAL_DIR):
+        os.makedirs(out_dir, exist_ok=True)
+        np.save(os.path.join(out_dir, "vectors.npy"), self.vectors)
+        if self.ann is not None:
+            self.ann.save_index(os.path.join(out_dir, "hnsw.bin"))
+        tmp = os.path.join(out_dir, "docs.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"version": self.version, "signature": self.signature,
+                       "ann": self.ann is not None, "ids": self.ids, "payloads": self.payloads},
+                      f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, os.path.join(out_dir, "docs.json"))  # written last: marks a complete index
+
+    @classmethod
+    def load(cls, in_dir=LOCAL_DIR):
+        with open(os.path.join(in_dir, "docs.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = np.load(os.path.join(in_dir, "vectors.npy"), mmap_mode="r")
+        index = cls(vectors, meta["ids"], meta["payloads"], meta["version"], meta["signature"])
+        if meta.get("ann") and os.path.exists(os.path.join(in_dir, "hnsw.bin")):
+            index.ann = _hnsw_index(vectors.shape[1])
+            index.ann.load_index(os.path.join(in_dir, "hnsw.bin"), max_elements=len(index))
+            index.ann.set_ef(HNSW_EF_SEARCH)
+        return index
+
+    # ---------------- approximate graph index ----------------
+    def build_ann(self):
+        """HNSW graph over the rows (inner product == cosine on unit rows)"""
+        ann = _hnsw_index(self.vectors.shape[1])
+        ann.init_index(max_elements=max(1, len(self)), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+        if len(self):
+            ann.add_items(np.asarray(self.vectors), np.arange(len(self)))
+        ann.set_ef(HNSW_EF_SEARCH)
+        self.ann = ann
+        return ann
+
+    # ---------------- search ----------------
+    def subset(self, conditions):
+        rows = self._subsets.get(conditions)
+        if rows is None:
+            if len(self._subsets) > 1024:
+                self._subsets.clear()
+            rows = self._subsets[conditions] = np.fromiter(
+                (i for i, p in enumerate(self.payloads)
+                 if all(p.get(k) == v for k, v in conditions)),
+                dtype=np.int64
+            )
+        return rows
+
+    def search(self, collection_name=None, query_vector=None, limit=10, query_filter=None, exact=False):
+        """QdrantClient.search() look-alike -> [ScoredPoint(id, score, payload)] best first"""
+        q = np.asarray(query_vector, dtype=np.float32)
+        q = q / (np.linalg.norm(q) or 1.0)
+        conditions = _conditions(query_filter)
+
+        if self.ann is not None and not conditions and not exact:
+            k = min(limit, len(self))
+            if not k:
+                return []
+            labels, distances = self.ann.knn_query(q, k=k)
+            return [ScoredPoint(self.ids[i], float(1 - d), self.payloads[i])
+                    for i, d in zip(labels[0], distances[0])]
+
+        if conditions:
+            rows = self.subset(conditions)
+            scores = np.asarray(self.vectors[rows]) @ q
+        else:
+            rows = None
+            scores = self.vectors @ q
+        if not len(scores):
+            return []
+
+        k = min(limit, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [ScoredPoint(self.ids[i if rows is None else rows[i]], float(scores[i]),
+                            self.payloads[i if rows is None else rows[i]]) for i in top]
+
+
+def _hnsw_index(dim):
+    import hnswlib   # optional dependency, only for VECTOR_ANN=hnsw
+    return hnswlib.Index(space="ip", dim=dim)
+
+# =========================================================
+# SHARED INSTANCE + BACKEND CHOICE
+# =========================================================
+_index = None
+_checked_at = 0.0
+_lock = threading.Lock()
+_clients = {}               # url -> chosen backend, so routes share one probe
+
+
+def want_ann(n):
+    return VECTOR_ANN == "hnsw" and n >= ANN_MIN_SIZE
+
+
+def _load_or_build(signature):
+    if os.path.exists(os.path.join(LOCAL_DIR, "docs.json")):
+        index = LocalVectorIndex.load()
+        if index.signature == signature and not (index.ann is None and want_ann(len(index))):
+            return index
+    t = time.perf_counter()
+    index = LocalVectorIndex.build()
+    if want_ann(len(index)):
+        index.build_ann()
+    index.save()
+    print(f"✅ Local vector index built: {len(index)} chunks"
+          f"{' + hnsw' if index.ann is not None else ''} ({time.perf_counter() - t:.2f}s)")
+    return index
+
+
+def get_index():
+    """Process-wide local index: loaded from disk, rebuilt and swapped when the chunks change.
+
+    While one thread checks or rebuilds, the others keep searching the
+    index they already have.
+    """
+    global _index, _checked_at
+    if _index is not None and time.monotonic() - _checked_at < INDEX_CHECK_INTERVAL:
+        return _index
+    if not _lock.acquire(blocking=_index is None):
+        return _index
+    try:
+        signature = source_signature()
+        if _index is None or _index.signature != signature:
+            _index = _load_or_build(signature)
+        _checked_at = time.monotonic()
+    finally:
+        _lock.release()
+    return _index
+
+
+class LocalBackend:
+    """Handed out by get_vector_client(): searches whatever get_index() currently holds"""
+
+    def search(self, *args, **kwargs):
+        return get_index().search(*args, **kwargs)
+
+    def __len__(self):
+        return len(get_index())
+
+
+def get_vector_client(url=None, collection_name="medical_chunks"):
+    """QdrantClient, or the local index when VECTOR_BACKEND says so / Qdrant is down"""
+    client = _clients.get(url)
+    if client is None:
+        client = _clients[url] = _choose_backend(url, collection_name)
+    return client
+
+
+def _choose_backend(url, collection_name):
+    if VECTOR_BACKEND != "local":
+        from qdrant_client import QdrantClient
+        try:
+            client = QdrantClient(url=url, timeout=5)
+            if VECTOR_BACKEND == "qdrant" or client.collection_exists(collection_name):
+                print("✅ Vector backend: Qdrant", url)
+                return client
+            print(f"⚠️ Qdrant has no '{collection_name}' collection")
+        except Exception as e:
+            if VECTOR_BACKEND == "qdrant":
+                raise
+            print("⚠️ Qdrant unreachable:", e)
+
+    index = get_index()
+    print(f"✅ Vector backend: local ({len(index)} chunks, "
+          f"{'hnsw' if index.ann is not None else 'exact'})")
+    return LocalBackend()
+
+
+if __name__ == "__main__":
+    # python local_vectors.py [--ann]   -> (re)build data/index/local
+    index = LocalVectorIndex.build()
+    if "--ann" in sys.argv or want_ann(len(index)):
+        index.build_ann()
+    index.save()
+    print(f"✅ Local vector index: {len(index)} chunks"
+          f"{' + hnsw' if index.ann is not None else ''} → {LOCAL_DIR}")
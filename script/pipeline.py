@@ -0,0 +1,438 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+
+# =========================================================
+# INGESTION PIPELINE RUNNER
+# =========================================================
+# Runs extract -> structure -> chunk -> embed, skipping unchanged work.
+#
+# data/build_manifest.json records, per book and stage, the hash of the
+# stage input, the stage version and its config (MAX_TOKENS, ...). A stage
+# re-runs for a book only if one of those changed or its output is gone,
+# so after editing one book a rebuild costs time for that book only.
+#
+#   python pipeline.py                       # all stages, changed books only
+#   python pipeline.py --stages chunk,embed  # subset of stages
+#   python pipeline.py --book bone --force   # force one book
+#   python pipeline.py --stream --watch      # PDF -> Qdrant, no intermediate files
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA_DIR = os.path.join(BASE_DIR, "data")
+BUILD_MANIFEST = os.path.join(DATA_DIR, "build_manifest.json")
+STAGE_ORDER = ["extract", "structure", "chunk", "embed"]
+
+
+# ---------------------------------------------------------
+# BUILD MANIFEST
+# ---------------------------------------------------------
+def _rel(path):
+    """Paths are stored relative to the project root (portable manifest)"""
+    return os.path.relpath(os.path.abspath(path), BASE_DIR)
+
+
+class BuildManifest:
+
+    def __init__(self, path=BUILD_MANIFEST):
+        self.path = path
+        self.data = {"files": {}, "books": {}}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+
+    def save(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+    def file_hash(self, path):
+        """Content hash, re-read only when (size, mtime) changed"""
+        st = os.stat(path)
+        stat = [st.st_size, st.st_mtime_ns]
+        key = _rel(path)
+        cached = self.data["files"].get(key)
+        if cached and cached["stat"] == stat:
+            return cached["sha1"]
+
+        h = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        self.data["files"][key] = {"stat": stat, "sha1": h.hexdigest()}
+        return h.hexdigest()
+
+    def record_for(self, book, stage):
+        return self.data["books"].get(book, {}).get(stage)
+
+    def is_fresh(self, book, stage, input_hash, version, config):
+        rec = self.record_for(book, stage)
+        return bool(rec) \
+            and rec["input"] == input_hash \
+            and rec["version"] == version \
+            and rec["config"] == config \
+            and all(os.path.exists(os.path.join(BASE_DIR, p)) for p in rec["outputs"])
+
+    def record(self, book, stage, input_hash, version, config, outputs):
+        self.data["books"].setdefault(book, {})[stage] = {
+            "input": input_hash,
+            "version": version,
+            "config": config,
+            "outputs": [_rel(p) for p in outputs],
+            "built_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+
+    def forget_missing(self, stage, books):
+        """Drop records of books whose stage input no longer exists"""
+        for book, stages in self.data["books"].items():
+            if book not in books:
+                stages.pop(stage, None)
+
+
+# ---------------------------------------------------------
+# STAGES
+# ---------------------------------------------------------
+# Each stage: inputs() -> {book: input path}, run(book, path) -> [outputs],
+# version, config. Modules are imported lazily so e.g. re-chunking does
+# not need PyMuPDF or the embedding model installed.
+def _files(folder, suffixes):
+    found = {}
+    if not os.path.isdir(folder):
+        return found
+    for file in sorted(os.listdir(folder)):
+        for suffix in suffixes:
+            if file.endswith(suffix):
+                found[file[: -len(suffix)]] = os.path.join(folder, file)
+    return found
+
+
+def extract_stage():
+    import extract_pages as ep
+
+    def inputs():
+        return _files(ep.PDF_DIR, [".pdf", ".PDF"])
+
+    def run(book, path):
+        return [ep.extract_pdf(path)]
+
+    return inputs, run, ep.STAGE_VERSION, {}
+
+
+def structure_stage():
+    import structure_builder as sb
+
+    def inputs():
+        return sb.page_files(sb.IN_DIR)
+
+    def run(book, path):
+        return [sb.structure_book(book, path)]
+
+    return inputs, run, sb.STAGE_VERSION, {}
+
+
+def chunk_stage():
+    import chunker_builder as cb
+    from catalog_manifest import manifest_path_for
+
+    def inputs():
+        return _files(cb.IN_DIR, ["_structured.json"])
+
+    def run(book, path):
+        out = cb.chunk_book(path)
+        return [out, manifest_path_for(out)]
+
+    return inputs, run, cb.STAGE_VERSION, cb.STAGE_CONFIG
+
+
+STAGES = {
+    "extract": extract_stage,
+    "structure": structure_stage,
+    "chunk": chunk_stage,
+}
+
+
+def run_book_stage(manifest, stage, only_books, force):
+    inputs, run, version, config = STAGES[stage]()
+    books = inputs()
+    manifest.forget_missing(stage, books)
+
+    ran, skipped = [], []
+    for book, path in books.items():
+        if only_books and book not in only_books:
+            continue
+        input_hash = manifest.file_hash(path)
+        if not force and manifest.is_fresh(book, stage, input_hash, version, config):
+            skipped.append(book)
+            continue
+
+        t = time.perf_counter()
+        outputs = run(book, path)
+        manifest.record(book, stage, input_hash, version, config, outputs)
+        manifest.save()
+        ran.append(book)
+        print(f"   [{stage}] {book} rebuilt in {time.perf_counter() - t:.2f}s")
+
+    print(f"🔁 {stage}: {len(ran)} rebuilt, {len(skipped)} unchanged")
+    return ran
+
+
+def run_embed_stage(manifest, force):
+    """Embedding is collection-wide: sync once if any book's chunks changed.
+
+    vector_embed's content-addressed sync then only encodes new chunks.
+    """
+    import vector_embed as ve
+
+    books = _files(ve.CHUNKS_DIR, ["_chunks.json"])
+    config = {"collection": ve.COLLECTION_NAME}
+    hashes = {book: manifest.file_hash(path) for book, path in books.items()}
+
+    recorded = {b for b, s in manifest.data["books"].items() if "embed" in s}
+    changed = [
+        b for b in books
+        if force or not manifest.is_fresh(b, "embed", hashes[b], ve.EMBED_VERSION, config)
+    ]
+    removed = recorded - set(books)
+    if not changed and not removed:
+        print("🔁 embed: 0 rebuilt, all unchanged")
+        return []
+
+    client = ve.get_client()
+    existing = ve.existing_points(client, ve.ensure_collection(client))
+
+    stats = ve.sync_collection(client, ve.load_chunks(), existing, store=ve.open_store())
+    if stats["failed"]:
+        print(f"❌ embed: {stats['failed']} uploads failed, manifest not updated")
+        return []
+
+    manifest.forget_missing("embed", books)
+    for book in changed:
+        manifest.record(book, "embed", hashes[book], ve.EMBED_VERSION, config, [ve.INDEX_MANIFEST])
+    manifest.save()
+    print(f"🔁 embed: {len(changed)} books changed, {len(removed)} removed")
+    return changed
+
+
+# ---------------------------------------------------------
+# STREAMING MODE
+# ---------------------------------------------------------
+# One book flows PDF -> pages -> sections -> chunks -> vectors -> Qdrant as
+# a chain of generators; nothing upstream of the chunks is materialized,
+# so peak memory is one section plus one STREAM_BATCH of chunks. The chunk
+# file (read by the catalog and retrieval) is written as chunks go by;
+# pages/sections are only written with --debug-outputs.
+STREAM_BATCH = 128
+WATCH_INTERVAL = 5  # seconds between data/pdfs polls in --watch mode
+
+
+def _tee_jsonl(items, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for item in items:
+            f.write(json.dumps(item, ensure_ascii=False) + "\n")
+            yield item
+
+
+class ChunkFileWriter:
+    """Writes a JSON array one chunk at a time (same format readers expect)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.f = open(path + ".tmp", "w", encoding="utf-8")
+        self.f.write("[")
+        self.count = 0
+
+    def write(self, chunk):
+        self.f.write(",\n" if self.count else "\n")
+        self.f.write(json.dumps(chunk, ensure_ascii=False))
+        self.count += 1
+
+    def close(self):
+        """Finish the array and replace the previous chunk file"""
+        self.f.write("\n]")
+        self.f.close()
+        os.replace(self.path + ".tmp", self.path)
+
+    def abort(self):
+        """Drop the partial output; the previous chunk file stays in place"""
+        self.f.close()
+        os.remove(self.path + ".tmp")
+
+
+def stream_version():
+    import extract_pages as ep
+    import structure_builder as sb
+    import chunker_builder as cb
+    import vector_embed as ve
+    return f"{ep.STAGE_VERSION}.{sb.STAGE_VERSION}.{cb.STAGE_VERSION}|{ve.EMBED_VERSION}"
+
+
+def stream_book(pdf_path, client, store, existing, books, model=None, debug=False):
+    """Stream one PDF into the collection; returns (outputs, model).
+
+    existing (point id -> payload hash) and books (book -> point ids) are
+    updated in place; points of the book's previous chunks that the new
+    output no longer has are deleted once the whole book went through.
+    The chunk file and the catalog / index manifests are only written when
+    the whole book went through; a failed run leaves the previous ones.
+    """
+    import extract_pages as ep
+    import structure_builder as sb
+    import chunker_builder as cb
+    import vector_embed as ve
+    from catalog_manifest import ManifestBuilder, write_manifest
+
+    book = os.path.splitext(os.path.basename(pdf_path))[0]
+    t0 = time.perf_counter()
+
+    pages = ep.iter_pages(pdf_path)
+    if debug:
+        pages = _tee_jsonl(pages, os.path.join(ep.OUT_DIR, f"{book}_pages.jsonl"))
+    sections = sb.iter_sections(pages)
+    if debug:
+        os.makedirs(sb.OUT_DIR, exist_ok=True)
+        sections = _tee_jsonl(sections, os.path.join(sb.OUT_DIR, f"{book}_sections.jsonl"))
+
+    chunks_path = os.path.join(cb.OUT_DIR, f"{book}{cb.CHUNKS_SUFFIX}")
+    writer = ChunkFileWriter(chunks_path)
+    catalog = ManifestBuilder(book, cb.token_len)
+    batch = []
+    current, failed = {}, set()     # this book's point ids, in chunk order
+    stats = {"chunks": 0, "uploaded": 0, "payload_updates": 0, "skipped": 0, "deleted": 0}
+
+    def flush():
+        nonlocal model
+        new, payload_updates = [], {}
+        for chunk in batch:
+            pid = ve.point_id(chunk["text"])
+            current[pid] = None
+            payload = ve.payload_for(chunk)
+            digest = ve.payload_hash(payload)
+            if pid not in existing:
+                new.append(chunk)
+            elif existing[pid] != digest:
+                # same text, new book_id / chapter / section (unknown hash: rewrite too)
+                payload_updates[pid] = payload
+            else:
+                stats["skipped"] += 1
+            existing[pid] = digest
+        if payload_updates:
+            ve.update_payloads(client, payload_updates)
+            stats["payload_updates"] += len(payload_updates)
+        if new and model is None and any(ve.chunk_hash(c["text"]) not in store for c in new):
+            model = ve.load_model()
+        if new:
+            result = ve.index_chunks(client, new, model=model, store=store)
+            stats["uploaded"] += result["uploaded"]
+            for pid in result["failed_ids"]:
+                existing.pop(pid, None)
+            failed.update(result["failed_ids"])
+        batch.clear()
+
+    try:
+        for chunk in cb.iter_chunks(sections):
+            writer.write(chunk)
+            catalog.add(chunk)
+            batch.append(dict(chunk, book=book))   # payload field, not in the chunk file
+            stats["chunks"] += 1
+            if len(batch) >= STREAM_BATCH:
+                flush()
+        flush()
+
+        # chunks that changed or vanished: drop their points, unless another book shares them
+        previous = books.get(book)
+        if previous is None:
+            previous = ve.existing_from_collection(client, book)
+        shared = {pid for other, ids in books.items() if other != book for pid in ids}
+        stale = [pid for pid in previous if pid not in current and pid not in shared]
+        ve.delete_points(client, stale)
+        for pid in stale:
+            existing.pop(pid, None)
+        stats["deleted"] = len(stale)
+        books[book] = [pid for pid in current if pid not in failed]
+    except BaseException:
+        writer.abort()
+        raise
+
+    writer.close()
+    manifest_path = write_manifest(chunks_path, catalog.result())
+    ve.save_index_manifest(existing, books)
+    print(f"⚡ {book}: {stats['chunks']} chunks, {stats['uploaded']} uploaded, "
+          f"{stats['payload_updates']} payloads updated, {stats['skipped']} unchanged, "
+          f"{stats['deleted']} stale deleted — searchable after {time.perf_counter() - t0:.2f}s")
+    return [chunks_path, manifest_path], model
+
+
+def run_stream(only_books=None, force=False, debug=False, watch=False):
+    import extract_pages as ep
+    import chunker_builder as cb
+    import vector_embed as ve
+
+    manifest = BuildManifest()
+    client = ve.get_client()
+    existing = ve.existing_points(client, ve.ensure_collection(client))
+    books = ve.load_book_points()
+    store = ve.open_store()
+    version = stream_version()
+    config = {"collection": ve.COLLECTION_NAME, **cb.STAGE_CONFIG}
+    model = None
+
+    while True:
+        for book, path in _files(ep.PDF_DIR, [".pdf", ".PDF"]).items():
+            if only_books and book not in only_books:
+                continue
+            input_hash = manifest.file_hash(path)
+            if not force and manifest.is_fresh(book, "stream", input_hash, version, config):
+                continue
+            outputs, model = stream_book(path, client, store, existing, books, model, debug)
+            manifest.record(book, "stream", input_hash, version, config, outputs)
+            manifest.save()
+
+        manifest.save()
+        if not watch:
+            return
+        force = False
+        time.sleep(WATCH_INTERVAL)
+
+
+def run_pipeline(stages=STAGE_ORDER, only_books=None, force=False):
+    manifest = BuildManifest()
+    t = time.perf_counter()
+    for stage in STAGE_ORDER:
+        if stage not in stages:
+            continue
+        print(f"\n▶️  Stage: {stage}")
+        if stage == "embed":
+            run_embed_stage(manifest, force)
+        else:
+            run_book_stage(manifest, stage, only_books, force)
+    manifest.save()
+    print(f"\n✅ Pipeline finished in {time.perf_counter() - t:.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incremental ingestion pipeline")
+    parser.add_argument("--stages", default=",".join(STAGE_ORDER),
+                        help=f"comma separated subset of {','.join(STAGE_ORDER)}")
+    parser.add_argument("--book", action="append", help="only this book (repeatable)")
+    parser.add_argument("--force", action="store_true", help="ignore the build manifest")
+    parser.add_argument("--stream", action="store_true",
+                        help="PDF -> Qdrant per book as one generator pipeline (no intermediate files)")
+    parser.add_argument("--debug-outputs", action="store_true",
+                        help="with --stream: also write pages/sections jsonl")
+    parser.add_argument("--watch", action="store_true",
+                        help="with --stream: keep polling data/pdfs for new or changed PDFs")
+    args = parser.parse_args()
+
+    if args.stream:
+        run_stream(set(args.book) if args.book else None, args.force,
+                   args.debug_outputs, args.watch)
+        raise SystemExit(0)
+
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGE_ORDER)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+
+    run_pipeline(stages, set(args.book) if args.book else None, args.force)
@@ -0,0 +1,137 @@
+import os
+import time
+import asyncio
+import argparse
+import traceback
+from artifact_store import get_store, EXAM_POOL_SIZE
+from routes.book_routes import get_catalog
+from routes.lesson_routes import lesson_key, create_lesson
+from routes.exam_routes import ExamRequest, EXAM_MAX_QUESTIONS, fill_pool
+
+# =========================================================
+# LESSON / EXAM PRE-GENERATION
+# =========================================================
+# Fills the artifact store for every chapter of the chapter books listed
+# in data/books_metadata.json: one lesson plan per chapter name and a pool
+# of EXAM_POOL_SIZE questions scoped to the chapter. Finished artifacts
+# are skipped, so a re-run only generates what is missing (new chapters,
+# a new corpus version, earlier failures).
+#
+#   python pregenerate.py                  # every chapter book
+#   python pregenerate.py --book bone      # one book (repeatable)
+#   PREGENERATE=1 uvicorn app:app          # same, as a background task
+PREGENERATE = os.getenv("PREGENERATE", "0") == "1"
+PREGEN_CONCURRENCY = int(os.getenv("PREGEN_CONCURRENCY", "2"))   # chapters in flight
+
+progress = {"state": "idle", "chapters": 0, "done": 0, "failed": 0,
+            "lessons": 0, "questions": 0, "seconds": 0.0}
+
+
+def chapter_jobs(books=None):
+    """(book name, chapter_id, chapter name) for every chapter in the catalog.
+
+    A chapter book whose chunks have no chapter sections yet becomes one
+    whole-book job (chapter_id None, topic = book title).
+    """
+    jobs = []
+    for book in get_catalog()["chapter_books"]:
+        if books and book["book_name"] not in books and book["book_id"] not in books:
+            continue
+        chapters = [(ch["chapter_id"], ch["chapter_name"]) for ch in book["chapters"]]
+        for chapter_id, name in chapters or [(None, book["title"])]:
+            jobs.append((book["book_name"], chapter_id, name))
+    return jobs
+
+
+async def pregenerate_chapter(book, chapter_id, chapter_name, pool_size=EXAM_POOL_SIZE,
+                              lessons=True, exams=True):
+    store = get_store()
+    if lessons and not store.has_lesson(lesson_key(chapter_name)):
+        if await create_lesson(chapter_name):
+            progress["lessons"] += 1
+        else:
+            raise RuntimeError(f"lesson plan for '{chapter_name}' failed")
+    if exams:
+        req = ExamRequest(exam_name=chapter_name, topic=chapter_name,
+                          num_questions=min(pool_size, EXAM_MAX_QUESTIONS),
+                          book=book, chapter_id=chapter_id)
+        added = await fill_pool(req)
+        progress["questions"] += added
+
+
+async def pregenerate(books=None, pool_size=EXAM_POOL_SIZE, lessons=True, exams=True):
+    """Generate every missing chapter artifact -> progress dict"""
+    store = get_store()
+    if store is None:
+        print("⚠️ ARTIFACT_STORE=0, nothing to pre-generate")
+        return progress
+
+    pruned = store.prune()
+    if pruned:
+        print(f"🧹 Artifact store: {pruned} rows from older corpus versions deleted")
+
+    jobs = chapter_jobs(books)
+    progress.update(state="running", chapters=len(jobs), done=0, failed=0, lessons=0, questions=0)
+    print(f"🏭 Pre-generating lesson plans / question pools for {len(jobs)} chapters")
+    t = time.perf_counter()
+    semaphore = asyncio.Semaphore(PREGEN_CONCURRENCY)
+
+    async def run(job):
+        async with semaphore:
+            try:
+                await pregenerate_chapter(*job, pool_size=pool_size, lessons=lessons, exams=exams)
+                progress["done"] += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                progress["failed"] += 1
+                print(f"❌ Pre-generation failed for {job[0]} / {job[2]}: {e!r}")
+
+    try:
+        await asyncio.gather(*(run(job) for job in jobs))
+        progress["state"] = "finished"
+    except asyncio.CancelledError:
+        progress["state"] = "cancelled"
+        raise
+    finally:
+        progress["seconds"] = round(time.perf_counter() - t, 2)
+        print(f"✅ Pre-generation {progress['state']}: {progress['done']}/{len(jobs)} chapters, "
+              f"{progress['lessons']} lessons, {progress['questions']} questions, "
+              f"{progress['failed']} failed ({progress['seconds']}s)")
+    return progress
+
+
+async def _background():
+    try:
+        await pregenerate()
+    except asyncio.CancelledError:
+        pass
+    except Exception:
+        progress["state"] = "failed"
+        traceback.print_exc()
+
+
+def start_background():
+    """Schedule pregenerate() on the running loop -> task, or None unless PREGENERATE=1"""
+    if not PREGENERATE or get_store() is None:
+        return None
+    return asyncio.get_running_loop().create_task(_background())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pre-generate lesson plans and question pools")
+    parser.add_argument("--book", action="append", help="only this book name / book_id (repeatable)")
+    parser.add_argument("--pool-size", type=int, default=EXAM_POOL_SIZE, help="questions per chapter")
+    parser.add_argument("--no-lessons", action="store_true")
+    parser.add_argument("--no-exams", action="store_true")
+    args = parser.parse_args()
+
+    async def main():
+        import llm_client
+        try:
+            await pregenerate(args.book, args.pool_size, not args.no_lessons, not args.no_exams)
+        finally:
+            await llm_client.close_client()
+
+    asyncio.run(main())
+    print(get_store().info() if get_store() else "")
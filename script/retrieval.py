@@ -0,0 +1,151 @@
+import os
+import time
+import asyncio
+import traceback
+from embedding_service import aembed_query
+from qdrant_client.models import Filter, FieldCondition, MatchValue
+from embedding_store import chunk_hash
+import bm25_index
+
+# ----------------------------
+# HYBRID RETRIEVAL
+# ----------------------------
+# Shared by rag_query.py and /api/chat. The vector retriever (query embed +
+# Qdrant search) and the lexical retriever (BM25) run concurrently, each
+# returns CANDIDATES ranked hits, and the two rankings are fused:
+#
+#   rrf       sum of weight / (RRF_K + rank)   (default, score-scale free)
+#   weighted  sum of weight * min-max normalized score
+#
+# Hits are keyed by chunk content hash, so a chunk found by both
+# retrievers is merged. If one retriever fails the other still answers.
+# Optional book / chapter_id scope both retrievers (Qdrant payload index
+# filter, BM25 doc subset).
+COLLECTION_NAME = "medical_chunks"
+CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "20"))   # per retriever, before fusion
+FUSION = os.getenv("RETRIEVAL_FUSION", "rrf")                # rrf | weighted
+RRF_K = 60
+WEIGHTS = {
+    "vector": float(os.getenv("RETRIEVAL_VECTOR_WEIGHT", "1.0")),
+    "keyword": float(os.getenv("RETRIEVAL_KEYWORD_WEIGHT", "1.0")),
+}
+
+
+def _ms(start):
+    return round((time.perf_counter() - start) * 1000, 3)
+
+
+def _hit(text, score, book=None, chapter_id=None, section=None):
+    return {"id": chunk_hash(text), "text": text, "score": score,
+            "book": book, "chapter_id": chapter_id, "section": section}
+
+def scope_filter(book=None, chapter_id=None):
+    """Qdrant filter on the keyword-indexed payload fields (None = whole collection)"""
+    must = [FieldCondition(key=key, match=MatchValue(value=value))
+            for key, value in (("book", book), ("chapter_id", chapter_id)) if value]
+    return Filter(must=must) if must else None
+
+# ----------------------------
+# RETRIEVERS
+# ----------------------------
+async def vector_search(qdrant, query, limit, timings, book=None, chapter_id=None,
+                        collection=COLLECTION_NAME):
+    """-> (query vector, ranked hits); Qdrant's sync client runs in a thread"""
+    t = time.perf_counter()
+    vector = await aembed_query(query)
+    timings["embed_ms"] = _ms(t)
+
+    t = time.perf_counter()
+    points = await asyncio.to_thread(
+        qdrant.search, collection_name=collection, query_vector=vector, limit=limit,
+        query_filter=scope_filter(book, chapter_id)
+    )
+    timings["vector_ms"] = _ms(t)
+
+    hits = []
+    for p in points:
+        payload = p.payload or {}
+        hits.append(_hit(payload.get("content", ""), p.score, payload.get("book"),
+                         payload.get("chapter_id"), payload.get("section")))
+    return vector, hits
+
+
+async def keyword_search(query, limit, timings, book=None, chapter_id=None):
+    t = time.perf_counter()
+    found = await asyncio.to_thread(bm25_index.search, query, limit, book, chapter_id)
+    timings["keyword_ms"] = _ms(t)
+    return [_hit(h["text"], h["score"], h["book"], h["chapter_id"], h["section"]) for h in found]
+
+# ----------------------------
+# FUSION
+# ----------------------------
+def fuse(rankings, top_k, method=FUSION):
+    """{retriever: ranked hits} -> top_k fused hits, best first.
+
+    Each fused hit keeps its per-retriever rank and raw score; "source" is
+    the retriever name, or "both" when every retriever returned it.
+    """
+    fused = {}
+    for name, hits in rankings.items():
+        weight = WEIGHTS.get(name, 1.0)
+        if method == "weighted" and hits:
+            scores = [h["score"] for h in hits]
+            low, span = min(scores), (max(scores) - min(scores)) or 1.0
+
+        for rank, hit in enumerate(hits, 1):
+            if method == "weighted":
+                gain = weight * (hit["score"] - low) / span
+            else:
+                gain = weight / (RRF_K + rank)
+
+            entry = fused.get(hit["id"])
+            if entry is None:
+                entry = fused[hit["id"]] = dict(hit, score=0.0, ranks={}, scores={})
+            entry["score"] += gain
+            entry["ranks"][name] = rank
+            entry["scores"][name] = hit["score"]
+
+    for entry in fused.values():
+        found_by = list(entry["ranks"])
+        entry["source"] = found_by[0] if len(found_by) == 1 else "both"
+
+    return sorted(fused.values(), key=lambda e: e["score"], reverse=True)[:top_k]
+
+# ----------------------------
+# ENTRY POINTS
+# ----------------------------
+async def hybrid_search(qdrant, query, top_k=5, book=None, chapter_id=None):
+    """-> {"hits": fused hits, "vector": query vector or None, "timings": ms per step}"""
+    timings = {}
+    t = time.perf_counter()
+    limit = max(top_k, CANDIDATES)
+
+    vector_result, keyword_result = await asyncio.gather(
+        vector_search(qdrant, query, limit, timings, book, chapter_id),
+        keyword_search(query, limit, timings, book, chapter_id),
+        return_exceptions=True
+    )
+
+    rankings, vector = {}, None
+    if isinstance(vector_result, BaseException):
+        print("⚠️ Vector retrieval failed:", repr(vector_result))
+    else:
+        vector, rankings["vector"] = vector_result
+    if isinstance(keyword_result, BaseException):
+        print("⚠️ Keyword retrieval failed:", repr(keyword_result))
+    else:
+        rankings["keyword"] = keyword_result
+    if not rankings:
+        traceback.print_exception(type(vector_result), vector_result, vector_result.__traceback__)
+        raise vector_result
+
+    f = time.perf_counter()
+    hits = fuse(rankings, top_k)
+    timings["fusion_ms"] = _ms(f)
+    timings["total_ms"] = _ms(t)
+    return {"hits": hits, "vector": vector, "timings": timings}
+
+
+def hybrid_search_sync(qdrant, query, top_k=5, book=None, chapter_id=None):
+    """Blocking wrapper for CLI scripts"""
+    return asyncio.run(hybrid_search(qdrant, query, top_k, book, chapter_id))
@@ -3,7 +3,12 @@ from pydantic import BaseModel
 from typing import List, Optional
 import json
 import os
+import threading
+import time
 from pathlib import Path
+from catalog_manifest import (
+    CHUNKS_SUFFIX, load_manifest, manifest_path_for, manifest_from_chunks_file
+)
 
 router = APIRouter()
 
@@ -20,7 +25,7 @@ print(f"📂 CHUNKS_FOLDER: {CHUNKS_FOLDER}")
 print(f"📋 METADATA_FILE: {METADATA_FILE}")
 print(f"✅ Exists: {CHUNKS_FOLDER.exists()}")
 if CHUNKS_FOLDER.exists():
-    json_files = list(CHUNKS_FOLDER.glob("*.json"))
+    json_files = list(CHUNKS_FOLDER.glob(f"*{CHUNKS_SUFFIX}"))
     print(f"📄 JSON files found: {len(json_files)}")
     for f in json_files[:3]:  # First 3 files
         print(f"   - {f.name}")
@@ -51,118 +56,166 @@ class BooksResponse(BaseModel):
     total_books: int
     books: List[Book]
 
-def load_books_from_chunks():
-    """Chunks folder la irunthu books data dynamically load pannum"""
-    try:
+# ----------------------------
+# CATALOG INDEX
+# ----------------------------
+# Process-wide index built once from the per-book manifests written by
+# chunker_builder.py (*_manifest.json). A manifest is re-read only when it
+# or its chunk file changes (mtime, size), and the assembled catalog is
+# rebuilt only when a book or books_metadata.json changes, so the /books
+# endpoints are plain dict lookups.
+CATALOG_CHECK_INTERVAL = 2.0  # seconds between filesystem staleness checks
+
+_catalog_lock = threading.Lock()
+_file_cache = {}  # chunk file name -> {"stat": (chunks stat, manifest stat), "info": {...}}
+_catalog = {
+    "signature": None,
+    "checked_at": 0.0,
+    "books": [],
+    "by_id": {},
+    "by_name": {},
+    "chapter_books": [],
+    "non_chapter_books": [],
+    "summary": {},
+}
+
+def _stat_key(path):
+    st = path.stat()
+    return (st.st_mtime_ns, st.st_size)
+
+def _book_files():
+    """(chunks file, manifest file or None) for every book in CHUNKS_FOLDER"""
+    for chunks_file in sorted(CHUNKS_FOLDER.glob(f"*{CHUNKS_SUFFIX}")):
+        manifest_file = Path(manifest_path_for(str(chunks_file)))
+        yield chunks_file, manifest_file if manifest_file.exists() else None
+
+def _catalog_signature():
+    """Cheap fingerprint of every input the catalog depends on"""
+    files = tuple(
+        (chunks_file.name, _stat_key(chunks_file),
+         _stat_key(manifest_file) if manifest_file else None)
+        for chunks_file, manifest_file in _book_files()
+    )
+    meta = _stat_key(METADATA_FILE) if METADATA_FILE.exists() else None
+    return files, meta
+
+def _load_book_info(chunks_file, manifest_file):
+    """Manifest (or chunk file fallback) -> book_id + chapter list"""
+    if manifest_file is not None:
+        manifest = load_manifest(manifest_file)
+    else:
+        print(f"⚠️  No manifest for {chunks_file.name}, reading full chunk file")
+        manifest = manifest_from_chunks_file(str(chunks_file))
+
+    if not manifest.get("book_ids"):
+        return None
+
+    chapters = [
+        {"chapter_id": s["chapter_id"], "chapter_name": s["section"]}
+        for s in manifest.get("sections", [])
+        if s["section"] != "General"
+    ][:50]
+
+    print(f"📖 {chunks_file.name}: {manifest.get('chunk_count', 0)} chunks | Sections: {len(chapters)}")
+    return {"book_id": manifest["book_ids"][0], "chapters": chapters}
+
+def _build_catalog(signature):
+    metadata = load_metadata()
+    chapter_books_list = metadata.get("chapter_books", [])
+
+    books = []
+    seen_files = set()
+    for json_file, manifest_file in _book_files():
+        seen_files.add(json_file.name)
+        try:
+            stat = (_stat_key(json_file), _stat_key(manifest_file) if manifest_file else None)
+            cached = _file_cache.get(json_file.name)
+            if cached is None or cached["stat"] != stat:
+                cached = {"stat": stat, "info": _load_book_info(json_file, manifest_file)}
+                _file_cache[json_file.name] = cached
+        except json.JSONDecodeError as je:
+            # Invalid JSON file skip pannu
+            print(f"❌ JSON Error in {json_file.name}: {je}")
+            continue
+        except Exception as e:
+            # Other errors skip pannu
+            print(f"❌ Error in {json_file.name}: {e}")
+            continue
+
+        info = cached["info"]
+        if info is None:
+            continue
+
+        book_name = json_file.stem.replace("_chunks", "")
+        has_chapters = book_name in chapter_books_list
+        books.append({
+            "book_id": info["book_id"],
+            "book_name": book_name,
+            "title": book_name.replace("_", " ").replace("-", " ").title(),
+            "has_chapters": has_chapters,
+            "chapters": info["chapters"] if has_chapters else []
+        })
+
+    for name in set(_file_cache) - seen_files:
+        del _file_cache[name]
+
+    chapter_books = [b for b in books if b["has_chapters"]]
+    non_chapter_books = [b for b in books if not b["has_chapters"]]
+    brief = lambda b: {"book_id": b["book_id"], "book_name": b["book_name"], "title": b["title"]}
+
+    _catalog.update({
+        "signature": signature,
+        "books": books,
+        "by_id": {b["book_id"]: b for b in books},
+        "by_name": {b["book_name"]: b for b in books},
+        "chapter_books": chapter_books,
+        "non_chapter_books": non_chapter_books,
+        "summary": {
+            "total_books": len(books),
+            "chapter_books_count": len(chapter_books),
+            "non_chapter_books_count": len(non_chapter_books),
+            "chapter_books": [brief(b) for b in chapter_books],
+            "non_chapter_books": [brief(b) for b in non_chapter_books]
+        },
+    })
+    print(f"📚 Catalog rebuilt: {len(books)} books")
+
+def get_catalog(force=False):
+    """Return the current catalog index, rebuilding it only if inputs changed"""
+    now = time.monotonic()
+    if not force and _catalog["signature"] is not None \
+            and now - _catalog["checked_at"] < CATALOG_CHECK_INTERVAL:
+        return _catalog
+
+    with _catalog_lock:
         if not CHUNKS_FOLDER.exists():
             raise HTTPException(
-                status_code=500, 
+                status_code=500,
                 detail=f"Chunks folder not found at {CHUNKS_FOLDER}"
             )
-        
-        # Load metadata
-        metadata = load_metadata()
-        chapter_books_list = metadata.get("chapter_books", [])
-        non_chapter_books_list = metadata.get("non_chapter_books", [])
-        
-        books = []
-        
-        # Chunks folder la irukura ella JSON files um read pannu
-        for json_file in CHUNKS_FOLDER.glob("*.json"):
-            try:
-                print(f"\n📖 Reading: {json_file.name}")
-                with open(json_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    
-                    # JSON structure debug
-                    if isinstance(data, list) and len(data) > 0:
-                        print(f"   Type: List (Chunks format)")
-                        print(f"   Total chunks: {len(data)}")
-                        
-                        # Extract unique book_id, chapter_id, and sections
-                        book_ids = set()
-                        chapter_ids = set()
-                        sections = set()
-                        
-                        for chunk in data:
-                            if isinstance(chunk, dict):
-                                if "book_id" in chunk:
-                                    book_ids.add(chunk["book_id"])
-                                if "chapter_id" in chunk:
-                                    chapter_ids.add(chunk["chapter_id"])
-                                if "section" in chunk and chunk["section"]:
-                                    sections.add(chunk["section"])
-                        
-                        print(f"   Unique book_ids: {book_ids}")
-                        print(f"   Unique chapter_ids: {chapter_ids}")
-                        print(f"   Unique sections: {len(sections)}")
-                        
-                        # Get book info from first chunk
-                        if book_ids:
-                            book_id = list(book_ids)[0]
-                            book_name = json_file.stem.replace("_chunks", "")
-                            
-                            # Check metadata for chapter/non-chapter
-                            has_chapters = book_name in chapter_books_list
-                            
-                            print(f"   Book: {book_name}")
-                            print(f"   Metadata check: {has_chapters}")
-                            
-                            # Extract chapters only if has_chapters is True
-                            chapters_list = []
-                            if has_chapters:
-                                chapter_data = {}
-                                for chunk in data:
-                                    if isinstance(chunk, dict):
-                                        section_name = chunk.get("section", "General")
-                                        ch_id = chunk.get("chapter_id", "default")
-                                        key = f"{ch_id}_{section_name}"
-                                        
-                                        if key not in chapter_data and section_name != "General":
-                                            chapter_data[key] = {
-                                                "chapter_id": ch_id,
-                                                "chapter_name": section_name
-                                            }
-                                
-                                chapters_list = list(chapter_data.values())[:50]
-                            
-                            # Create book object
-                            book = {
-                                "book_id": book_id,
-                                "book_name": book_name,
-                                "title": book_name.replace("_", " ").replace("-", " ").title(),
-                                "has_chapters": has_chapters,
-                                "chapters": chapters_list
-                            }
-                            
-                            books.append(book)
-                            print(f"   ✅ Added: {book['title']} | Chapters: {has_chapters} | Count: {len(chapters_list)}")
-                    
-                    elif isinstance(data, dict):
-                        print(f"   Type: Dictionary")
-                        print(f"   Keys: {list(data.keys())[:10]}")
-                        # Original dict-based logic (if needed)
-                    
-                    else:
-                        print(f"   ⚠️  Unknown structure: {type(data)}")
-                    
-            except json.JSONDecodeError as je:
-                # Invalid JSON file skip pannu
-                print(f"❌ JSON Error in {json_file.name}: {je}")
-                continue
-            except Exception as e:
-                # Other errors skip pannu
-                print(f"❌ Error in {json_file.name}: {e}")
-                continue
-        
-        print(f"📚 Total books loaded: {len(books)}")
-        return books
-        
-    except Exception as e:
-        print(f"💥 Fatal error: {e}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Error loading books: {str(e)}")
+        try:
+            signature = _catalog_signature()
+            if force or signature != _catalog["signature"]:
+                _build_catalog(signature)
+            _catalog["checked_at"] = now
+        except Exception as e:
+            print(f"💥 Fatal error: {e}")
+            import traceback
+            traceback.print_exc()
+            raise HTTPException(status_code=500, detail=f"Error loading books: {str(e)}")
+    return _catalog
+
+def resolve_book_name(book):
+    """Book name or catalog book_id -> book name (the Qdrant / BM25 filter value)"""
+    catalog = get_catalog()
+    entry = catalog["by_name"].get(book) or catalog["by_id"].get(book)
+    if entry is None:
+        raise HTTPException(status_code=404, detail=f"Book '{book}' not found")
+    return entry["book_name"]
+
+def load_books_from_chunks():
+    """Chunks folder la irunthu books data load pannum (cached catalog)"""
+    return get_catalog()["books"]
 
 @router.get("/books", response_model=BooksResponse)
 async def get_all_books(
@@ -178,14 +231,14 @@ async def get_all_books(
                    None - எல்லா books-ம்
     """
     try:
-        all_books = load_books_from_chunks()
-        filtered_books = all_books
+        catalog = get_catalog()
+        filtered_books = catalog["books"]
         
         # Filter based on user selection
         if filter_type == "chapter":
-            filtered_books = [book for book in all_books if book.get("has_chapters", False)]
+            filtered_books = catalog["chapter_books"]
         elif filter_type == "non-chapter":
-            filtered_books = [book for book in all_books if not book.get("has_chapters", False)]
+            filtered_books = catalog["non_chapter_books"]
         
         return BooksResponse(
             total_books=len(filtered_books),
@@ -202,8 +255,7 @@ async def get_book_by_id(book_id: str):
     குறிப்பிட்ட book-ன் details get பண்ணும் API
     """
     try:
-        all_books = load_books_from_chunks()
-        book = next((b for b in all_books if b["book_id"] == book_id), None)
+        book = get_catalog()["by_id"].get(book_id)
         
         if not book:
             raise HTTPException(status_code=404, detail=f"Book {book_id} not found")
@@ -220,8 +272,7 @@ async def get_book_by_name(book_name: str):
     Book name வச்சு book details get பண்ணும் API
     """
     try:
-        all_books = load_books_from_chunks()
-        book = next((b for b in all_books if b["book_name"] == book_name), None)
+        book = get_catalog()["by_name"].get(book_name)
         
         if not book:
             raise HTTPException(status_code=404, detail=f"Book '{book_name}' not found")
@@ -238,8 +289,7 @@ async def get_book_chapters(book_id: str):
     குறிப்பிட்ட book-ன் chapters மட்டும் get பண்ணும் API
     """
     try:
-        all_books = load_books_from_chunks()
-        book = next((b for b in all_books if b["book_id"] == book_id), None)
+        book = get_catalog()["by_id"].get(book_id)
         
         if not book:
             raise HTTPException(status_code=404, detail=f"Book {book_id} not found")
@@ -262,23 +312,7 @@ async def get_books_summary():
     Books statistics - எத்தனை chapter books, non-chapter books என்று
     """
     try:
-        all_books = load_books_from_chunks()
-        chapter_books = [b for b in all_books if b.get("has_chapters", False)]
-        non_chapter_books = [b for b in all_books if not b.get("has_chapters", False)]
-        
-        return {
-            "total_books": len(all_books),
-            "chapter_books_count": len(chapter_books),
-            "non_chapter_books_count": len(non_chapter_books),
-            "chapter_books": [
-                {"book_id": b["book_id"], "book_name": b["book_name"], "title": b["title"]} 
-                for b in chapter_books
-            ],
-            "non_chapter_books": [
-                {"book_id": b["book_id"], "book_name": b["book_name"], "title": b["title"]} 
-                for b in non_chapter_books
-            ]
-        }
+        return get_catalog()["summary"]
     except HTTPException:
         raise
     except Exception as e:
@@ -1,12 +1,17 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 import os
-import requests
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from fastembed import TextEmbedding
 import traceback
+from llm_client import ask_grok, stream_grok, GROK_MODEL
+from streaming import sse_event, sse_response
+from embedding_service import get_embedder, query_cache
+from answer_cache import AnswerCache, answer_key
+import bm25_index
+import retrieval
+from local_vectors import get_vector_client
+from routes.book_routes import resolve_book_name
 
 # ----------------------------
 # ENV + ROUTER
@@ -19,32 +24,32 @@ print("🚀 chat_routes.py loaded")
 # ----------------------------
 # ENV VARIABLES
 # ----------------------------
-GROK_API_KEY = os.getenv("GROK_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 
-print("🔑 GROK_API_KEY exists:", bool(GROK_API_KEY))
 print("📦 QDRANT_URL:", QDRANT_URL)
 
 COLLECTION_NAME = "medical_chunks"
-EMBEDDING_MODEL = "BAAI/bge-small-en"
-GROK_MODEL = "grok-3"
-GROK_URL = "https://api.x.ai/v1/chat/completions"
 
 # ----------------------------
 # CLIENTS
 # ----------------------------
 try:
-    qdrant = QdrantClient(url=QDRANT_URL)
-    print("✅ Qdrant client initialized")
+    qdrant = get_vector_client(QDRANT_URL, COLLECTION_NAME)
 except Exception as e:
-    print("❌ Qdrant init failed:", e)
+    print("❌ Vector backend init failed:", e)
 
 try:
-    embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
-    print("✅ Embedder loaded:", EMBEDDING_MODEL)
+    get_embedder()
 except Exception as e:
     print("❌ Embedder load failed:", e)
 
+try:
+    bm25_index.get_index()
+except Exception as e:
+    print("❌ BM25 index load failed:", e)
+
+answer_cache = AnswerCache()
+
 # ----------------------------
 # MODELS
 # ----------------------------
@@ -53,6 +58,8 @@ class ChatRequest(BaseModel):
     top_k: int = 5
     max_tokens: int = 1000
     temperature: float = 0.2
+    book: Optional[str] = None        # book name or catalog book_id
+    chapter_id: Optional[str] = None
 
 class SourceChunk(BaseModel):
     text: str
@@ -65,73 +72,20 @@ class ChatResponse(BaseModel):
     found_relevant_content: bool
 
 # ----------------------------
-# GROK CALL
-# ----------------------------
-def ask_grok(prompt: str, max_tokens: int, temperature: float):
-    print("\n🤖 Calling Grok...")
-    print("➡️ Prompt length:", len(prompt))
-    print("➡️ Max tokens:", max_tokens, "Temp:", temperature)
-
-    headers = {
-        "Authorization": f"Bearer {GROK_API_KEY}",
-        "Content-Type": "application/json"
-    }
-
-    payload = {
-        "model": GROK_MODEL,
-        "messages": [{"role": "user", "content": prompt}],
-        "temperature": temperature,
-        "max_tokens": max_tokens
-    }
-
-    try:
-        r = requests.post(
-            GROK_URL,
-            headers=headers,
-            json=payload,
-            timeout=30
-        )
-        print("📡 Grok status:", r.status_code)
-        print("📡 Grok raw response:", r.text)
-
-        if r.status_code != 200:
-            return None
-
-        data = r.json()
-        content = data["choices"][0]["message"]["content"]
-
-        # Grok content may be list or string
-        if isinstance(content, list):
-            content = content[0].get("text", "")
-
-        return content
-
-    except Exception as e:
-        print("❌ Grok call exception:")
-        traceback.print_exc()
-        return None
-
-# ----------------------------
-# QDRANT SEARCH
+# HYBRID SEARCH
 # ----------------------------
-def hybrid_search(query: str, top_k: int):
+async def hybrid_search(query: str, top_k: int, book=None, chapter_id=None):
+    """Vector + BM25 retrieval (concurrent, fused) -> retrieval.hybrid_search result"""
     print("\n🔎 Hybrid search started")
     print("➡️ Query:", query)
     print("➡️ top_k:", top_k)
+    if book or chapter_id:
+        print("➡️ Scope:", book, chapter_id)
 
     try:
-        embedding = embedder.embed([query])[0]
-        vector = list(map(float, embedding))
-        print("✅ Embedding generated, dim:", len(vector))
-
-        results = qdrant.search(
-            collection_name=COLLECTION_NAME,
-            query_vector=vector,
-            limit=top_k
-        )
-
-        print("✅ Qdrant results count:", len(results))
-        return results
+        result = await retrieval.hybrid_search(qdrant, query, top_k, book, chapter_id)
+        print("✅ Retrieved:", len(result["hits"]), "| timings (ms):", result["timings"])
+        return result
 
     except Exception as e:
         print("❌ Hybrid search failed:")
@@ -139,46 +93,60 @@ def hybrid_search(query: str, top_k: int):
         raise
 
 # ----------------------------
-# CHAT ENDPOINT
+# RETRIEVAL + PROMPT
 # ----------------------------
-@router.post("", response_model=ChatResponse)
-async def chat(req: ChatRequest):
-    print("\n==============================")
-    print("📩 /api/chat called")
-    print("➡️ Request body:", req)
-    print("==============================")
-
-    try:
-        # Qdrant search
-        results = hybrid_search(req.question, req.top_k)
-
-        if not results:
-            print("⚠️ No relevant content found")
-            return ChatResponse(
-                answer="No relevant content found.",
-                sources=[],
-                found_relevant_content=False
-            )
-
-        context = []
-        sources = []
-
-        for r in results:
-            payload = r.payload or {}
-            text = payload.get("content", "")
-            context.append(text)
-
-            sources.append(
-                SourceChunk(
-                    text=text[:300],
-                    score=round(r.score, 3),
-                    source="vector"
-                )
+async def prepare_chat(req: ChatRequest):
+    """Retrieve context and build the prompt.
+
+    Returns {"response": ChatResponse} when no LLM call is needed (no
+    content found, or answer cache hit), otherwise the prompt, sources and
+    cache key needed to generate and store the answer.
+    """
+    # Vector + BM25 search, optionally scoped to one book / chapter
+    book = resolve_book_name(req.book) if req.book else None
+    scope = f"{book or ''}/{req.chapter_id or ''}" if book or req.chapter_id else None
+    retrieved = await hybrid_search(req.question, req.top_k, book, req.chapter_id)
+    results = retrieved["hits"]
+
+    if not results:
+        print("⚠️ No relevant content found")
+        return {"response": ChatResponse(
+            answer="No relevant content found.",
+            sources=[],
+            found_relevant_content=False
+        )}
+
+    # Answer cache: same question + same retrieved chunks -> same answer
+    chunk_ids = [r["id"] for r in results]
+    cache_key = answer_key(
+        req.question, chunk_ids, GROK_MODEL, req.temperature, req.max_tokens, scope
+    )
+    question_vector = retrieved["vector"]  # None if the vector retriever failed
+    cache_args = dict(vector=question_vector, model=GROK_MODEL, temperature=req.temperature,
+                      max_tokens=req.max_tokens, scope=scope, chunk_ids=chunk_ids)
+    cached = answer_cache.get(cache_key, **cache_args)
+    if cached is not None:
+        print("⚡ Answer cache hit")
+        return {"response": cached}
+
+    context = []
+    sources = []
+
+    for r in results:
+        text = r["text"]
+        context.append(text)
+
+        sources.append(
+            SourceChunk(
+                text=text[:300],
+                score=round(r["score"], 4),
+                source=r["source"]
             )
+        )
 
-        print("🧠 Context chunks:", len(context))
+    print("🧠 Context chunks:", len(context))
 
-        prompt = f"""
+    prompt = f"""
 Answer ONLY from the context below.
 
 Context:
@@ -187,8 +155,38 @@ Context:
 Question:
 {req.question}
 """
+    return {
+        "prompt": prompt,
+        "sources": sources,
+        "cache_key": cache_key,
+        "cache_args": cache_args
+    }
+
+def finish_chat(prepared, answer):
+    response = ChatResponse(
+        answer=answer.strip(),
+        sources=prepared["sources"],
+        found_relevant_content=True
+    )
+    answer_cache.put(prepared["cache_key"], response, **prepared["cache_args"])
+    return response
+
+# ----------------------------
+# CHAT ENDPOINT
+# ----------------------------
+@router.post("", response_model=ChatResponse)
+async def chat(req: ChatRequest):
+    print("\n==============================")
+    print("📩 /api/chat called")
+    print("➡️ Request body:", req)
+    print("==============================")
+
+    try:
+        prepared = await prepare_chat(req)
+        if "response" in prepared:
+            return prepared["response"]
 
-        answer = ask_grok(prompt, req.max_tokens, req.temperature)
+        answer = await ask_grok(prepared["prompt"], req.max_tokens, req.temperature, route="chat")
 
         if not answer:
             print("❌ Grok returned empty answer")
@@ -196,11 +194,7 @@ Question:
 
         print("✅ Final answer length:", len(answer))
 
-        return ChatResponse(
-            answer=answer.strip(),
-            sources=sources,
-            found_relevant_content=True
-        )
+        return finish_chat(prepared, answer)
 
     except HTTPException:
         raise
@@ -209,3 +203,67 @@ Question:
         print("🔥 CHAT ENDPOINT CRASHED")
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=str(e))
+
+# ----------------------------
+# STREAMING CHAT ENDPOINT (SSE)
+# ----------------------------
+@router.post("/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Same as /api/chat but streamed as Server-Sent Events:
+    sources -> token* -> done {answer, found_relevant_content}
+    """
+    print("\n📩 /api/chat/stream called:", req.question)
+
+    try:
+        prepared = await prepare_chat(req)
+    except HTTPException:
+        raise
+    except Exception as e:
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def events():
+        if "response" in prepared:
+            response = prepared["response"]
+            yield sse_event("sources", response.sources)
+            if response.found_relevant_content:
+                yield sse_event("token", {"text": response.answer})
+            yield sse_event("done", {
+                "answer": response.answer,
+                "found_relevant_content": response.found_relevant_content
+            })
+            return
+
+        yield sse_event("sources", prepared["sources"])
+
+        parts = []
+        try:
+            async for delta in stream_grok(prepared["prompt"], req.max_tokens, req.temperature, route="chat"):
+                parts.append(delta)
+                yield sse_event("token", {"text": delta})
+        except Exception as e:
+            traceback.print_exc()
+            yield sse_event("error", {"detail": str(e)})
+            return
+
+        answer = "".join(parts)
+        if not answer.strip():
+            yield sse_event("error", {"detail": "AI failed"})
+            return
+
+        finish_chat(prepared, answer)
+        yield sse_event("done", {"answer": answer.strip(), "found_relevant_content": True})
+
+    return sse_response(events())
+
+
+# ----------------------------
+# CACHE STATS
+# ----------------------------
+@router.get("/cache-stats")
+async def cache_stats():
+    return {
+        "query_embeddings": query_cache.info(),
+        "answers": answer_cache.info()
+    }
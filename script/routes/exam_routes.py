@@ -1,26 +1,40 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import List, Literal
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from datetime import datetime
-import os, requests, re
+from contextlib import aclosing
+import os, re, json
+import asyncio
 from dotenv import load_dotenv
-from qdrant_client import QdrantClient
-from fastembed import TextEmbedding
+from local_vectors import get_vector_client
+from llm_client import stream_grok, GROK_MODEL
+from artifact_store import get_store, artifact_key
+from streaming import sse_event, sse_response
+import retrieval
+from routes.book_routes import resolve_book_name
+import traceback
 
 load_dotenv()
 
 router = APIRouter()
 
-GROK_API_KEY = os.getenv("GROK_API_KEY")
 QDRANT_URL = os.getenv("QDRANT_URL")
 
 COLLECTION_NAME = "medical_chunks"
-EMBEDDING_MODEL = "BAAI/bge-small-en"
-GROK_MODEL = "grok-3"
-GROK_URL = "https://api.x.ai/v1/chat/completions"
 
-qdrant = QdrantClient(url=QDRANT_URL)
-embedder = TextEmbedding(model_name=EMBEDDING_MODEL)
+qdrant = get_vector_client(QDRANT_URL, COLLECTION_NAME)
+
+# Exams are generated as concurrent batches of EXAM_BATCH_SIZE questions,
+# each grounded in its own share of the retrieved chunks, then merged.
+EXAM_BATCH_SIZE = int(os.getenv("EXAM_BATCH_SIZE", "10"))
+EXAM_CONTEXT_CHUNKS = 6       # chunks of source text per batch
+EXAM_MAX_CONTEXT_CHUNKS = 40  # retrieved once per exam, shared out between batches
+EXAM_BATCH_TIMEOUT = int(os.getenv("EXAM_BATCH_TIMEOUT", "90"))
+TOKENS_PER_QUESTION = 200
+EXAM_TOPUP_ROUNDS = 2         # follow-up calls asking only for the questions still missing
+EXAM_AVOID_LIMIT = 30         # existing questions listed in a top-up prompt
+EXAM_OUTPUT = os.getenv("EXAM_OUTPUT", "text")   # text | json (structured output)
+EXAM_MAX_QUESTIONS = int(os.getenv("EXAM_MAX_QUESTIONS", "100"))
 
 class Question(BaseModel):
     question_number: int
@@ -35,8 +49,10 @@ class Question(BaseModel):
 class ExamRequest(BaseModel):
     exam_name: str
     topic: str
-    num_questions: int = 10
+    num_questions: int = Field(10, ge=1, le=EXAM_MAX_QUESTIONS)
     marks_per_question: int = 2
+    book: Optional[str] = None        # book name or catalog book_id
+    chapter_id: Optional[str] = None
 
 class ExamResponse(BaseModel):
     exam_name: str
@@ -46,55 +62,314 @@ class ExamResponse(BaseModel):
     total_marks: int
     questions: List[Question]
 
-def ask_grok(prompt):
-    headers = {
-        "Authorization": f"Bearer {GROK_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "grok-3",
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 3000
-    }
-    r = requests.post(GROK_URL, headers=headers, json=payload)
-    if r.status_code != 200:
-        return None
-    return r.json()["choices"][0]["message"]["content"]
+# ----------------------------
+# PROMPT
+# ----------------------------
+def exam_batches(num_questions, batch_size=None):
+    """Question count per batch, as even as possible: 25 -> [9, 8, 8]"""
+    n = max(0, num_questions)
+    count = max(1, -(-n // max(1, batch_size or EXAM_BATCH_SIZE)))
+    return [n // count + (i < n % count) for i in range(count)] if n else []
 
-@router.post("/generate-exam", response_model=ExamResponse)
-async def generate_exam(req: ExamRequest):
-    prompt = f"""
-Create {req.num_questions} MCQs on topic {req.topic}.
-Format:
+async def exam_context(req: ExamRequest, batches=1):
+    """Retrieved source text per batch; [None] * batches if an unscoped topic finds nothing"""
+    book = resolve_book_name(req.book) if req.book else None
+    top_k = min(EXAM_CONTEXT_CHUNKS * batches, EXAM_MAX_CONTEXT_CHUNKS)
+    try:
+        hits = (await retrieval.hybrid_search(qdrant, req.topic, top_k, book, req.chapter_id))["hits"]
+    except Exception as e:
+        if book or req.chapter_id:
+            raise
+        print("⚠️ Exam retrieval failed:", repr(e))
+        hits = []
+    if not hits:
+        if book or req.chapter_id:
+            raise HTTPException(status_code=404, detail="No content found for this book / chapter")
+        print("⚠️ No source found for exam topic, generating ungrounded:", req.topic)
+        return [None] * batches
+
+    # round-robin so every batch sees different chunks (fewer repeated questions)
+    shares = [hits[i::batches] or hits for i in range(batches)]
+    return ["\n\n".join(h["text"] for h in share) for share in shares]
+
+JSON_FORMAT = """Return JSON only, no prose:
+{"questions": [{"question": "...", "options": {"A": "...", "B": "...", "C": "...", "D": "..."}, "answer": "A"}]}"""
+
+TEXT_FORMAT = """Format:
 Q1...
 A)
 B)
 C)
 D)
-Correct Answer: A
+Correct Answer: A"""
+
+def exam_prompt(req: ExamRequest, context=None, num_questions=None, avoid=None, output="text"):
+    source = f"""
+Use ONLY the source material below. Every question must be answerable from it.
+
+Source:
+{context}
+""" if context else ""
+    existing = "\nDo not repeat any of these questions:\n" + "\n".join(f"- {q}" for q in avoid) + "\n" \
+        if avoid else ""
+    return f"""{source}{existing}
+Create {num_questions or req.num_questions} MCQs on topic {req.topic}.
+{JSON_FORMAT if output == "json" else TEXT_FORMAT}
 """
-    ai = ask_grok(prompt)
-    if not ai:
-        raise HTTPException(status_code=500, detail="AI failed")
 
-    questions = []
-    blocks = re.split(r"Q\d+\.", ai)[1:]
-
-    for i, b in enumerate(blocks, 1):
-        opts = re.findall(r"[A-D]\)\s*(.+)", b)
-        ans = re.search(r"Correct Answer:\s*([A-D])", b)
-        if len(opts) == 4 and ans:
-            questions.append(Question(
-                question_number=i,
-                question_text=b.split("A)")[0].strip(),
-                option_a=opts[0],
-                option_b=opts[1],
-                option_c=opts[2],
-                option_d=opts[3],
-                correct_answer=ans.group(1),
-                marks=req.marks_per_question
-            ))
+# ----------------------------
+# TOLERANT MCQ PARSER
+# ----------------------------
+# Reads the formats models actually produce, one line at a time:
+#
+#   Q1. / Q1) / Question 1: / 1. / 1) / **Q1.** / ### Question 1   question
+#   A) / A. / (A) / a) / A: / - A) / A) .. B) .. on one line        options
+#   Correct Answer: A / Answer - (b) / **Answer:** C / Answer: <text>
+#
+# Markdown emphasis is ignored, unnumbered questions are split after their
+# answer line, and explanation lines are skipped.
+_MARKER = re.compile(r"^[\s#>]*(?:Q(?:uestion)?\s*\d+\s*[.):\-–]*|\d+\s*[.)](?=\s|$))\s*(.*)$", re.I)
+_OPTION = re.compile(r"^[\s\-•]*\(?([A-Da-d])\s*[).:\]]\s*(.*)$")
+_INLINE_OPTION = re.compile(r"\s\(?([B-Db-d])\s*[).:\]]\s+")
+_ANSWER = re.compile(r"^[\s#>\-]*(?:correct\s+(?:answer|option|choice)|answer|ans)\b\s*(?:is)?\s*[:\-–=]?\s*(.*)$", re.I)
+_ANSWER_LETTER = re.compile(r"^(?:option\s*)?\(?([A-Da-d])(?:\s*[).:\]]|$|(\s))", re.I)
+_EXPLANATION = re.compile(r"^[\s#>\-]*(?:explanation|rationale|reason)\b", re.I)
+
+def split_options(letter, text):
+    """ "A", "x B) y C) z" -> [("A", "x"), ("B", "y"), ("C", "z")] """
+    found, start = [], 0
+    for m in _INLINE_OPTION.finditer(text):
+        found.append((letter, text[start:m.start()].strip()))
+        letter, start = m.group(1), m.end()
+    found.append((letter, text[start:].strip()))
+    return [(l.upper(), t) for l, t in found]
+
+def answer_letter(answer, options):
+    """Answer text -> A-D: a letter ("(b)", "Option C", "D) text") or the text of an option"""
+    answer = answer.strip(" *_.")
+    lowered = answer.lower()
+    for letter, text in options.items():
+        if text and lowered == text.lower():
+            return letter
+    m = _ANSWER_LETTER.match(answer)
+    # a bare lowercase "a" followed by words is an article, not option a
+    if m and not (m.group(2) and m.group(1).islower()):
+        return m.group(1).upper()
+    for letter, text in options.items():
+        if text and lowered.startswith(text.lower()):
+            return letter
+    return None
+
+def build_question(number, stem, options, answer, marks):
+    if not stem or any(not options.get(l) for l in "ABCD") or answer not in ("A", "B", "C", "D"):
+        return None
+    return Question(
+        question_number=number,
+        question_text=stem,
+        option_a=options["A"],
+        option_b=options["B"],
+        option_c=options["C"],
+        option_d=options["D"],
+        correct_answer=answer,
+        marks=marks
+    )
+
+def parse_block(number, lines, marks):
+    """Lines of one question block -> Question, or None if it is incomplete"""
+    stem, options, answer = [], {}, None
+    for line in lines:
+        m = _ANSWER.match(line)
+        if m and options:
+            answer = answer_letter(m.group(1), options)
+            continue
+        m = _OPTION.match(line)
+        if m and (stem or options):
+            for letter, text in split_options(m.group(1), m.group(2)):
+                options.setdefault(letter, text)
+            continue
+        if not options and answer is None:
+            stem.append(line)
+    return build_question(number, " ".join(stem).strip(), options, answer, marks)
+
+class QuestionStreamParser:
+    """Incremental, line-based MCQ parser.
+
+    feed() takes text deltas and returns the questions whose block has been
+    closed by the next question; close() flushes the final block. Only
+    complete lines are parsed, so markers split across deltas are safe.
+    """
+
+    def __init__(self, marks):
+        self.marks = marks
+        self.pending = ""
+        self.block = None           # lines of the open question
+        self.answered = False       # open block already has its answer line
+        self.count = 0
+        self.dropped = 0            # blocks with options that did not parse
+
+    def feed(self, delta):
+        self.pending += delta
+        *lines, self.pending = self.pending.split("\n")
+        return self._lines(lines)
+
+    def close(self):
+        lines, self.pending = [self.pending], ""
+        return self._lines(lines) + self._finish()
+
+    def _lines(self, lines):
+        done = []
+        for raw in lines:
+            line = raw.replace("**", "").replace("__", "").strip()
+            if not line or _EXPLANATION.match(line):
+                continue
+            marker = _MARKER.match(line)
+            if marker or self.block is None or (self.answered and not _OPTION.match(line)
+                                                and not _ANSWER.match(line)):
+                done += self._finish()
+                first = marker.group(1) if marker else line
+                self.block = [first] if first else []
+                continue
+            self.block.append(line)
+            if _ANSWER.match(line):
+                self.answered = True
+        return done
+
+    def _finish(self):
+        block, self.block, self.answered = self.block, None, False
+        if not block:
+            return []
+        q = parse_block(self.count + 1, block, self.marks)
+        if q:
+            self.count += 1
+            return [q]
+        if any(_OPTION.match(l) for l in block[1:]):
+            self.dropped += 1
+        return []
+
+def question_from_json(number, data, marks):
+    """One question object in any of the usual key spellings -> Question or None"""
+    if not isinstance(data, dict):
+        return None
+    stem = data.get("question") or data.get("question_text") or data.get("stem")
+    raw = data.get("options") or data.get("choices")
+    if isinstance(raw, dict):
+        options = {str(k).strip(" ()).:").upper(): str(v).strip() for k, v in raw.items()}
+    elif isinstance(raw, list):
+        options = {}
+        for letter, text in zip("ABCD", raw):
+            m = _OPTION.match(str(text))
+            options[letter] = (m.group(2) if m and m.group(1).upper() == letter else str(text)).strip()
+    else:
+        options = {l: str(data.get(f"option_{l.lower()}", "")).strip() for l in "ABCD"}
+
+    answer = data.get("answer") or data.get("correct_answer") or data.get("correct")
+    if isinstance(answer, int) and not isinstance(answer, bool) and 0 <= answer < 4:
+        letter = "ABCD"[answer]
+    else:
+        letter = answer_letter(str(answer or ""), options)
+    return build_question(number, str(stem or "").strip(), options, letter, marks)
+
+class JsonQuestionStreamParser:
+    """Same interface for structured (JSON) output.
+
+    Each question object is emitted as soon as its closing brace arrives,
+    whatever it is wrapped in ({"questions": [...]}, a bare array, code
+    fences). If the model ignored JSON mode, close() falls back to the
+    text parser.
+    """
+
+    def __init__(self, marks):
+        self.marks = marks
+        self.buf = ""
+        self.pos = 0
+        self.starts = []            # offsets of the open braces
+        self.in_string = False
+        self.escaped = False
+        self.count = 0
+        self.dropped = 0
+
+    def feed(self, delta):
+        self.buf += delta
+        done = []
+        for i in range(self.pos, len(self.buf)):
+            c = self.buf[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == "\\":
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+            elif c == '"':
+                self.in_string = True
+            elif c == "{":
+                self.starts.append(i)
+            elif c == "}" and self.starts:
+                q = self._object(self.buf[self.starts.pop():i + 1])
+                if q:
+                    done.append(q)
+        self.pos = len(self.buf)
+        return done
+
+    def close(self):
+        if self.count or not self.buf.strip():
+            return []
+        return parse_questions(self.buf, self.marks)
 
+    def _object(self, raw):
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            return None
+        if not any(k in data for k in ("question", "question_text", "stem")):
+            return None             # options dict or the wrapper object
+        q = question_from_json(self.count + 1, data, self.marks)
+        if q:
+            self.count += 1
+        else:
+            self.dropped += 1
+        return q
+
+def question_parser(marks, output=EXAM_OUTPUT):
+    return JsonQuestionStreamParser(marks) if output == "json" else QuestionStreamParser(marks)
+
+def parse_questions(ai, marks, output="text"):
+    parser = question_parser(marks, output)
+    return parser.feed(ai) + parser.close()
+
+# ----------------------------
+# MERGE
+# ----------------------------
+def question_key(q: Question):
+    """Normalized question text; batches that ask the same thing collapse to one"""
+    return " ".join(re.findall(r"[a-z0-9]+", q.question_text.lower()))
+
+class QuestionMerger:
+    """Merge questions from concurrent batches: dedupe, renumber, cap"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.seen = set()
+        self.questions = []
+        self.duplicates = 0
+
+    def add(self, questions):
+        """-> the questions that were kept, renumbered in arrival order"""
+        kept = []
+        for q in questions:
+            if len(self.questions) >= self.limit:
+                break
+            key = question_key(q)
+            if key in self.seen:
+                self.duplicates += 1
+                continue
+            self.seen.add(key)
+            q.question_number = len(self.questions) + 1
+            self.questions.append(q)
+            kept.append(q)
+        return kept
+
+def exam_response(req: ExamRequest, questions):
     return ExamResponse(
         exam_name=req.exam_name,
         topic=req.topic,
@@ -103,3 +378,192 @@ Correct Answer: A
         total_marks=len(questions) * req.marks_per_question,
         questions=questions
     )
+
+def batch_max_tokens(num_questions):
+    return 200 + TOKENS_PER_QUESTION * num_questions
+
+# ----------------------------
+# GENERATION
+# ----------------------------
+async def exam_questions(req: ExamRequest, contexts, stats, output=EXAM_OUTPUT, existing=None):
+    """Async generator of merged, de-duplicated questions as batches stream in.
+
+    The first round asks for every question in concurrent batches. While
+    the exam is still short (unparseable blocks, duplicates, truncation),
+    up to EXAM_TOPUP_ROUNDS more rounds ask only for the missing number,
+    listing the questions that already exist. existing (e.g. taken from
+    the question pool) count towards the exam and are not yielded again.
+    stats gets calls / rounds / dropped / duplicates / errors.
+    """
+    merger = QuestionMerger(req.num_questions)
+    merger.add(existing or [])
+    held = len(merger.questions)
+    queue = asyncio.Queue()
+    response_format = {"type": "json_object"} if output == "json" else None
+
+    async def consume(parser, num_questions, context, avoid):
+        stream = stream_grok(exam_prompt(req, context, num_questions, avoid, output),
+                             max_tokens=batch_max_tokens(num_questions), route="exam",
+                             timeout=EXAM_BATCH_TIMEOUT, response_format=response_format)
+        async with aclosing(stream):
+            async for delta in stream:
+                await queue.put(parser.feed(delta))
+        await queue.put(parser.close())
+
+    async def run_batch(num_questions, context, avoid):
+        parser = question_parser(req.marks_per_question, output)
+        try:
+            # httpx's timeout is per read: a stream that keeps trickling never hits it.
+            # This is the batch's wall-clock deadline; questions parsed so far are kept.
+            await asyncio.wait_for(consume(parser, num_questions, context, avoid), EXAM_BATCH_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"⏱️ Exam batch of {num_questions} exceeded {EXAM_BATCH_TIMEOUT}s, cut off")
+            await queue.put(TimeoutError(f"exam batch exceeded {EXAM_BATCH_TIMEOUT}s"))
+        except Exception as e:
+            traceback.print_exc()
+            await queue.put(e)
+        finally:
+            stats["dropped"] += parser.dropped
+            await queue.put(None)
+
+    for round_no in range(1 + EXAM_TOPUP_ROUNDS):
+        missing = req.num_questions - len(merger.questions)
+        if missing <= 0:
+            break
+        avoid = [q.question_text for q in merger.questions][-EXAM_AVOID_LIMIT:] \
+            if round_no or held else None
+        tasks = [asyncio.create_task(run_batch(n, contexts[(i + round_no) % len(contexts)], avoid))
+                 for i, n in enumerate(exam_batches(missing))]
+        stats["calls"] += len(tasks)
+        stats["requested"] += missing
+        stats["rounds"] += 1
+
+        before, running = len(merger.questions), len(tasks)
+        try:
+            while running:
+                item = await queue.get()
+                if item is None:
+                    running -= 1
+                elif isinstance(item, Exception):
+                    stats["errors"].append(item)
+                else:
+                    for q in merger.add(item):
+                        yield q
+        finally:
+            for t in tasks:
+                t.cancel()
+        if len(merger.questions) == before:
+            break                   # nothing new this round: more calls would not help
+
+    stats["duplicates"] = merger.duplicates
+    print(f"📝 Exam: {len(merger.questions)}/{req.num_questions} questions ({held} from the pool), "
+          f"{stats['calls']} calls in "
+          f"{stats['rounds']} rounds, {stats['dropped']} unparseable, {merger.duplicates} duplicates")
+
+def exam_stats():
+    return {"calls": 0, "requested": 0, "rounds": 0, "dropped": 0, "duplicates": 0, "errors": []}
+
+# ----------------------------
+# QUESTION POOL
+# ----------------------------
+# Generated questions are kept per (topic, book, chapter) in the artifact
+# store. A request takes a random sample of the pool and only the
+# questions the pool is short of are generated (and added to it).
+def question_data(q: Question):
+    """Question -> pool entry (number and marks are set per exam)"""
+    return {"question_text": q.question_text, "option_a": q.option_a, "option_b": q.option_b,
+            "option_c": q.option_c, "option_d": q.option_d, "correct_answer": q.correct_answer}
+
+def pool_key(req: ExamRequest):
+    book = resolve_book_name(req.book) if req.book else None
+    return artifact_key("exam", req.topic, GROK_MODEL, book, req.chapter_id)
+
+def pooled_questions(req: ExamRequest):
+    """(pool key, Questions sampled from the pool); (None, []) with the store disabled"""
+    store = get_store()
+    if store is None:
+        return None, []
+    key = pool_key(req)
+    picked, _ = store.sample(key, req.num_questions)
+    return key, [Question(question_number=i + 1, marks=req.marks_per_question, **data)
+                 for i, data in enumerate(picked)]
+
+def save_to_pool(key, req: ExamRequest, questions):
+    store = get_store()
+    if store is None or key is None or not questions:
+        return 0
+    return store.add_questions(key, req.topic, [(question_key(q), question_data(q)) for q in questions])
+
+async def fill_pool(req: ExamRequest):
+    """Generate until the pool for req holds req.num_questions -> questions added"""
+    store = get_store()
+    if store is None:
+        return 0
+    key = pool_key(req)
+    pool = [Question(question_number=i + 1, marks=req.marks_per_question, **data)
+            for i, data in enumerate(store.pool(key))]
+    missing = req.num_questions - len(pool)
+    if missing <= 0:
+        return 0
+    contexts = await exam_context(req, len(exam_batches(missing)) or 1)
+    stats = exam_stats()
+    new = [q async for q in exam_questions(req, contexts, stats, existing=pool)]
+    if not new and stats["errors"]:
+        raise stats["errors"][0]
+    return save_to_pool(key, req, new)
+
+# ----------------------------
+# ENDPOINTS
+# ----------------------------
+@router.post("/generate-exam", response_model=ExamResponse)
+async def generate_exam(req: ExamRequest):
+    key, held = pooled_questions(req)
+    missing = req.num_questions - len(held)
+    if missing <= 0:
+        print(f"⚡ Exam served from the question pool: {len(held)} questions")
+        return exam_response(req, held)
+
+    contexts = await exam_context(req, len(exam_batches(missing)) or 1)
+    stats = exam_stats()
+    new = [q async for q in exam_questions(req, contexts, stats, existing=held)]
+    save_to_pool(key, req, new)
+    questions = held + new
+    if not questions and stats["errors"]:
+        raise HTTPException(status_code=500, detail="AI failed")
+    return exam_response(req, questions)
+
+@router.post("/generate-exam/stream")
+async def generate_exam_stream(req: ExamRequest):
+    """
+    Exam streamed as SSE: questions from the pool are sent first, then
+    batches for the rest stream concurrently and each parsed, de-duplicated
+    Question is sent as a "question" event as soon as its block is
+    complete (top-up questions included), then done {ExamResponse}.
+    """
+    key, held = pooled_questions(req)
+    missing = req.num_questions - len(held)
+    contexts = await exam_context(req, len(exam_batches(missing)) or 1) if missing > 0 else []
+
+    async def events():
+        stats = exam_stats()
+        questions = list(held)
+        for q in held:
+            yield sse_event("question", q)
+        if contexts:
+            new = []
+            try:
+                # aclosing: a client that disconnects cancels the batches still running
+                async with aclosing(exam_questions(req, contexts, stats, existing=held)) as stream:
+                    async for q in stream:
+                        new.append(q)
+                        yield sse_event("question", q)
+            finally:
+                save_to_pool(key, req, new)
+            questions += new
+
+        if stats["errors"] and not questions:
+            yield sse_event("error", {"detail": str(stats["errors"][0])})
+            return
+        yield sse_event("done", exam_response(req, questions))
+
+    return sse_response(events())
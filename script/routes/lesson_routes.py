@@ -1,17 +1,16 @@
 from fastapi import APIRouter, HTTPException
+import traceback
 from pydantic import BaseModel
 from typing import List
-import os, requests
 from dotenv import load_dotenv
+from llm_client import ask_grok, stream_grok, GROK_MODEL
+from streaming import sse_event, sse_response
+from artifact_store import get_store, artifact_key
 
 load_dotenv()
 
 router = APIRouter()
 
-GROK_API_KEY = os.getenv("GROK_API_KEY")
-GROK_URL = "https://api.x.ai/v1/chat/completions"
-GROK_MODEL = "grok-3"
-
 class LessonRequest(BaseModel):
     lesson_plan_name: str
     topic: str
@@ -20,35 +19,40 @@ class LessonResponse(BaseModel):
     lesson_plan_name: str
     content: str
 
-def ask_grok(prompt):
-    headers = {
-        "Authorization": f"Bearer {GROK_API_KEY}",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "model": "grok-3",
-        "messages": [{"role": "user", "content": prompt}],
-        "max_tokens": 3000
-    }
-    
-    try:
-        r = requests.post(GROK_URL, headers=headers, json=payload, timeout=60)
-        print(f"Status: {r.status_code}")
-        print(f"Response: {r.text[:500]}")  # First 500 chars
-        
-        if r.status_code != 200:
-            print(f"Error: {r.text}")
-            return None
-            
-        return r.json()["choices"][0]["message"]["content"]
-    except Exception as e:
-        print(f"Exception: {str(e)}")
-        return None
+def lesson_prompt(req: LessonRequest):
+    return f"Create a detailed medical lesson plan on {req.topic}"
+
+# ----------------------------
+# ARTIFACT STORE
+# ----------------------------
+# A lesson plan is generated once per topic (and model / corpus version)
+# and served from the artifact store afterwards.
+def lesson_key(topic):
+    return artifact_key("lesson", topic, GROK_MODEL)
+
+def stored_lesson(topic):
+    store = get_store()
+    return store.get_lesson(lesson_key(topic)) if store is not None else None
+
+def save_lesson(topic, content):
+    store = get_store()
+    if store is not None and content:
+        store.put_lesson(lesson_key(topic), topic, content)
+
+async def create_lesson(topic):
+    """Generate and store the lesson plan for topic -> content (None if the AI failed)"""
+    content = await ask_grok(lesson_prompt(LessonRequest(lesson_plan_name="", topic=topic)),
+                             max_tokens=3000, route="lesson")
+    save_lesson(topic, content)
+    return content
 
 @router.post("/generate-lesson-plan", response_model=LessonResponse)
 async def generate_lesson(req: LessonRequest):
-    prompt = f"Create a detailed medical lesson plan on {req.topic}"
-    content = ask_grok(prompt)
+    content = stored_lesson(req.topic)
+    if content is not None:
+        print("⚡ Lesson plan served from the artifact store:", req.topic)
+    else:
+        content = await create_lesson(req.topic)
     if not content:
         raise HTTPException(status_code=500, detail="AI failed")
 
@@ -56,3 +60,33 @@ async def generate_lesson(req: LessonRequest):
         lesson_plan_name=req.lesson_plan_name,
         content=content
     )
+
+@router.post("/generate-lesson-plan/stream")
+async def generate_lesson_stream(req: LessonRequest):
+    """Lesson plan streamed as SSE: token* -> done {lesson_plan_name, content}"""
+    stored = stored_lesson(req.topic)
+
+    async def events():
+        if stored is not None:
+            yield sse_event("token", {"text": stored})
+            yield sse_event("done", {"lesson_plan_name": req.lesson_plan_name, "content": stored})
+            return
+
+        parts = []
+        try:
+            async for delta in stream_grok(lesson_prompt(req), max_tokens=3000, route="lesson"):
+                parts.append(delta)
+                yield sse_event("token", {"text": delta})
+        except Exception as e:
+            traceback.print_exc()
+            yield sse_event("error", {"detail": str(e)})
+            return
+
+        content = "".join(parts)
+        if not content:
+            yield sse_event("error", {"detail": "AI failed"})
+            return
+        save_lesson(req.topic, content)
+        yield sse_event("done", {"lesson_plan_name": req.lesson_plan_name, "content": content})
+
+    return sse_response(events())
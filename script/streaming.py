@@ -0,0 +1,26 @@
+import json
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+
+# ----------------------------
+# SERVER-SENT EVENTS
+# ----------------------------
+# Streaming endpoints emit named events, each with a JSON data line:
+#   event: sources | token | question | error | done
+#   data: {...}
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+
+def sse_response(events):
+    """Wrap an async generator of sse_event() strings as an SSE response"""
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # disable proxy buffering (nginx)
+        },
+    )
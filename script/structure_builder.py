@@ -8,133 +8,307 @@ OUT_DIR = os.path.join(BASE_DIR, "data", "structured")
 os.makedirs(OUT_DIR, exist_ok=True)
 
 # -------------------------
-# HEADING DETECTOR
+# PATTERNS
 # -------------------------
-def is_heading(line):
-    line = line.strip()
+# Compiled once. _HEADING answers both pattern questions in one match:
+# group 1 set -> "Chapter N", otherwise a numbered heading ("2.3 Diagnosis").
+_HEADING = re.compile(r"(chapter|CHAPTER)\s+\d+|\d+(?:\.\d+)*\s+[A-Za-z]")
+_SENTENCE_BREAK = re.compile(r"(?<=[.!?])\s+(?=[A-Z])")
+
+# -------------------------
+# TYPOGRAPHY
+# -------------------------
+# Pages from extract_pages carry "lines" with font size and weight. A line
+# is a heading when it is set larger than the body text (or bold and a
+# little larger); the body size is the size holding the most characters
+# seen so far, so a book is read once, front to back.
+CHAPTER_RATIO = 1.5         # size / body size of a chapter title
+SECTION_RATIO = 1.15        # ... of a section heading
+BOLD_SECTION_RATIO = 1.05   # bold headings may be set a little smaller
+MAX_HEADING_CHARS = 120
 
-    if len(line) < 5 or len(line) > 120:
-        return False
 
-    # CHAPTER headings
-    if re.match(r"(chapter|CHAPTER)\s+\d+", line):
-        return True
+class BodySize:
+    """Running estimate of the body font size"""
 
-    # Numeric headings: 1 Introduction, 2.3 Diagnosis
-    if re.match(r"\d+(\.\d+)*\s+[A-Za-z]", line):
-        return True
+    def __init__(self):
+        self.chars = {}
 
-    # Uppercase titles
-    if line.isupper():
-        return True
+    def add(self, lines):
+        chars = self.chars
+        for line in lines:
+            size = line["size"]
+            chars[size] = chars.get(size, 0) + len(line["text"])
 
-    return False
+    def value(self):
+        return max(self.chars, key=self.chars.get) if self.chars else None
 
 
 # -------------------------
-# SENTENCE SPLITTER
+# HEADING CLASSIFIER
 # -------------------------
-def split_sentences(text):
-    text = re.sub(r"\s+", " ", text)
-    sentences = re.split(r"(?<=[.!?])\s+(?=[A-Z])", text)
-    return [s.strip() for s in sentences if len(s.strip()) > 30]
+def classify(text, size=None, bold=False, body=None):
+    """"chapter", "section" or None for one line.
+
+    With a font size the line is judged on typography (plus "Chapter N" at
+    body size); without one (text-only pages) on the heading patterns.
+    Body-text lines are rejected on the first comparison.
+    """
+    if size is None:
+        m = _HEADING.match(text)
+        if m and m.group(1):
+            return "chapter"
+        if len(text) > MAX_HEADING_CHARS:
+            return None
+        return "section" if m or text.isupper() else None
+
+    ratio = size / body if body else 1.0
+    if ratio < BOLD_SECTION_RATIO and (ratio < 1.0 or text[:1] not in "cC"):
+        return None
+    if len(text) < 3 or len(text) > MAX_HEADING_CHARS or not any(c.isalpha() for c in text):
+        return None
+    if text.endswith(".") and len(text) > 60:   # a sentence set in large type
+        return None
+
+    if ratio >= CHAPTER_RATIO:
+        return "chapter"
+    if ratio >= 1.0 and text[:1] in "cC":
+        m = _HEADING.match(text)
+        if m and m.group(1):
+            return "chapter"
+    if ratio >= SECTION_RATIO or (bold and ratio >= BOLD_SECTION_RATIO):
+        return "section"
+    return None
+
+
+def is_heading(line):
+    """Pattern heading test for one plain-text line"""
+    line = line.strip()
+    return 5 <= len(line) <= MAX_HEADING_CHARS and classify(line) is not None
 
 
 # -------------------------
-# STRUCTURE BUILDER
+# SENTENCE SPLITTER
 # -------------------------
-def build_structure(pages):
+def join_lines(lines):
+    """Wrapped lines -> one text, re-joining words hyphenated at a line end"""
+    parts = []
+    for line in lines:
+        if parts:
+            last = parts[-1]
+            if len(last) > 1 and last[-1] == "-" and last[-2].isalpha() and line[:1].islower():
+                parts[-1] = last[:-1] + line
+                continue
+        parts.append(line)
+    return " ".join(parts)
 
-    chapters = []
 
-    # Always create first chapter
-    current_chapter = {
-        "chapter_id": "AUTO_CH_01",
-        "chapter_title": "Auto Chapter 1",
-        "sections": [],
-        "page_start": pages[0]["page_no"]
-    }
+def split_sentences(text):
+    text = " ".join(text.split())
+    return [s for s in _SENTENCE_BREAK.split(text) if len(s) > 30]
+
 
-    chapter_index = 1
-    current_section = None
+# -------------------------
+# STRUCTURE BUILDER
+# -------------------------
+def iter_structure(pages):
+    """Stream structure events from an iterable of pages:
+
+    ("chapter", {chapter_id, chapter_title, page_start})  chapter opened
+    ("section", {heading, content, page_start})         section complete
+    ("chapter_end", page_end)                           chapter closed
+
+    Pages with "lines" are split on typography, older text-only pages on
+    the heading patterns. Heading lines that repeat on consecutive pages
+    are running headers and skipped; consecutive heading lines of one
+    level are a wrapped title and merged. Chapters without content are
+    dropped. Pages are pulled one at a time and only the section being
+    filled is held in memory, so book length does not matter.
+    """
+    body = BodySize()
+    chapter_index = 0
+    chapter = None          # open chapter, emitted with its first section
+    section = None          # {"heading", "content": [lines], "page_start"}
+    last_level = None       # level of the previous line if it was a heading
+    previous_headings, page_headings = set(), set()
+    page_no = None
+
+    def close_section():
+        nonlocal chapter_index
+        if section is None:
+            return
+        sentences = split_sentences(join_lines(section["content"]))
+        if not sentences:
+            return
+        if not chapter.get("chapter_id"):
+            chapter_index += 1
+            chapter["chapter_id"] = f"AUTO_CH_{chapter_index:02}"
+            yield "chapter", {
+                "chapter_id": chapter["chapter_id"],
+                "chapter_title": chapter["chapter_title"],
+                "page_start": chapter["page_start"]
+            }
+        yield "section", dict(section, content=sentences)
 
     for page in pages:
         page_no = page["page_no"]
-        lines = page["text"].split("\n")
-
-        for line in lines:
-            line = line.strip()
-
-            if len(line) < 15:
+        if chapter is None:
+            chapter = {"chapter_title": "Auto Chapter 1", "page_start": page_no}
+
+        lines = page.get("lines")
+        if lines is not None:
+            body.add(lines)
+            size = body.value()
+            items = ((l["text"], l["size"], l["bold"]) for l in lines)
+        else:
+            items = ((t, None, False) for t in map(str.strip, page["text"].split("\n"))
+                     if len(t) >= 15)
+
+        previous_headings, page_headings = page_headings, set()
+        for text, line_size, bold in items:
+            level = classify(text, line_size, bold, size) if line_size is not None else classify(text)
+
+            if level is None:
+                if section is None:
+                    section = {"heading": "General", "content": [], "page_start": page_no}
+                section["content"].append(text)
+                last_level = None
                 continue
 
-            # CHAPTER detection
-            if re.match(r"(chapter|CHAPTER)\s+\d+", line):
-                current_chapter["page_end"] = page_no
-                chapters.append(current_chapter)
-
-                chapter_index += 1
-                current_chapter = {
-                    "chapter_id": f"AUTO_CH_{chapter_index:02}",
-                    "chapter_title": line,
-                    "sections": [],
-                    "page_start": page_no
-                }
-                current_section = None
-                continue
+            page_headings.add(text)
+            if text in previous_headings:
+                continue                        # running header / footer
+
+            if level == "chapter":
+                if last_level == "chapter" and section is None:
+                    chapter["chapter_title"] += " " + text
+                    continue
+                yield from close_section()
+                if chapter.get("chapter_id"):
+                    yield "chapter_end", page_no
+                chapter = {"chapter_title": text, "page_start": page_no}
+                section = None
+            else:
+                if last_level == "section" and not section["content"]:
+                    section["heading"] += " " + text
+                    continue
+                yield from close_section()
+                section = {"heading": text, "content": [], "page_start": page_no}
+            last_level = level
+
+    if chapter is not None:
+        yield from close_section()
+        if chapter.get("chapter_id"):
+            yield "chapter_end", page_no
+
+
+def iter_sections(pages):
+    """(chapter_id, section) pairs as each section completes"""
+    chapter_id = None
+    for kind, data in iter_structure(pages):
+        if kind == "chapter":
+            chapter_id = data["chapter_id"]
+        elif kind == "section":
+            yield chapter_id, data
 
-            # Section heading
-            if is_heading(line):
-                current_section = {
-                    "heading": line,
-                    "content": [],
-                    "page_start": page_no
-                }
-                current_chapter["sections"].append(current_section)
-                continue
 
-            # Normal text
-            sentences = split_sentences(line)
-            if not sentences:
-                continue
-
-            if not current_section:
-                current_section = {
-                    "heading": "General",
-                    "content": [],
-                    "page_start": page_no
-                }
-                current_chapter["sections"].append(current_section)
-
-            current_section["content"].extend(sentences)
+def build_structure(pages):
 
-    current_chapter["page_end"] = pages[-1]["page_no"]
-    chapters.append(current_chapter)
+    chapters = []
+    current_chapter = None
+
+    for kind, data in iter_structure(pages):
+        if kind == "chapter":
+            current_chapter = {
+                "chapter_id": data["chapter_id"],
+                "chapter_title": data["chapter_title"],
+                "sections": [],
+                "page_start": data["page_start"]
+            }
+        elif kind == "section":
+            current_chapter["sections"].append(data)
+        else:
+            current_chapter["page_end"] = data
+            chapters.append(current_chapter)
 
     return chapters
 
 
 # -------------------------
-# RUN FOR ALL BOOKS
+# PAGE FILES
 # -------------------------
-if __name__ == "__main__":
+def iter_page_file(path):
+    """Pages one at a time from *_pages.jsonl (legacy *_pages.json is loaded whole)"""
+    with open(path, "r", encoding="utf-8") as f:
+        if not path.endswith(".jsonl"):
+            yield from json.load(f)
+            return
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+def load_pages(path):
+    """Read a *_pages.jsonl (one page per line) or legacy *_pages.json file"""
+    return list(iter_page_file(path))
+
+def page_files(in_dir):
+    """book_id -> pages file, preferring jsonl over the legacy json array"""
+    found = {}
+    for file in sorted(os.listdir(in_dir)):
+        for suffix in ("_pages.json", "_pages.jsonl"):
+            if file.endswith(suffix):
+                found[file[: -len(suffix)]] = os.path.join(in_dir, file)
+    return found
+
 
-    for file in os.listdir(IN_DIR):
-        if not file.endswith("_pages.json"):
-            continue
+# -------------------------
+# BOOK STRUCTURE
+# -------------------------
+STAGE_VERSION = 2  # bump when structure output changes for the same input
+
+def write_structure(book_id, events, out_path):
+    """Structure events -> <book>_structured.json, written as they arrive
+
+    Same document as json.dump({"book_id", "chapters"}), but never more
+    than one section in memory. Returns the number of chapters.
+    """
+    chapters = 0
+    sections = 0
+    tmp = out_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write('{\n  "book_id": %s,\n  "chapters": [' % json.dumps(book_id, ensure_ascii=False))
+        for kind, data in events:
+            if kind == "chapter":
+                f.write(",\n" if chapters else "\n")
+                f.write('    {"chapter_id": %s, "chapter_title": %s, "page_start": %d, "sections": [' % (
+                    json.dumps(data["chapter_id"]),
+                    json.dumps(data["chapter_title"], ensure_ascii=False),
+                    data["page_start"]))
+                chapters += 1
+                sections = 0
+            elif kind == "section":
+                f.write(",\n" if sections else "\n")
+                f.write("      " + json.dumps(data, ensure_ascii=False))
+                sections += 1
+            else:
+                f.write('\n    ], "page_end": %d}' % data)
+        f.write("\n  ]\n}\n")
+    os.replace(tmp, out_path)
+    return chapters
 
-        book_id = file.replace("_pages.json", "")
-        pages = json.load(open(os.path.join(IN_DIR, file), encoding="utf-8"))
+def structure_book(book_id, pages_path):
+    """pages file -> <book>_structured.json; returns its path"""
+    out_path = os.path.join(OUT_DIR, f"{book_id}_structured.json")
+    chapters = write_structure(book_id, iter_structure(iter_page_file(pages_path)), out_path)
 
-        chapters = build_structure(pages)
+    print(f"✅ Structured → {book_id} | Chapters: {chapters}")
+    return out_path
 
-        structured = {
-            "book_id": book_id,
-            "chapters": chapters
-        }
 
-        out_path = os.path.join(OUT_DIR, f"{book_id}_structured.json")
-        json.dump(structured, open(out_path, "w", encoding="utf-8"),
-                  indent=2, ensure_ascii=False)
+# -------------------------
+# RUN FOR ALL BOOKS
+# -------------------------
+if __name__ == "__main__":
 
-        print(f"✅ Structured → {book_id} | Chapters: {len(chapters)}")
+    for book_id, path in page_files(IN_DIR).items():
+        structure_book(book_id, path)
@@ -0,0 +1,114 @@
+import re
+import sys
+import json
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# =========================================================
+# LOCAL GROK STUB
+# =========================================================
+# Minimal OpenAI-compatible /v1/chat/completions server for local runs and
+# benchmarks without an API key:
+#
+#   python stub_grok.py 8001 0.5 0.1 0.3  # port, delay per call, extra delay per MCQ (s), messy
+#   GROK_URL=http://127.0.0.1:8001/v1/chat/completions uvicorn app:app
+#
+# MCQ prompts ("Create N MCQs ...") get N questions back, worded per prompt
+# so questions from different prompts are distinct. With a messy fraction,
+# that share of questions comes in other common formats (Question 1:, (A),
+# **Answer:**, inline options) and a quarter of it is left out, the way
+# real completions come back short. response_format json_object requests
+# get {"questions": [...]}.
+# Requests with "stream": true are answered as OpenAI-style SSE deltas.
+
+PORT = int(sys.argv[1]) if len(sys.argv) > 1 else 8001
+DELAY = float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+MCQ_DELAY = float(sys.argv[3]) if len(sys.argv) > 3 else 0.0   # generation time grows with output
+MESSY = float(sys.argv[4]) if len(sys.argv) > 4 else 0.0
+
+OPTIONS = ["Option one", "Option two", "Option three", "Option four"]
+
+
+def fake_mcq(i, stem, answer, style):
+    if style == 1:
+        return (f"Question {i}: {stem}\n" + "\n".join(f"({l}) {o}" for l, o in zip("ABCD", OPTIONS))
+                + f"\nAnswer: ({answer.lower()})\nExplanation: see the source.\n")
+    if style == 2:
+        return (f"**Q{i}.** {stem}\n" + "\n".join(f"{l}. {o}" for l, o in zip("ABCD", OPTIONS))
+                + f"\n**Correct Answer:** {answer}\n")
+    if style == 3:
+        return (f"{i}) {stem}\n" + " ".join(f"{l}) {o}" for l, o in zip("ABCD", OPTIONS))
+                + f"\nCorrect answer - {answer}\n")
+    return (f"Q{i}. {stem}\n" + "\n".join(f"{l}) {o}" for l, o in zip("ABCD", OPTIONS))
+            + f"\nCorrect Answer: {answer}\n")
+
+
+def fake_mcqs(n, prompt, as_json=False):
+    tag = f"{zlib.crc32(prompt.encode()):08x}"
+    blocks, questions = [], []
+    for i in range(1, n + 1):
+        roll = zlib.crc32(f"{tag}{i}".encode()) / 2 ** 32
+        if roll < MESSY / 4:
+            continue                                    # came back short
+        stem, answer = f"Stub question number {i} ({tag})?", "ABCD"[i % 4]
+        style = 1 + i % 3 if roll < MESSY else 0
+        blocks.append(fake_mcq(len(blocks) + 1, stem, answer, style))
+        questions.append({"question": stem, "options": dict(zip("ABCD", OPTIONS)), "answer": answer})
+    return json.dumps({"questions": questions}) if as_json else "\n".join(blocks)
+
+
+def fake_answer(prompt, as_json=False):
+    m = re.search(r"Create (\d+) MCQs", prompt)
+    if m:
+        return fake_mcqs(int(m.group(1)), prompt, as_json)
+    return f"Stub answer for a {len(prompt)}-char prompt."
+
+
+def delay_for(prompt):
+    m = re.search(r"Create (\d+) MCQs", prompt)
+    return DELAY + (MCQ_DELAY * int(m.group(1)) if m else 0.0)
+
+
+class Handler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        prompt = body.get("messages", [{}])[-1].get("content", "")
+        as_json = (body.get("response_format") or {}).get("type") == "json_object"
+
+        if body.get("stream"):
+            return self.stream(fake_answer(prompt, as_json), delay_for(prompt))
+
+        time.sleep(delay_for(prompt))
+        data = json.dumps({
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": fake_answer(prompt, as_json)}}]
+        }).encode()
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def stream(self, answer, delay):
+        # OpenAI-style SSE: one delta per word, delay spread over the answer
+        words = answer.split(" ")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for i, w in enumerate(words):
+            time.sleep(delay / len(words))
+            delta = {"choices": [{"index": 0, "delta": {"content": w if i == 0 else " " + w}}]}
+            self.wfile.write(f"data: {json.dumps(delta)}\n\n".encode())
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def log_message(self, *args):
+        pass
+
+
+if __name__ == "__main__":
+    print(f"🧪 Grok stub on http://127.0.0.1:{PORT}/v1/chat/completions (delay {DELAY}s)")
+    ThreadingHTTPServer(("127.0.0.1", PORT), Handler).serve_forever()
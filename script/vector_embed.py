@@ -1,12 +1,21 @@
 import os
+import sys
 import json
 import uuid
 import time
+import hashlib
+import argparse
+import queue
+import threading
 from dotenv import load_dotenv
 from qdrant_client import QdrantClient
-from qdrant_client.models import VectorParams, Distance, PointStruct
-from sentence_transformers import SentenceTransformer
+from qdrant_client.models import (
+    VectorParams, Distance, PointStruct, PointIdsList, PayloadSchemaType,
+    TextIndexParams, TextIndexType, TokenizerType, OverwritePayloadOperation, SetPayload,
+    Filter, FieldCondition, MatchValue
+)
 from qdrant_client.http.exceptions import ResponseHandlingException
+from embedding_store import EmbeddingStore, chunk_hash
 
 # =========================================================
 # LOAD ENV
@@ -18,71 +27,120 @@ QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 # CONFIG
 # =========================================================
 COLLECTION_NAME = "medical_chunks"
+MODEL_NAME = "BAAI/bge-small-en-v1.5"
 VECTOR_DIM = 384
-BATCH_SIZE = 8              # 🔥 VERY SAFE
+ENCODE_BATCH = 256          # texts per model.encode call
+UPSERT_BATCH = 256          # points per Qdrant upsert
+UPSERT_THREADS = 2          # concurrent upsert workers
+QUEUE_SIZE = 8              # encoded batches waiting for upload (backpressure)
+EMBED_WORKERS = int(os.getenv("EMBED_WORKERS", str(os.cpu_count() or 1)))
 TIMEOUT = 120               # 🔥 HIGH TIMEOUT
 RETRY_LIMIT = 5             # 🔁 retries
-SLEEP_BETWEEN_BATCH = 0.3   # 🐢 throttle
 
 # =========================================================
 # PATH HANDLING
 # =========================================================
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 CHUNKS_DIR = os.path.join(PROJECT_ROOT, "data", "chunks")
-
-print(f"[INFO] Using chunks folder: {CHUNKS_DIR}")
+INDEX_DIR = os.path.join(PROJECT_ROOT, "data", "index")
+INDEX_MANIFEST = os.path.join(INDEX_DIR, f"{COLLECTION_NAME}_manifest.json")
+STORE_DIR = os.path.join(INDEX_DIR, "embeddings")
+STORE_DTYPE = os.getenv("EMBED_STORE_DTYPE", "float32")  # or float16 (half the disk)
 
 # =========================================================
-# LOAD EMBEDDING MODEL
+# EMBEDDING MODEL
 # =========================================================
-print("[INFO] Loading BAAI/bge-small-en-v1.5 model...")
-model = SentenceTransformer("BAAI/bge-small-en-v1.5", device="cpu")
+PREFIX = "Represent this sentence for retrieval: "
 
-def get_embedding(text: str) -> list:
-    text = "Represent this sentence for retrieval: " + text
-    return model.encode(text, normalize_embeddings=True).tolist()
+# Anything that changes the vector for a given text must be part of this:
+# a new model or prefix gives every chunk a new point id.
+EMBED_VERSION = f"{MODEL_NAME}|{PREFIX}"
+POINT_NAMESPACE = uuid.UUID("6f1c3a52-8d0e-4b7a-9a57-3f1e2c9d4b10")
 
-# =========================================================
-# INIT QDRANT
-# =========================================================
-client = QdrantClient(url=QDRANT_URL, timeout=TIMEOUT)
+def load_model():
+    # imported here: syncing / local index builds from the embedding store need no model
+    from sentence_transformers import SentenceTransformer
+    print(f"[INFO] Loading {MODEL_NAME} model...")
+    return SentenceTransformer(MODEL_NAME, device="cpu")
 
-print("[INFO] Resetting Qdrant collection...")
-try:
-    client.delete_collection(collection_name=COLLECTION_NAME)
-except Exception:
-    pass
+def open_store():
+    """Local vector store for the current EMBED_VERSION"""
+    return EmbeddingStore(STORE_DIR, EMBED_VERSION, VECTOR_DIM, STORE_DTYPE)
 
-client.create_collection(
-    collection_name=COLLECTION_NAME,
-    vectors_config=VectorParams(
-        size=VECTOR_DIM,
-        distance=Distance.COSINE
-    )
-)
-
-print("[INFO] Qdrant collection ready (384-dim)")
+def encode_batches(model, texts, pool=None):
+    """Yield (start, vectors) per ENCODE_BATCH slice of texts"""
+    # with a multi-process pool, hand every worker a full batch per call
+    step = ENCODE_BATCH * (EMBED_WORKERS if pool else 1)
+    for start in range(0, len(texts), step):
+        batch = [PREFIX + t for t in texts[start:start + step]]
+        if pool:
+            vectors = model.encode_multi_process(
+                batch, pool, batch_size=ENCODE_BATCH, chunk_size=ENCODE_BATCH,
+                normalize_embeddings=True
+            )
+        else:
+            vectors = model.encode(batch, batch_size=ENCODE_BATCH, normalize_embeddings=True)
+        yield start, vectors
 
 # =========================================================
-# LOAD CHUNKS
+# QDRANT
 # =========================================================
-all_chunks = []
+def get_client():
+    return QdrantClient(url=QDRANT_URL, timeout=TIMEOUT)
 
-for file in os.listdir(CHUNKS_DIR):
-    if file.endswith(".json"):
-        with open(os.path.join(CHUNKS_DIR, file), "r", encoding="utf-8") as f:
-            all_chunks.extend(json.load(f))
+# Filterable payload fields: keyword indexes for scoping a search to one
+# book / chapter, full-text index on the chunk content
+PAYLOAD_INDEXES = {
+    "book": PayloadSchemaType.KEYWORD,
+    "book_id": PayloadSchemaType.KEYWORD,
+    "chapter_id": PayloadSchemaType.KEYWORD,
+    "section": PayloadSchemaType.KEYWORD,
+    "content": TextIndexParams(
+        type=TextIndexType.TEXT,
+        tokenizer=TokenizerType.WORD,
+        min_token_len=2,
+        lowercase=True
+    ),
+}
 
-total = len(all_chunks)
-print(f"[INFO] Total chunks loaded: {total}")
+def ensure_collection(client):
+    """Create the collection if it is missing -> True if it was just created (empty)"""
+    created = not client.collection_exists(COLLECTION_NAME)
+    if created:
+        reset_collection(client)
+    ensure_payload_indexes(client)
+    return created
 
-# =========================================================
-# SAFE UPSERT WITH RETRY
-# =========================================================
-points = []
-uploaded = 0
+def ensure_payload_indexes(client):
+    schema = client.get_collection(COLLECTION_NAME).payload_schema or {}
+    for field, field_schema in PAYLOAD_INDEXES.items():
+        if field not in schema:
+            client.create_payload_index(
+                collection_name=COLLECTION_NAME,
+                field_name=field,
+                field_schema=field_schema,
+                wait=True
+            )
+            print(f"[INFO] Payload index created: {field}")
+
+def reset_collection(client):
+    print("[INFO] Resetting Qdrant collection...")
+    try:
+        client.delete_collection(collection_name=COLLECTION_NAME)
+    except Exception:
+        pass
+
+    client.create_collection(
+        collection_name=COLLECTION_NAME,
+        vectors_config=VectorParams(
+            size=VECTOR_DIM,
+            distance=Distance.COSINE
+        )
+    )
+    ensure_payload_indexes(client)
+    print(f"[INFO] Qdrant collection ready ({VECTOR_DIM}-dim)")
 
-def safe_upsert(points):
+def safe_upsert(client, points):
     for attempt in range(1, RETRY_LIMIT + 1):
         try:
             client.upsert(
@@ -91,37 +149,326 @@ def safe_upsert(points):
                 wait=True
             )
             return True
-        except ResponseHandlingException as e:
+        except ResponseHandlingException:
             print(f"[WARN] Upsert failed (attempt {attempt}/{RETRY_LIMIT})")
             time.sleep(2 * attempt)
     return False
 
-for chunk in all_chunks:
-    points.append(
-        PointStruct(
-            id=str(uuid.uuid4()),
-            vector=get_embedding(chunk["text"]),
-            payload={
-                "content": chunk["text"],
-                "source": chunk.get("source"),
-                "chapter": chunk.get("chapter")
-            }
-        )
+def upsert_worker(client, q, stats, lock):
+    while True:
+        points = q.get()
+        if points is None:
+            q.task_done()
+            return
+        ok = safe_upsert(client, points)
+        with lock:
+            if ok:
+                stats["uploaded"] += len(points)
+            else:
+                stats["failed"] += len(points)
+                stats["failed_ids"].update(p.id for p in points)
+                print("[FATAL] Upsert failed after retries")
+        q.task_done()
+
+# =========================================================
+# LOAD CHUNKS
+# =========================================================
+def load_chunks():
+    all_chunks = []
+    for file in sorted(os.listdir(CHUNKS_DIR)):
+        if file.endswith("_chunks.json"):
+            book = file[: -len("_chunks.json")]
+            with open(os.path.join(CHUNKS_DIR, file), "r", encoding="utf-8") as f:
+                for chunk in json.load(f):
+                    chunk["book"] = book   # chunk files do not name their book
+                    all_chunks.append(chunk)
+    return all_chunks
+
+def point_id(text):
+    """Deterministic point id from chunk content + embedding version"""
+    return str(uuid.uuid5(POINT_NAMESPACE, f"{EMBED_VERSION}\x00{text}"))
+
+def payload_for(chunk):
+    # chunk_id is left out on purpose: it is a fresh uuid4 on every chunker
+    # run and would force a payload rewrite for unchanged text
+    return {
+        "content": chunk["text"],
+        "book": chunk.get("book"),
+        "book_id": chunk.get("book_id"),
+        "chapter_id": chunk.get("chapter_id"),
+        "section": chunk.get("section")
+    }
+
+def payload_hash(payload):
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def to_point(chunk, vector):
+    return PointStruct(
+        id=point_id(chunk["text"]),
+        vector=vector.tolist(),
+        payload=payload_for(chunk)
     )
 
-    if len(points) >= BATCH_SIZE:
-        if safe_upsert(points):
-            uploaded += len(points)
-            print(f"[INFO] Uploaded {uploaded}/{total}")
-            points = []
-            time.sleep(SLEEP_BETWEEN_BATCH)
-        else:
-            print("[FATAL] Failed after retries. Exiting safely.")
-            break
+# =========================================================
+# INDEXING PIPELINE
+# =========================================================
+def index_chunks(client, chunks, model=None, store=None):
+    """Encode in large length-sorted batches while uploads run concurrently.
+
+    Vectors already in the local store are uploaded without inference;
+    the model is only loaded if something actually needs encoding.
+    """
+    total = len(chunks)
+    stats = {"uploaded": 0, "failed": 0, "failed_ids": set(), "from_store": 0, "encoded": 0}
+    if not total:
+        return stats
+    lock = threading.Lock()
+    q = queue.Queue(maxsize=QUEUE_SIZE)
+    workers = [
+        threading.Thread(target=upsert_worker, args=(client, q, stats, lock), daemon=True)
+        for _ in range(UPSERT_THREADS)
+    ]
+    for w in workers:
+        w.start()
+
+    t0 = time.perf_counter()
+    if store is not None:
+        hashes = [chunk_hash(c["text"]) for c in chunks]
+        positions, vectors = store.lookup(hashes)
+        hit = [chunks[i] for i in positions]
+        for i in range(0, len(hit), UPSERT_BATCH):
+            q.put([to_point(c, v) for c, v in zip(hit[i:i + UPSERT_BATCH], vectors[i:i + UPSERT_BATCH])])
+        stats["from_store"] = len(hit)
+        found = set(positions)
+        chunks = [c for i, c in enumerate(chunks) if i not in found]
+        if hit:
+            print(f"[INFO] {len(hit)} vectors reused from local store")
+
+    # sort by length so each batch pads to a similar sequence length
+    chunks = sorted(chunks, key=lambda c: len(c["text"]))
+    texts = [c["text"] for c in chunks]
+    if texts and model is None:
+        model = load_model()
+
+    # process pool start-up costs seconds; small incremental runs skip it
+    use_pool = EMBED_WORKERS > 1 and len(texts) > ENCODE_BATCH
+    pool = model.start_multi_process_pool(["cpu"] * EMBED_WORKERS) if use_pool else None
+    t_enc = time.perf_counter()
+    encoded = 0
+    try:
+        for start, vectors in encode_batches(model, texts, pool):
+            batch_chunks = chunks[start:start + len(vectors)]
+            if store is not None:
+                store.add([chunk_hash(c["text"]) for c in batch_chunks], vectors)
+            batch = [to_point(c, v) for c, v in zip(batch_chunks, vectors)]
+            for i in range(0, len(batch), UPSERT_BATCH):
+                q.put(batch[i:i + UPSERT_BATCH])  # blocks when uploads fall behind
+
+            encoded += len(vectors)
+            rate = encoded / (time.perf_counter() - t_enc)
+            print(f"[INFO] Encoded {encoded}/{len(texts)} ({rate:.1f} chunks/s) | uploaded {stats['uploaded']}")
+    finally:
+        if pool:
+            model.stop_multi_process_pool(pool)
+        if store is not None:
+            store.flush()
+        for _ in workers:
+            q.put(None)
+        for w in workers:
+            w.join()
+    stats["encoded"] = encoded
+
+    elapsed = time.perf_counter() - t0
+    print(f"[INFO] Indexed {stats['uploaded']}/{total} in {elapsed:.1f}s "
+          f"({stats['uploaded'] / elapsed:.1f} chunks/s, {EMBED_WORKERS} encode workers)")
+    return stats
+
+# =========================================================
+# INCREMENTAL SYNC
+# =========================================================
+# The index manifest maps point id -> payload hash for everything already
+# in the collection. A run embeds only chunks whose id is new, rewrites
+# payloads that changed without touching vectors, and deletes points whose
+# chunk is gone. It also lists each book's point ids, so re-streaming one
+# book (pipeline.py --stream) can delete the points of its old chunks.
+def _read_index_manifest():
+    if not os.path.exists(INDEX_MANIFEST):
+        return None
+    with open(INDEX_MANIFEST, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_index_manifest():
+    data = _read_index_manifest()
+    return data.get("points", {}) if data is not None else None
+
+def load_book_points():
+    """book -> point ids at the last sync ({} for manifests written before this was recorded)"""
+    data = _read_index_manifest()
+    return data.get("books", {}) if data is not None else {}
+
+def save_index_manifest(points, books=None):
+    os.makedirs(INDEX_DIR, exist_ok=True)
+    tmp = INDEX_MANIFEST + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({
+            "collection": COLLECTION_NAME,
+            "embed_version": EMBED_VERSION,
+            "points": points,
+            "books": books or {}
+        }, f)
+    os.replace(tmp, INDEX_MANIFEST)
+
+def book_points(chunks, skip=()):
+    """book -> unique point ids of its chunks, in chunk order"""
+    books = {}
+    for chunk in chunks:
+        pid = point_id(chunk["text"])
+        if pid not in skip:
+            books.setdefault(chunk.get("book"), {})[pid] = None
+    return {book: list(ids) for book, ids in books.items()}
+
+def existing_from_collection(client, book=None):
+    """Point ids currently stored, optionally of one book (payload hash unknown -> None)"""
+    existing = {}
+    offset = None
+    scroll_filter = Filter(must=[FieldCondition(key="book", match=MatchValue(value=book))]) \
+        if book else None
+    while True:
+        points, offset = client.scroll(
+            collection_name=COLLECTION_NAME,
+            scroll_filter=scroll_filter,
+            limit=1000,
+            offset=offset,
+            with_payload=False,
+            with_vectors=False
+        )
+        for p in points:
+            existing[str(p.id)] = None
+        if offset is None:
+            return existing
+
+def existing_points(client, created=False, from_collection=False):
+    """What the collection already holds, as the sync baseline.
+
+    The local manifest is only trusted while it matches the collection: a
+    collection that was just created, or whose point count differs (a new
+    Qdrant instance, a deleted / recreated collection), is read from
+    Qdrant instead, so nothing is skipped as "unchanged" that is not there.
+    """
+    if created:
+        return {}
+    existing = None if from_collection else load_index_manifest()
+    if existing is not None:
+        count = client.count(collection_name=COLLECTION_NAME, exact=True).count
+        if count != len(existing):
+            print(f"[WARN] Index manifest lists {len(existing)} points, collection has {count}")
+            existing = None
+    if existing is None:
+        print("[INFO] Reading existing point ids from Qdrant...")
+        existing = existing_from_collection(client)
+    return existing
+
+def plan_sync(chunks, existing):
+    """-> (chunks to embed, {id: payload} to rewrite, ids to delete, wanted {id: hash})"""
+    wanted = {}
+    to_embed = []
+    payload_updates = {}
+
+    for chunk in chunks:
+        pid = point_id(chunk["text"])
+        if pid in wanted:
+            continue  # duplicate text, one point is enough
+        payload = payload_for(chunk)
+        wanted[pid] = payload_hash(payload)
+
+        if pid not in existing:
+            to_embed.append(chunk)
+        elif existing[pid] is not None and existing[pid] != wanted[pid]:
+            payload_updates[pid] = payload
+
+    to_delete = [pid for pid in existing if pid not in wanted]
+    return to_embed, payload_updates, to_delete, wanted
+
+def delete_points(client, ids):
+    ids = list(ids)
+    for i in range(0, len(ids), UPSERT_BATCH):
+        client.delete(
+            collection_name=COLLECTION_NAME,
+            points_selector=PointIdsList(points=ids[i:i + UPSERT_BATCH])
+        )
+
+def update_payloads(client, payloads):
+    """Overwrite the payload of existing points ({id: payload}); vectors untouched"""
+    updates = list(payloads.items())
+    for i in range(0, len(updates), UPSERT_BATCH):
+        client.batch_update_points(
+            collection_name=COLLECTION_NAME,
+            update_operations=[
+                OverwritePayloadOperation(overwrite_payload=SetPayload(payload=payload, points=[pid]))
+                for pid, payload in updates[i:i + UPSERT_BATCH]
+            ],
+            wait=True
+        )
+
+def sync_collection(client, chunks, existing, model=None, store=None):
+    to_embed, payload_updates, to_delete, wanted = plan_sync(chunks, existing)
+    print(f"[INFO] Sync plan: {len(to_embed)} new, {len(payload_updates)} payload updates, "
+          f"{len(to_delete)} deletes, {len(wanted) - len(to_embed) - len(payload_updates)} unchanged")
+
+    stats = index_chunks(client, to_embed, model=model, store=store)
+
+    update_payloads(client, payload_updates)
+    delete_points(client, to_delete)
+
+    # failed uploads stay out of the manifest so the next run retries them
+    for pid in stats["failed_ids"]:
+        wanted.pop(pid, None)
+    save_index_manifest(wanted, book_points(chunks, stats["failed_ids"]))
+
+    stats.update(payload_updates=len(payload_updates), deleted=len(to_delete),
+                 unchanged=len(wanted) - len(to_embed) - len(payload_updates))
+    return stats
+
+# =========================================================
+# MAIN
+# =========================================================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Index data/chunks into Qdrant")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="drop and recreate the collection, re-embed everything")
+    parser.add_argument("--from-collection", action="store_true",
+                        help="diff against the ids stored in Qdrant instead of the local manifest")
+    parser.add_argument("--no-store", action="store_true",
+                        help="do not read/write the local embedding store")
+    parser.add_argument("--compact-store", action="store_true",
+                        help="drop stored vectors of chunks that no longer exist")
+    args = parser.parse_args()
+
+    print(f"[INFO] Using chunks folder: {CHUNKS_DIR}")
+
+    client = get_client()
+    store = None if args.no_store else open_store()
+    if store is not None:
+        print(f"[INFO] Local embedding store: {len(store)} vectors ({store.dir})")
+
+    if args.rebuild:
+        reset_collection(client)
+        existing = {}
+    else:
+        created = ensure_collection(client)
+        existing = existing_points(client, created, args.from_collection)
+
+    all_chunks = load_chunks()
+    print(f"[INFO] Total chunks loaded: {len(all_chunks)}")
 
-# remaining points
-if points:
-    safe_upsert(points)
-    uploaded += len(points)
+    stats = sync_collection(client, all_chunks, existing, store=store)
+    print(f"[SUCCESS] Uploaded {stats['uploaded']} new vectors "
+          f"({stats['from_store']} from store, {stats['encoded']} encoded), "
+          f"{stats['unchanged']} unchanged, {stats['deleted']} deleted 🚀")
 
-print(f"[SUCCESS] Uploaded {uploaded}/{total} vectors 🚀")
+    if store is not None and args.compact_store:
+        removed = store.compact(chunk_hash(c["text"]) for c in all_chunks)
+        print(f"[INFO] Store compacted: {removed} stale vectors removed")
+    if stats["failed"]:
+        sys.exit(1)